@@ -0,0 +1,153 @@
+# ***************************************
+# ERA5 monthly climatology engine
+# 변수별 ncanalysis_<var>.py 를 하나로 합친 월별 30년 평균 계산
+# 일자료 전체를 한 번만 열고 groupby('<time>.month') 한 번으로 12개월 평균 계산
+# 기존 스크립트와 같이 기본은 패턴에 맞는 모든 연도 사용 (--start-year/--end-year로 기간 제한 ex) 1991 2020)
+# 결과는 기존과 동일하게 월별 {output}_{MM}_mean.nc 로 저장
+# ex) python ncanalysis_climatology.py tp t2m --data-dir /ERA5/daily --output-dir /ERA5/mean
+#     python ncanalysis_climatology.py --pattern "olr_*.nc" --output olr
+# ***************************************
+
+import os
+import re
+import sys
+import glob
+import time
+import argparse
+
+import xarray as xr
+
+# 변수별 입력 파일 패턴과 결과 파일 이름 (기존 ncanalysis_<var>.py 와 동일)
+VARIABLES = {
+    "tp": {"pattern": "tp_*.nc", "output": "tp"},
+    "t2m": {"pattern": "t2m_*.nc", "output": "t2m"},
+    "sst": {"pattern": "sst_*.nc", "output": "sst"},
+    "mslp": {"pattern": "MSLP_*.nc", "output": "MSLP"},
+    "sh": {"pattern": "specific_humidity_stream-oper_daily-mean_*.nc",
+           "output": "specific_humidity_stream-oper_daily-mean_850"},
+    "geopotential": {"pattern": "derived-era5-pressure-levels-daily-statistics_500_*.nc",
+                     "output": "derived-era5-pressure-levels-daily_500"},
+    "u": {"pattern": "u_component_of_wind_0_daily-mean_*.nc", "output": "u_component_of_wind_0_daily-mean_850"},
+    "v": {"pattern": "v_component_of_wind_0_daily-mean_*.nc", "output": "v_component_of_wind_0_daily-mean_850"},
+}
+
+TIME_DIMS = ["time", "valid_time"] # ERA5 단일 층은 time, 기압면/일통계는 valid_time
+
+# 파일 이름 끝의 연월 ex) tp_199101.nc, ..._1991_01.nc
+FILE_YEAR_MONTH = re.compile(r"(\d{4})_?(\d{2})\.nc$")
+
+def list_archive_files(pattern, data_dir=".", start_year=None, end_year=None):
+    """
+    패턴에 맞는 일자료 파일 목록 (결과 파일 *_mean.nc 제외)
+    start_year/end_year를 지정하면 해당 연도 파일만 (None이면 제한 없음), 연월을 알 수 없는 파일 이름은 거르지 않음
+    """
+    files = []
+    for path in sorted(glob.glob(os.path.join(data_dir, pattern))):
+        if path.endswith("_mean.nc"):
+            continue
+        match = FILE_YEAR_MONTH.search(os.path.basename(path))
+        if match and ((start_year is not None and int(match.group(1)) < start_year)
+                      or (end_year is not None and int(match.group(1)) > end_year)):
+            continue
+        files.append(path)
+    return files
+
+def detect_time_dim(ds):
+    """
+    시간 차원 이름 (time / valid_time, 없으면 datetime 형식 차원)
+    """
+    for name in TIME_DIMS:
+        if name in ds.dims:
+            return name
+    for name in ds.dims:
+        if name in ds.coords and ds[name].dtype.kind == "M":
+            return name
+    raise ValueError(f"시간 차원을 찾을 수 없습니다: {list(ds.dims)}")
+
+def open_archive(files):
+    """
+    전체 파일을 한 번에 열기
+    파일별 한 덩어리(chunks={})로 읽고, 시간이 없는 변수는 첫 파일 것을 사용 (compat="override")
+    격자 좌표(위경도 등)는 파일마다 같아야 함 (join="exact", 다르면 오류)
+    """
+    return xr.open_mfdataset(files, combine="by_coords", chunks={}, data_vars="minimal", coords="minimal",
+                             compat="override", join="exact", parallel=True)
+
+def monthly_climatology(ds, time_dim=None):
+    """
+    월별 전체 기간 평균 (month 차원 1~12), 시간 축은 한 번만 읽음
+    """
+    time_dim = time_dim or detect_time_dim(ds)
+    return ds.groupby(f"{time_dim}.month").mean(dim=time_dim)
+
+def write_monthly_means(climatology, output, output_dir="."):
+    """
+    월별 {output}_{MM}_mean.nc 저장 (기존 ncanalysis_<var>.py 결과와 같은 구조), 반환값: 저장 경로 목록
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for month in climatology["month"].values:
+        path = os.path.join(output_dir, f"{output}_{int(month):02d}_mean.nc")
+        climatology.sel(month=month, drop=True).to_netcdf(path=path)
+        paths.append(path)
+    return paths
+
+def build_climatology(pattern, output, data_dir=".", output_dir=".", start_year=None, end_year=None):
+    """
+    한 변수의 월별 평균 계산 및 저장, 반환값: 저장 경로 목록
+    """
+    files = list_archive_files(pattern, data_dir, start_year, end_year)
+    if not files:
+        raise FileNotFoundError(f"입력 파일이 없습니다: {os.path.join(data_dir, pattern)}")
+
+    start = time.perf_counter()
+    ds = open_archive(files)
+    time_dim = detect_time_dim(ds)
+    print(f"--- 📂 Dataset 로드 완료: 파일 {len(files)}개 ({time.perf_counter() - start:.1f}초) ---")
+    print(ds)
+    print(f"Time 범위: {ds[time_dim].values[0]} 부터 {ds[time_dim].values[-1]} 까지")
+
+    print("\n--- 월별 전체 기간 평균 계산 중 ---")
+    # 12개월을 한 번에 계산 (월마다 전체 자료를 다시 읽지 않음)
+    climatology = monthly_climatology(ds, time_dim).compute()
+    paths = write_monthly_means(climatology, output, output_dir)
+    ds.close()
+    print(f"--- 저장 완료: {output}_MM_mean.nc {len(paths)}개 ({time.perf_counter() - start:.1f}초) ---")
+    return paths
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="ERA5 일자료 월별 전체 기간 평균 (단일 읽기)")
+    parser.add_argument("variables", nargs="*", default=[],
+                        help=f"변수 목록 ({', '.join(VARIABLES)})")
+    parser.add_argument("--pattern", default=None, help="등록되지 않은 변수의 입력 파일 패턴 ex) 'olr_*.nc'")
+    parser.add_argument("--output", default=None, help="--pattern 결과 파일 이름 앞부분 ex) olr")
+    parser.add_argument("--data-dir", default=".", help="입력 파일 폴더 (기본: 현재 폴더)")
+    parser.add_argument("--output-dir", default=".", help="결과 파일 폴더 (기본: 현재 폴더)")
+    parser.add_argument("--start-year", type=int, default=None, help="시작 연도 ex) 1991 (기본: 제한 없음)")
+    parser.add_argument("--end-year", type=int, default=None, help="종료 연도 ex) 2020 (기본: 제한 없음)")
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.variables if name not in VARIABLES]
+    if unknown:
+        parser.error(f"등록되지 않은 변수 {unknown}, --pattern 을 사용하세요")
+    jobs = [(VARIABLES[name]["pattern"], VARIABLES[name]["output"]) for name in args.variables]
+    if args.pattern:
+        jobs.append((args.pattern, args.output or args.pattern.split("_")[0].split("*")[0]))
+    if not jobs:
+        parser.error("변수 또는 --pattern 을 지정해야 합니다")
+
+    fail_count = 0
+    for pattern, output in jobs:
+        print(pattern)
+        try:
+            build_climatology(pattern, output, args.data_dir, args.output_dir, args.start_year, args.end_year)
+        except Exception as e:
+            fail_count += 1
+            print(f"데이터를 처리하는 중 오류가 발생했습니다: {e}")
+    return 1 if fail_count else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
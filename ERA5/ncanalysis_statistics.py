@@ -0,0 +1,305 @@
+# ***************************************
+# ERA5 monthly statistics (streaming)
+# 일자료 파일을 한 번만 순서대로 읽으며 월별/격자별 평균, 합계, 분산(Welford), 최솟값, 최댓값, 근사 백분위수(P²) 계산
+# 누적값만 메모리에 유지하므로 사용 메모리는 기간(파일 수)과 무관: 12개월 x 격자 수 x (6 + 백분위수 수 x 10)
+# 결과는 변수별 {output}_monthly_stats.nc 하나로 저장 ({var}_mean, {var}_sum, {var}_std, ... month 차원 1~12)
+# ex) python ncanalysis_statistics.py tp t2m --data-dir /ERA5/daily --percentiles 5 50 95 99
+# ***************************************
+
+import os
+import sys
+import time
+import warnings
+import argparse
+
+import numpy as np
+import xarray as xr
+
+import ncanalysis_climatology
+from ncanalysis_climatology import VARIABLES
+
+PERCENTILES = [5, 50, 95]
+STATS = ["count", "mean", "sum", "sum_per_year", "var", "std", "min", "max"]
+
+class P2Quantiles:
+    """
+    격자별 근사 백분위수 (P² 알고리즘, Jain & Chlamtac 1985), 값을 저장하지 않고 백분위수마다 표시값 5개만 유지
+    cells: 격자 수, 관측 4개 이하인 격자는 저장된 값으로 정확히 계산
+    """
+    def __init__(self, cells, percentiles):
+        self.percentiles = list(percentiles)
+        p = np.asarray(self.percentiles, dtype=float)[:, None, None] / 100
+        # 표시값별 목표 위치 증가량 (0, p/2, p, (1+p)/2, 1), 목표 위치 = 1 + (n-1) * 증가량
+        self.step = np.concatenate([np.zeros_like(p), p / 2, p, (1 + p) / 2, np.ones_like(p)], axis=1)
+        self.height = np.full((len(self.percentiles), 5, cells), np.nan)
+        self.position = np.zeros((len(self.percentiles), 5, cells), dtype=np.int64)
+        self.count = np.zeros(cells, dtype=np.int64)
+
+    def update(self, x):
+        """
+        격자별 관측 한 개씩 반영 (x: 격자 수 길이 1차원, NaN은 건너뜀)
+        """
+        valid = ~np.isnan(x)
+        # 처음 5개는 그대로 저장 후 정렬
+        init = valid & (self.count < 5)
+        if init.any():
+            cells = np.nonzero(init)[0]
+            self.height[:, self.count[cells], cells] = x[cells]
+            self.count[cells] += 1
+            ready = cells[self.count[cells] == 5]
+            self.height[:, :, ready] = np.sort(self.height[:, :, ready], axis=1)
+            self.position[:, :, ready] = np.arange(1, 6)[:, None]
+            valid &= ~init
+        if not valid.any():
+            return
+
+        cells = slice(None) if valid.all() else np.nonzero(valid)[0]
+        x = x[cells]
+        q = self.height[:, :, cells]
+        n = self.position[:, :, cells]
+        count = self.count[cells] + 1
+
+        # 양 끝 표시값 갱신, x보다 큰 표시값들의 위치 +1
+        q[:, 0] = np.minimum(q[:, 0], x)
+        q[:, 4] = np.maximum(q[:, 4], x)
+        n[:, 1:4] += x < q[:, 1:4]
+        n[:, 4] += 1
+        desired = 1 + (count - 1) * self.step
+
+        # 가운데 표시값을 목표 위치 쪽으로 한 칸씩 이동 (포물선 보간, 순서가 어긋나면 선형 보간)
+        for i in (1, 2, 3):
+            d = desired[:, i] - n[:, i]
+            up = (d >= 1) & (n[:, i + 1] - n[:, i] > 1)
+            down = (d <= -1) & (n[:, i - 1] - n[:, i] < -1)
+            move = up | down
+            if not move.any():
+                continue
+            s = np.where(up, 1, -1)
+            parabolic = q[:, i] + s / (n[:, i + 1] - n[:, i - 1]) * (
+                (n[:, i] - n[:, i - 1] + s) * (q[:, i + 1] - q[:, i]) / (n[:, i + 1] - n[:, i])
+                + (n[:, i + 1] - n[:, i] - s) * (q[:, i] - q[:, i - 1]) / (n[:, i] - n[:, i - 1]))
+            q_next = np.where(up, q[:, i + 1], q[:, i - 1])
+            n_next = np.where(up, n[:, i + 1], n[:, i - 1])
+            linear = q[:, i] + s * (q_next - q[:, i]) / (n_next - n[:, i])
+            ordered = (q[:, i - 1] < parabolic) & (parabolic < q[:, i + 1])
+            q[:, i] = np.where(move, np.where(ordered, parabolic, linear), q[:, i])
+            n[:, i] += np.where(move, s, 0)
+
+        self.height[:, :, cells] = q
+        self.position[:, :, cells] = n
+        self.count[cells] = count
+
+    def result(self):
+        """
+        백분위수별 격자 값 (백분위수 수 x 격자 수), 관측이 없는 격자는 NaN
+        """
+        out = self.height[:, 2].copy()
+        few = np.nonzero(self.count < 5)[0]
+        if len(few):
+            # 관측이 없는 격자는 NaN (All-NaN 경고 생략)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                out[:, few] = np.nanpercentile(self.height[0][:, few], self.percentiles, axis=0)
+        return out
+
+class MonthlyAccumulator:
+    """
+    한 변수, 한 달의 격자별 누적 통계
+    파일 단위 블록의 평균/편차제곱합을 Welford 방식(Chan 병렬 결합)으로 누적하여 한 번 읽기로 분산 계산
+    """
+    def __init__(self, shape, percentiles):
+        cells = int(np.prod(shape))
+        self.shape = tuple(shape)
+        self.count = np.zeros(cells, dtype=np.int64)
+        self.mean = np.zeros(cells)
+        self.m2 = np.zeros(cells)
+        self.sum = np.zeros(cells)
+        self.min = np.full(cells, np.nan)
+        self.max = np.full(cells, np.nan)
+        self.years = set()
+        self.quantiles = P2Quantiles(cells, percentiles) if percentiles else None
+
+    def update(self, block, years=()):
+        """
+        block: (시간, 격자...) 배열, NaN은 결측으로 제외
+        """
+        block = np.asarray(block, dtype=float).reshape(len(block), -1)
+        self.years.update(years)
+        valid = ~np.isnan(block)
+        n_b = valid.sum(axis=0)
+        sum_b = np.where(valid, block, 0).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_b = np.where(n_b > 0, sum_b / n_b, 0)
+            m2_b = np.where(valid, (block - mean_b) ** 2, 0).sum(axis=0)
+        self.combine(n_b, mean_b, m2_b, sum_b, np.fmin.reduce(block, axis=0), np.fmax.reduce(block, axis=0))
+        if self.quantiles is not None:
+            for row in block:
+                self.quantiles.update(row)
+
+    def combine(self, n_b, mean_b, m2_b, sum_b, min_b, max_b):
+        """
+        다른 자료 묶음의 격자별 개수/평균/편차제곱합/합계/최솟값/최댓값을 Chan 방식으로 결합
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            n = self.count + n_b
+            delta = mean_b - self.mean
+            self.mean = np.where(n > 0, self.mean + delta * n_b / n, 0)
+            self.m2 = np.where(n > 0, self.m2 + m2_b + delta ** 2 * self.count * n_b / n, 0)
+        self.count = n
+        self.sum = self.sum + sum_b
+        self.min = np.fmin(self.min, min_b)
+        self.max = np.fmax(self.max, max_b)
+
+    def merge(self, other):
+        """
+        같은 격자의 다른 누적값(ex. 다른 파일 묶음을 따로 누적한 결과) 결합
+        P² 백분위수 표시값은 결합할 수 없으므로 백분위수 없이 만든 누적값만 가능
+        """
+        if self.quantiles is not None or other.quantiles is not None:
+            raise ValueError("백분위수(P²) 누적값은 결합할 수 없습니다")
+        if other.shape != self.shape:
+            raise ValueError(f"격자 크기가 다릅니다 {other.shape} != {self.shape}")
+        self.years.update(other.years)
+        self.combine(other.count, other.mean, other.m2, other.sum, other.min, other.max)
+
+    def result(self):
+        """
+        통계별 격자 배열 dict (분산은 표본 분산, ddof=1)
+        """
+        empty = self.count == 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            var = np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+        stats = {
+            "count": self.count,
+            "mean": np.where(empty, np.nan, self.mean),
+            "sum": np.where(empty, np.nan, self.sum),
+            "sum_per_year": np.where(empty, np.nan, self.sum / max(len(self.years), 1)),
+            "var": var,
+            "std": np.sqrt(var),
+            "min": self.min,
+            "max": self.max,
+        }
+        stats = {k: v.reshape(self.shape) for k, v in stats.items()}
+        if self.quantiles is not None:
+            stats["percentile"] = self.quantiles.result().reshape((-1,) + self.shape)
+        return stats
+
+def time_variables(ds, time_dim):
+    """
+    시간 차원이 있는 숫자형 변수 목록
+    """
+    return [name for name, da in ds.data_vars.items() if time_dim in da.dims and da.dtype.kind in "iuf"]
+
+def accumulate_file(path, accumulators, templates, percentiles):
+    """
+    파일 하나를 읽어 월별 누적값에 반영 (변수별로 한 번에 한 블록만 메모리에 올림)
+    """
+    with xr.open_dataset(path) as ds:
+        time_dim = ncanalysis_climatology.detect_time_dim(ds)
+        months = ds[time_dim].dt.month.values
+        years = ds[time_dim].dt.year.values
+        for name in time_variables(ds, time_dim):
+            da = ds[name].transpose(time_dim, ...)
+            if name not in templates:
+                templates[name] = da.isel({time_dim: 0}, drop=True)
+            elif templates[name].shape != da.shape[1:]:
+                raise ValueError(f"{path}: {name} 격자 크기가 다릅니다 {da.shape[1:]} != {templates[name].shape}")
+            values = da.values
+            for month in np.unique(months):
+                rows = months == month
+                key = (name, int(month))
+                if key not in accumulators:
+                    accumulators[key] = MonthlyAccumulator(templates[name].shape, percentiles)
+                accumulators[key].update(values[rows], years[rows])
+    return len(months)
+
+def build_statistics_dataset(accumulators, templates, percentiles):
+    """
+    누적값을 하나의 통계 Dataset으로 변환 ({var}_{stat}, month 차원, 백분위수는 percentile 차원 추가)
+    """
+    data_vars = {}
+    for name, template in templates.items():
+        months = sorted(m for n, m in accumulators if n == name)
+        results = [accumulators[(name, m)].result() for m in months]
+        units = template.attrs.get("units")
+        for stat in STATS + (["percentile"] if percentiles else []):
+            dims = ("month",) + (("percentile",) if stat == "percentile" else ()) + template.dims
+            attrs = {"long_name": f"{template.attrs.get('long_name', name)} ({stat})"}
+            if units and stat not in ("count", "var"):
+                attrs["units"] = units
+            data_vars[f"{name}_{stat}"] = (dims, np.stack([r[stat] for r in results]), attrs)
+        data_vars[f"{name}_year_count"] = (("month",), np.array([len(accumulators[(name, m)].years) for m in months]))
+
+    coords = {"month": sorted({m for _, m in accumulators})}
+    if percentiles:
+        coords["percentile"] = percentiles
+    for template in templates.values():
+        coords.update({k: v for k, v in template.coords.items() if k not in coords})
+    ds = xr.Dataset(data_vars, coords=coords)
+    ds.attrs["note"] = "var/std: 표본 분산(ddof=1), percentile: P² 근사값(관측 4개 이하 격자는 정확값)"
+    return ds
+
+def build_statistics(pattern, output, data_dir=".", output_dir=".", start_year=None, end_year=None,
+                     percentiles=PERCENTILES):
+    """
+    한 변수의 월별 통계 계산 및 저장, 반환값: 저장 경로
+    """
+    files = ncanalysis_climatology.list_archive_files(pattern, data_dir, start_year, end_year)
+    if not files:
+        raise FileNotFoundError(f"입력 파일이 없습니다: {os.path.join(data_dir, pattern)}")
+
+    start = time.perf_counter()
+    accumulators, templates = {}, {}
+    steps = 0
+    for i, path in enumerate(files, 1):
+        steps += accumulate_file(path, accumulators, templates, percentiles)
+        if i % 12 == 0 or i == len(files):
+            print(f"[{i}/{len(files)}] {os.path.basename(path)} 누적 {steps}개 시간 ({time.perf_counter() - start:.1f}초)")
+
+    ds = build_statistics_dataset(accumulators, templates, percentiles)
+    os.makedirs(output_dir, exist_ok=True)
+    out_path = os.path.join(output_dir, f"{output}_monthly_stats.nc")
+    ds.to_netcdf(path=out_path)
+    print(f"--- 저장 완료: {out_path} ({time.perf_counter() - start:.1f}초) ---")
+    return out_path
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="ERA5 일자료 월별 통계 (평균, 합계, 분산, 최솟값, 최댓값, 백분위수) 한 번 읽기")
+    parser.add_argument("variables", nargs="*", default=[], help=f"변수 목록 ({', '.join(VARIABLES)})")
+    parser.add_argument("--pattern", default=None, help="등록되지 않은 변수의 입력 파일 패턴 ex) 'olr_*.nc'")
+    parser.add_argument("--output", default=None, help="--pattern 결과 파일 이름 앞부분 ex) olr")
+    parser.add_argument("--data-dir", default=".", help="입력 파일 폴더 (기본: 현재 폴더)")
+    parser.add_argument("--output-dir", default=".", help="결과 파일 폴더 (기본: 현재 폴더)")
+    parser.add_argument("--start-year", type=int, default=None, help="시작 연도 ex) 1991 (기본: 제한 없음)")
+    parser.add_argument("--end-year", type=int, default=None, help="종료 연도 ex) 2020 (기본: 제한 없음)")
+    parser.add_argument("--percentiles", nargs="*", type=float, default=PERCENTILES,
+                        help=f"근사 백분위수 (기본: {' '.join(map(str, PERCENTILES))}, 빈 값이면 계산 안 함)")
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.variables if name not in VARIABLES]
+    if unknown:
+        parser.error(f"등록되지 않은 변수 {unknown}, --pattern 을 사용하세요")
+    if any(not 0 <= p <= 100 for p in args.percentiles):
+        parser.error("백분위수는 0~100 사이여야 합니다")
+    jobs = [(VARIABLES[name]["pattern"], VARIABLES[name]["output"]) for name in args.variables]
+    if args.pattern:
+        jobs.append((args.pattern, args.output or args.pattern.split("_")[0].split("*")[0]))
+    if not jobs:
+        parser.error("변수 또는 --pattern 을 지정해야 합니다")
+
+    fail_count = 0
+    for pattern, output in jobs:
+        print(pattern)
+        try:
+            build_statistics(pattern, output, args.data_dir, args.output_dir, args.start_year, args.end_year,
+                             args.percentiles)
+        except Exception as e:
+            fail_count += 1
+            print(f"데이터를 처리하는 중 오류가 발생했습니다: {e}")
+    return 1 if fail_count else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
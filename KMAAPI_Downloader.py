@@ -1,130 +1,798 @@
-import requests
-import re
-from urllib.parse import urlparse, parse_qs
-import time
-import sys
-import os # <-- 경로 설정을 위해 os 모듈 추가
-
-# --- 설정 변수 ---
-# 다운로드할 자료의 기준 날짜 (YYYYMMDDHH, 예: 2024년 6월 10일 12시)
-DATA_DATE = '2024061012' 
-# 개인 인증키를 입력
-AUTH_KEY = '인증키' 
-
-# GRIB2 파일 다운로드의 기본 URL (파일 이름과 인증키는 변수로 대체됨)
-BASE_URL_FORMAT = 'https://apihub-pub.kma.go.kr/api/typ06/url/nwp_file_down.php?file={filename}&authKey={authKey}'
-# 파일 이름의 고정된 접두사 (r030_v040_ne36_pres_은 예시이며, 필요한 자료에 맞게 수정 가능)
-FILE_PREFIX = 'r030_v040_ne36_pres'
-# 다운로드할 예측 시간 범위 (h000 ~ h072, 73개 파일)
-HF_START = 0
-HF_END = 54
-
-# **[수정 사항 2] 파일 저장 경로 설정:**
-# Windows NAS 경로를 안전하게 사용하기 위해 raw string (r"...") 사용
-# 참고: 이 경로는 스크립트가 실행되는 환경에서 접근 가능해야 함
-SAVE_DIR = r"fakepath\수치모델\RDAPS-KIM\202506"
-# -----------------
-
-def download_file(file_url, grib_filename, default_filename='downloaded_data'):
-    """
-    API URL에서 파일을 다운로드하고, 파일 헤더 또는 인자에서 파일명을 추출하여 저장
-    다운로드 진행 상황을 콘솔에 5% 단위로 실시간 표시
-    """
-    
-    # URL에 이미 파일명이 포함되어 있으므로, 이를 기본 저장 경로로 사용
-    # 최종 저장 경로: 설정된 디렉토리 + 파일명
-    save_path = os.path.join(SAVE_DIR, grib_filename)
-    
-    # 저장 디렉토리가 없으면 생성
-    os.makedirs(SAVE_DIR, exist_ok=True)
-    
-    try:
-        response = requests.get(file_url, stream=True, timeout=30)
-    except requests.exceptions.RequestException as e:
-        print(f"  [오류] 요청 중 예외 발생: {e}")
-        return False
-        
-    # HTTP 상태 코드 확인
-    if response.status_code == 200:
-        # 1. 파일 크기 확인 (Content-Length 헤더)
-        total_size_str = response.headers.get('Content-Length')
-        total_size = int(total_size_str) if total_size_str else 0
-        downloaded_size = 0
-        
-        # 2. Content-Disposition 헤더에서 파일 이름 확인 (안정성 확보)
-        try:
-            if 'Content-Disposition' in response.headers:
-                # ... (파일 이름 추출 로직은 그대로 유지)
-                disposition = response.headers['Content-Disposition']
-                fname_match = re.search(r'filename\*?=(?:UTF-8\'\')?"?(.+?)"?$', disposition, re.I)
-                if fname_match:
-                    header_filename = fname_match.group(1).strip().strip('"')
-                    # 헤더 파일명을 사용하더라도 최종 경로는 SAVE_DIR 내에 저장
-                    save_path = os.path.join(SAVE_DIR, header_filename) 
-        except Exception:
-             pass
-        
-        print(f"  [성공] 파일을 '{save_path}'로 저장합니다.")
-
-        # 파일 저장
-        last_percent = -1 # <-- 5% 단위 표시를 위한 변수
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192): 
-                if chunk:
-                    f.write(chunk)
-                    downloaded_size += len(chunk)
-                    
-                    # 3. 다운로드 진행 상황 표시 (Progress Bar 효과)
-                    if total_size > 0:
-                        percent = int((downloaded_size / total_size) * 100)
-                        
-                        # **[수정 사항 1] 5% 단위로만 진행률 표시**
-                        if percent >= last_percent + 5 or percent == 100:
-                            sys.stdout.write(f"\r  [진행] {downloaded_size:,} bytes / {total_size:,} bytes ({percent}%)")
-                            sys.stdout.flush()
-                            last_percent = percent
-                    else:
-                        sys.stdout.write(f"\r  [진행] {downloaded_size:,} bytes 다운로드 중...")
-                        sys.stdout.flush()
-
-        # 줄바꿈 및 완료 메시지 출력
-        sys.stdout.write('\n')
-        print("  [완료] 다운로드 완료.")
-        return True
-    else:
-        print(f"  [실패] HTTP 상태 코드: {response.status_code}")
-        try:
-            print(f"  [응답] {response.text.strip()[:150]}...")
-        except:
-            print("  [응답] 서버에서 텍스트 응답을 가져올 수 없습니다.")
-        return False
-
-# --- 메인 다운로드 루프 실행 ---
-if __name__ == "__main__":
-    print(f"--- KIM 모델 GRIB2 파일 다운로드 시작 ---")
-    print(f"기준 날짜: {DATA_DATE}")
-    print(f"예측 시간: h{HF_START:03d} 부터 h{HF_END:03d} 까지 (총 {HF_END - HF_START + 1}개)")
-    print(f"저장 경로: {SAVE_DIR}")
-    print("-" * 40)
-    
-    success_count = 0
-    fail_count = 0
-    
-    for hf in range(HF_START, HF_END + 1):
-        hf_str = f'h{hf:03d}' 
-        grib_filename = f'{FILE_PREFIX}_{hf_str}.{DATA_DATE}.gb2'
-        file_url = BASE_URL_FORMAT.format(filename=grib_filename, authKey=AUTH_KEY)
-        
-        print(f"[{hf_str} 파일 다운로드 시도] 파일명: {grib_filename}")
-        
-        if download_file(file_url, grib_filename):
-            success_count += 1
-        else:
-            fail_count += 1
-
-        time.sleep(0.5) 
-        print("-" * 40)
-
-    print(f"--- 다운로드 종료 ---")
-    print(f"총 시도: {HF_END - HF_START + 1}개")
-    print(f"성공: {success_count}개, 실패: {fail_count}개")
+import requests
+import re
+from urllib.parse import urlparse, parse_qs
+import time
+import sys
+import os # <-- 경로 설정을 위해 os 모듈 추가
+import json
+import argparse
+import queue
+import shlex
+import shutil
+import threading
+import subprocess
+import multiprocessing
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from requests.adapters import HTTPAdapter
+
+# --- 설정 변수 ---
+# 다운로드할 자료의 기준 날짜 (YYYYMMDDHH, 예: 2024년 6월 10일 12시)
+DATA_DATE = '2024061012' 
+# 개인 인증키를 입력
+AUTH_KEY = '인증키' 
+
+# GRIB2 파일 다운로드의 기본 URL (파일 이름과 인증키는 변수로 대체됨)
+BASE_URL_FORMAT = 'https://apihub-pub.kma.go.kr/api/typ06/url/nwp_file_down.php?file={filename}&authKey={authKey}'
+# 파일 이름의 고정된 접두사 (r030_v040_ne36_pres_은 예시이며, 필요한 자료에 맞게 수정 가능)
+FILE_PREFIX = 'r030_v040_ne36_pres'
+# 다운로드할 예측 시간 범위 (h000 ~ h072, 73개 파일)
+HF_START = 0
+HF_END = 54
+
+# **[수정 사항 2] 파일 저장 경로 설정:**
+# Windows NAS 경로를 안전하게 사용하기 위해 raw string (r"...") 사용
+# 참고: 이 경로는 스크립트가 실행되는 환경에서 접근 가능해야 함
+SAVE_DIR = r"fakepath\수치모델\RDAPS-KIM\202506"
+
+# 동시 다운로드 설정 (--workers 2 이상일 때 사용)
+# 요청 간격은 순차/동시 모두 토큰 버킷으로 제한: 초당 RATE_LIMIT개, 최대 RATE_BURST개까지 연속 요청 허용
+# 기본값은 기존 순차 다운로드의 0.5초 간격과 같은 초당 2개
+MAX_WORKERS = 1
+RATE_LIMIT = 2.0
+RATE_BURST = 2
+# 동시 다운로드 시 파일별 진행률 표시 단위(%), 여러 파일 출력이 섞이지 않도록 줄 단위로 표시
+CONCURRENT_PROGRESS_STEP = 25
+
+# 다운로드 확인 설정
+# 받는 중인 파일은 '.part'로 저장하고 크기 확인 후 이름 변경, CHECK_GRIB이면 GRIB 끝 표시("7777")도 확인
+CHECK_GRIB = False
+DOWNLOAD_CHUNK_SIZE = 64 * 1024 # 연결이 끊기면 받던 조각은 버려지므로 너무 크지 않게
+
+# GRIB2 부분 저장 설정 (--subset, xarray + cfgrib 필요)
+# 받은 파일에서 CALMET 준비에 쓰는 변수/등압면만 읽고 한반도 범위로 잘라 기준 시각별 압축 파일 하나로 저장
+SUBSET_VARS = ['u', 'v', 't', 'r', 'gh'] # GRIB shortName
+SUBSET_LEVELS = [1000, 925, 850, 700, 500] # hPa
+SUBSET_BBOX = (32.0, 40.0, 123.0, 132.0) # 위도 최소, 위도 최대, 경도 최소, 경도 최대
+SUBSET_LEVEL_TYPE = 'isobaricInhPa'
+SUBSET_FORMAT = 'netcdf' # 'netcdf' 또는 'zarr'
+SUBSET_WORKERS = 2
+
+# 예측 시간별 처리 파이프라인 설정 (--subset, --hook-cmd)
+# 받은 파일은 대기열을 거쳐 처리 함수(hook)로 바로 넘어가고, 대기열이 가득 차면 다운로드가 기다림
+PIPELINE_DEPTH = 4
+# -----------------
+
+class TokenBucket:
+    """
+    초당 rate개씩 토큰을 채우고(최대 burst개) 요청마다 토큰 1개를 사용하는 요청 속도 제한
+    여러 다운로드 스레드가 공유
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def make_session(pool_size):
+    """
+    다운로드 스레드가 공유하는 연결 풀 세션 (스레드 수만큼 연결 유지)
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def grib_complete(path):
+    """
+    GRIB 파일 시작("GRIB")과 끝 표시("7777") 확인 (오류 응답 본문이나 잘린 파일 검출)
+    """
+    try:
+        with open(path, 'rb') as f:
+            start = f.read(4)
+            f.seek(0, os.SEEK_END)
+            if f.tell() < 8:
+                return False
+            f.seek(-4, os.SEEK_END)
+            return start == b'GRIB' and f.read(4) == b'7777'
+    except OSError:
+        return False
+
+def already_downloaded(save_path, check_grib=CHECK_GRIB):
+    """
+    최종 파일은 확인을 마친 뒤에만 생성되므로 있으면 완료된 파일 (check_grib이면 GRIB 표시도 확인)
+    """
+    return os.path.exists(save_path) and (not check_grib or grib_complete(save_path))
+
+def load_part_info(part_path):
+    """
+    받다가 중단된 '.part'의 서버 파일 정보 {"validator": ETag 또는 Last-Modified, "size": 전체 크기}, 없으면 {}
+    """
+    try:
+        with open(f"{part_path}.json", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_part_info(part_path, response, size):
+    """
+    '.part'를 쓰기 시작할 때 서버 파일 정보 저장 (이어 받기 요청의 If-Range와 크기 확인에 사용)
+    약한 ETag(W/)는 If-Range에 쓸 수 없으므로 Last-Modified 사용
+    """
+    etag = response.headers.get('ETag')
+    validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+    with open(f"{part_path}.json", "w", encoding="utf-8") as f:
+        json.dump({"validator": validator, "size": size or None}, f)
+
+def discard_part(part_path):
+    """
+    이어 받을 수 없는 '.part'와 서버 파일 정보 삭제
+    """
+    for path in (part_path, f"{part_path}.json"):
+        if os.path.exists(path):
+            os.remove(path)
+
+def download_file(file_url, grib_filename, default_filename='downloaded_data', session=None, label=None,
+                  save_dir=None, limiter=None, check_grib=CHECK_GRIB):
+    """
+    API URL에서 파일을 다운로드하고, 파일 헤더 또는 인자에서 파일명을 추출하여 저장
+    다운로드 진행 상황을 콘솔에 5% 단위로 실시간 표시
+    session: 공유 연결 풀 세션 (없으면 요청마다 새 연결)
+    label: 동시 다운로드 시 출력 앞에 붙일 파일 구분(ex. h003), 진행률은 CONCURRENT_PROGRESS_STEP% 단위 줄 출력
+    limiter: 요청 속도 제한(TokenBucket), 요청 직전에 토큰 사용
+    check_grib: True면 GRIB 끝 표시("7777")까지 확인 후 저장
+    받는 중에는 '{파일명}.part'에 쓰고 크기(Content-Length) 확인 후 최종 파일명으로 변경
+    '.part'가 남아 있으면 Range 요청으로 이어 받음, 최종 파일이 이미 있으면 건너뜀
+    이어 받을 때 처음 받은 파일의 ETag/Last-Modified를 If-Range로 보내 서버 파일이 바뀌었으면 전체를 다시 받고,
+    응답 Content-Range의 전체 크기가 처음 받은 크기와 다르면 '.part'를 버리고 처음부터 다시 받음
+    """
+    save_dir = save_dir or SAVE_DIR
+    tag = f"[{label}] " if label else ""
+    
+    # URL에 이미 파일명이 포함되어 있으므로, 이를 기본 저장 경로로 사용
+    # 최종 저장 경로: 설정된 디렉토리 + 파일명
+    save_path = os.path.join(save_dir, grib_filename)
+    part_path = f"{save_path}.part"
+    
+    # 저장 디렉토리가 없으면 생성
+    os.makedirs(save_dir, exist_ok=True)
+
+    if already_downloaded(save_path, check_grib):
+        print(f"  {tag}[건너뜀] 이미 받은 파일: {save_path}")
+        return True
+
+    # 이전에 받다가 중단된 파일이 있으면 이어 받기
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    part_info = load_part_info(part_path) if offset else {}
+    headers = {}
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+        if part_info.get("validator"):
+            headers['If-Range'] = part_info["validator"]
+
+    if limiter:
+        limiter.acquire()
+    try:
+        response = (session or requests).get(file_url, stream=True, timeout=30, headers=headers)
+    except requests.exceptions.RequestException as e:
+        print(f"  {tag}[오류] 요청 중 예외 발생: {e}")
+        return False
+
+    if response.status_code == 416 and offset:
+        # 요청 범위가 파일 크기를 넘음 (서버 파일이 바뀌었거나 .part가 더 큼) → 처음부터 다시 받기
+        response.close()
+        print(f"  {tag}[재시도] 이어 받기 범위 오류, 처음부터 다시 받습니다.")
+        discard_part(part_path)
+        return download_file(file_url, grib_filename, default_filename, session, label, save_dir, limiter,
+                             check_grib)
+        
+    # HTTP 상태 코드 확인 (206: 이어 받기, 200: 전체 받기)
+    if response.status_code in (200, 206):
+        # 1. 파일 크기 확인 (Content-Length 헤더)
+        total_size_str = response.headers.get('Content-Length')
+        total_size = int(total_size_str) if total_size_str else 0
+        if response.status_code == 206:
+            content_range = re.match(r'bytes (\d+)-\d+/(\d+|\*)', response.headers.get('Content-Range', ''))
+            if not content_range or int(content_range.group(1)) != offset:
+                response.close()
+                print(f"  {tag}[실패] 이어 받기 응답 범위가 요청과 다름: {response.headers.get('Content-Range')}")
+                return False
+            range_total = int(content_range.group(2)) if content_range.group(2) != '*' else 0
+            if range_total and part_info.get("size") and range_total != part_info["size"]:
+                # 처음 받을 때와 전체 크기가 다름 → 서버 파일이 바뀜, 받은 부분은 쓸 수 없음
+                response.close()
+                print(f"  {tag}[재시도] 서버 파일 크기가 바뀜 ({part_info['size']:,} → {range_total:,} bytes), "
+                      f"처음부터 다시 받습니다.")
+                discard_part(part_path)
+                return download_file(file_url, grib_filename, default_filename, session, label, save_dir, limiter,
+                                     check_grib)
+            total_size = range_total or (total_size + offset if total_size else 0)
+            if not part_info:
+                save_part_info(part_path, response, total_size)
+            print(f"  {tag}[이어 받기] {offset:,} bytes 부터")
+        else:
+            # 서버가 Range를 지원하지 않거나 If-Range가 맞지 않으면(파일이 바뀜) 처음부터
+            if offset:
+                print(f"  {tag}[재시도] 서버가 전체 파일로 응답, 처음부터 다시 받습니다.")
+            offset = 0
+            save_part_info(part_path, response, total_size)
+        downloaded_size = offset
+        
+        # 2. Content-Disposition 헤더 파일 이름 확인
+        # 저장은 항상 요청한 파일명으로 (건너뛰기 확인, 기록, 후처리, 요약이 같은 경로를 보도록, 헤더 경로 문자 무시)
+        disposition = response.headers.get('Content-Disposition', '')
+        fname_match = re.search(r'filename\*?=(?:UTF-8\'\')?"?(.+?)"?$', disposition, re.I)
+        header_filename = fname_match.group(1).strip().strip('"') if fname_match else None
+        if header_filename and header_filename != grib_filename:
+            print(f"  {tag}[확인] 서버 파일명 '{header_filename}'이 요청 파일명과 다름, 요청 파일명으로 저장")
+        
+        print(f"  {tag}[성공] 파일을 '{save_path}'로 저장합니다.")
+
+        # 파일 저장 (.part에 쓰고 확인 후 이름 변경)
+        last_percent = -1 # <-- 5% 단위 표시를 위한 변수
+        step = CONCURRENT_PROGRESS_STEP if label else 5
+        try:
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE): 
+                    if chunk:
+                        f.write(chunk)
+                        downloaded_size += len(chunk)
+                        
+                        # 3. 다운로드 진행 상황 표시 (Progress Bar 효과)
+                        if total_size > 0:
+                            percent = int((downloaded_size / total_size) * 100)
+                            
+                            # **[수정 사항 1] 5% 단위로만 진행률 표시** (동시 다운로드는 줄 단위)
+                            if percent >= last_percent + step or percent == 100:
+                                if label:
+                                    print(f"  {tag}[진행] {downloaded_size:,} bytes / {total_size:,} bytes ({percent}%)")
+                                else:
+                                    sys.stdout.write(f"\r  [진행] {downloaded_size:,} bytes / {total_size:,} bytes ({percent}%)")
+                                    sys.stdout.flush()
+                                last_percent = percent
+                        elif not label:
+                            sys.stdout.write(f"\r  [진행] {downloaded_size:,} bytes 다운로드 중...")
+                            sys.stdout.flush()
+        except requests.exceptions.RequestException as e:
+            if not label:
+                sys.stdout.write('\n')
+            print(f"  {tag}[오류] 다운로드 중 예외 발생: {e} (받은 {downloaded_size:,} bytes, 재실행 시 이어 받기)")
+            return False
+        finally:
+            response.close()
+
+        # 줄바꿈 및 완료 메시지 출력
+        if not label:
+            sys.stdout.write('\n')
+
+        # 4. 크기와 GRIB 끝 표시 확인 후 최종 파일명으로 변경
+        if total_size and downloaded_size != total_size:
+            print(f"  {tag}[불완전] {downloaded_size:,} / {total_size:,} bytes, 재실행 시 이어 받기")
+            return False
+        if check_grib and not grib_complete(part_path):
+            # 이어 받을 수 없는 손상 파일은 삭제
+            discard_part(part_path)
+            print(f"  {tag}[손상] GRIB 시작/끝 표시(GRIB/7777) 없음, 파일 삭제")
+            return False
+        os.replace(part_path, save_path)
+        discard_part(part_path) # 남은 서버 파일 정보(.part.json) 삭제
+        print(f"  {tag}[완료] 다운로드 완료. ({downloaded_size:,} bytes)")
+        return True
+    else:
+        print(f"  {tag}[실패] HTTP 상태 코드: {response.status_code}")
+        try:
+            print(f"  {tag}[응답] {response.text.strip()[:150]}...")
+        except:
+            print(f"  {tag}[응답] 서버에서 텍스트 응답을 가져올 수 없습니다.")
+        response.close()
+        return False
+
+def download_all(jobs, workers=MAX_WORKERS, rate=RATE_LIMIT, burst=RATE_BURST, save_dir=None, check_grib=CHECK_GRIB,
+                 results=None, on_done=None):
+    """
+    다운로드 목록(build_jobs) 처리, 반환값: (성공 수, 실패 수)
+    목록 순서대로 요청을 시작하므로 build_jobs의 우선순위(최신 기준 시각, 이른 예측 시간 먼저)를 따름
+    workers 1이면 기존과 같이 순차 다운로드 (요청 간격 1/rate초, 기본 0.5초)
+    workers 2 이상이면 스레드 풀 + 공유 연결 풀 + 토큰 버킷(초당 rate개) 요청 제한으로 동시 다운로드
+    이미 받은 파일은 요청 없이 건너뛰므로 요청 제한에 포함되지 않음
+    results: 리스트를 주면 파일별 결과(dict)를 목록 순서대로 추가 (실행 요약용)
+    on_done: 파일을 받을 때마다(이미 받은 파일 포함) (작업, 저장 경로)로 호출 (ex. GribSubsetter.submit)
+    """
+    success_count = 0
+    fail_count = 0
+    records = [None] * len(jobs)
+    count_lock = threading.Lock()
+
+    def fetch(k, job, session, limiter, label=None):
+        nonlocal success_count, fail_count
+        job_dir = job["save_dir"] or save_dir or SAVE_DIR
+        save_path = os.path.join(job_dir, job["filename"])
+        skipped = already_downloaded(save_path, check_grib)
+        print(f"[{job['label']} 파일 다운로드 시도] 파일명: {job['filename']}")
+        start = time.perf_counter()
+        ok = download_file(job["url"], job["filename"], session=session, label=label, save_dir=job_dir,
+                           limiter=limiter, check_grib=check_grib)
+        if ok and on_done:
+            on_done(job, save_path)
+        records[k] = {
+            "date": job["date"], "prefix": job["prefix"], "hf": job["hf"], "file": job["filename"],
+            "status": ("skipped" if skipped else "ok") if ok else "fail",
+            "bytes": os.path.getsize(save_path) if ok and os.path.exists(save_path) else 0,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        with count_lock:
+            if ok:
+                success_count += 1
+            else:
+                fail_count += 1
+            if label:
+                print(f"[{label}] {'완료' if ok else '실패'} (성공 {success_count}, 실패 {fail_count} / {len(jobs)})")
+        return ok
+
+    if workers <= 1:
+        limiter = TokenBucket(rate, 1)
+        with make_session(1) as session:
+            for k, job in enumerate(jobs):
+                fetch(k, job, session, limiter)
+                print("-" * 40)
+    else:
+        bucket = TokenBucket(rate, burst)
+        print(f"동시 다운로드: 스레드 {workers}개, 요청 제한 초당 {rate}개 (최대 연속 {burst}개)")
+        with make_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda kj: fetch(kj[0], kj[1], session, bucket, kj[1]["label"]), enumerate(jobs)))
+
+    if results is not None:
+        results.extend(records)
+    return success_count, fail_count
+
+def dir_size(path):
+    """
+    파일 크기, 폴더(zarr)면 안의 파일 크기 합
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+def crop_latlon(ds, bbox):
+    """
+    위경도 범위(위도 최소/최대, 경도 최소/최대)를 포함하는 최소 격자 범위로 자름 (1차원/2차원 위경도 모두)
+    """
+    lat0, lat1, lon0, lon1 = bbox
+    inside = ((ds['latitude'] >= lat0) & (ds['latitude'] <= lat1)
+              & (ds['longitude'] >= lon0) & (ds['longitude'] <= lon1))
+    index = {}
+    for dim in inside.dims:
+        hit = inside.any(dim=[d for d in inside.dims if d != dim]).values.nonzero()[0]
+        if not len(hit):
+            raise ValueError(f"위경도 범위 {bbox} 안에 격자 없음")
+        index[dim] = slice(int(hit[0]), int(hit[-1]) + 1)
+    return ds.isel(index)
+
+def subset_grib(grib_path, out_path, variables=SUBSET_VARS, levels=SUBSET_LEVELS, bbox=SUBSET_BBOX,
+                level_type=SUBSET_LEVEL_TYPE):
+    """
+    GRIB2 파일에서 지정 변수/등압면 메시지만 디코딩하고 위경도 범위로 잘라 압축 nc로 저장 (한 예측 시간)
+    반환값: (원본 크기, 저장 크기) bytes
+    """
+    import xarray as xr
+
+    keys = {'typeOfLevel': level_type, 'shortName': list(variables)}
+    if levels:
+        keys['level'] = [int(level) for level in levels]
+    # 조건에 맞지 않는 메시지는 디코딩하지 않음, 색인(.idx) 파일은 만들지 않음
+    with xr.open_dataset(grib_path, engine='cfgrib',
+                         backend_kwargs={'filter_by_keys': keys, 'indexpath': ''}) as ds:
+        missing = set(variables) - set(ds.data_vars)
+        if missing:
+            raise ValueError(f"GRIB 파일에 없는 변수 {sorted(missing)}")
+        ds = crop_latlon(ds[list(variables)], bbox).load()
+    ds = ds.expand_dims('step') # 예측 시간 축으로 합치기 위해
+    tmp_path = f"{out_path}.tmp"
+    ds.to_netcdf(tmp_path, encoding={v: {'zlib': True, 'complevel': 4} for v in ds.data_vars})
+    os.replace(tmp_path, out_path)
+    return os.path.getsize(grib_path), os.path.getsize(out_path)
+
+def combine_subsets(hour_files, out_path, fmt=SUBSET_FORMAT):
+    """
+    예측 시간별 부분 저장 파일을 예측 시간(step) 축으로 합쳐 압축 netcdf 또는 zarr 한 개로 저장
+    """
+    import xarray as xr
+
+    parts = [xr.load_dataset(f) for f in hour_files]
+    # 예측 시간마다 다른 valid_time은 step 축으로 쌓고 나머지 좌표는 같아야 함
+    ds = xr.concat(parts, dim='step', coords='different', compat='equals').sortby('step')
+    tmp_path = f"{out_path}.tmp"
+    if fmt == 'zarr':
+        for var in ds.variables.values():
+            var.encoding = {}
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        ds.to_zarr(tmp_path, mode='w')
+        shutil.rmtree(out_path, ignore_errors=True)
+    else:
+        ds.to_netcdf(tmp_path, encoding={v: {'zlib': True, 'complevel': 4} for v in ds.data_vars})
+    os.replace(tmp_path, out_path)
+    return out_path
+
+class GribSubsetter:
+    """
+    받은 GRIB2 파일을 작업 프로세스 풀에서 바로 부분 저장하여 다운로드와 겹쳐 처리 (download_all의 on_done)
+    finish()에서 기준 시각/자료별로 예측 시간 축으로 합쳐 '{접두사}.{기준 시각}.subset.nc' (또는 .zarr) 저장
+    out_dir: 저장 경로, {date} {month} {prefix} 포함 가능 (없으면 원본 저장 경로)
+    delete_raw: True면 합친 뒤 원본 GRIB2 삭제 (재실행 시 원본을 다시 받음)
+    """
+    def __init__(self, out_dir=None, variables=SUBSET_VARS, levels=SUBSET_LEVELS, bbox=SUBSET_BBOX,
+                 level_type=SUBSET_LEVEL_TYPE, fmt=SUBSET_FORMAT, workers=SUBSET_WORKERS, delete_raw=False):
+        self.out_dir = out_dir
+        self.options = (list(variables), list(levels or []), tuple(bbox), level_type)
+        self.fmt = fmt
+        self.delete_raw = delete_raw
+        # 다운로드/처리 스레드가 도는 중에 작업 프로세스가 시작되므로 fork 대신 spawn 사용
+        # (fork는 다른 스레드가 잡고 있던 잠금까지 복사하여 작업 프로세스가 멈출 수 있음)
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self.cycles = {} # (기준 시각, 접두사) -> {"dir": 저장 경로, "hours": {예측 시간: (원본, 임시 파일, future)}}
+        self.lock = threading.Lock()
+
+    def submit(self, job, grib_path):
+        """
+        한 예측 시간 부분 저장을 작업 프로세스에 넘김, 반환값: future
+        """
+        date, prefix = job["date"], job["prefix"]
+        out_dir = (self.out_dir.format(date=date, month=date[:6], prefix=prefix) if self.out_dir
+                   else os.path.dirname(grib_path))
+        tmp_dir = os.path.join(out_dir, ".subset_tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        hour_file = os.path.join(tmp_dir, f"{os.path.basename(grib_path)}.nc")
+        future = self.executor.submit(subset_grib, grib_path, hour_file, *self.options)
+        with self.lock:
+            cycle = self.cycles.setdefault((date, prefix), {"dir": out_dir, "hours": {}})
+            cycle["hours"][job["hf"]] = (grib_path, hour_file, future)
+        return future
+
+    def process(self, job, grib_path):
+        """
+        파이프라인 처리 함수: 부분 저장이 끝날 때까지 기다림 (처리 스레드 수만큼만 동시에 진행)
+        """
+        self.submit(job, grib_path).result()
+
+    def finish(self):
+        """
+        남은 부분 저장을 기다린 뒤 기준 시각/자료별로 합쳐 저장, 반환값: 기준 시각/자료별 결과 목록
+        """
+        summary = []
+        try:
+            for (date, prefix), cycle in sorted(self.cycles.items(), reverse=True):
+                hours, raw_bytes, subset_bytes, failed = [], 0, 0, []
+                for hf, (grib_path, hour_file, future) in sorted(cycle["hours"].items()):
+                    try:
+                        raw, sub = future.result()
+                    except Exception as e:
+                        print(f"  [부분 저장 오류] {os.path.basename(grib_path)}: {e}")
+                        failed.append(hf)
+                        continue
+                    hours.append((hf, grib_path, hour_file))
+                    raw_bytes += raw
+                    subset_bytes += sub
+                result = {"date": date, "prefix": prefix, "hours": len(hours), "failed_hours": failed,
+                          "raw_mb": round(raw_bytes / 2**20, 3), "path": None}
+                if hours:
+                    ext = "zarr" if self.fmt == "zarr" else "nc"
+                    out_path = os.path.join(cycle["dir"], f"{prefix}.{date}.subset.{ext}")
+                    try:
+                        combine_subsets([hour_file for _, _, hour_file in hours], out_path, self.fmt)
+                    except Exception as e:
+                        print(f"  [부분 저장 오류] {prefix}.{date} 합치기 실패: {e}")
+                    else:
+                        result["path"] = out_path
+                        result["subset_mb"] = round(dir_size(out_path) / 2**20, 3)
+                        print(f"[부분 저장] {out_path}: {len(hours)}개 예측 시간, "
+                              f"{result['raw_mb']:,.1f} MB → {result['subset_mb']:,.1f} MB")
+                        for _, grib_path, hour_file in hours:
+                            os.remove(hour_file)
+                            if self.delete_raw:
+                                os.remove(grib_path)
+                        if not os.listdir(os.path.dirname(hours[0][2])):
+                            os.rmdir(os.path.dirname(hours[0][2]))
+                summary.append(result)
+        finally:
+            self.executor.shutdown()
+        return summary
+
+# 다른 스크립트에서 등록하는 예측 시간별 처리 함수 [(이름, func(job, path)), ...]
+HOUR_HOOKS = []
+
+def register_hour_hook(name, func):
+    """
+    받은 예측 시간 파일마다 실행할 처리 함수 등록 (ex. 지수 산출 준비), func(작업 dict, 파일 경로)
+    """
+    HOUR_HOOKS.append((name, func))
+
+def command_hook(template):
+    """
+    예측 시간 파일마다 외부 명령 실행하는 처리 함수, {path} {date} {prefix} {hf} 치환
+    ex) "python prep_calmet.py {path} {date} {hf}"
+    명령은 셸 없이 실행: 템플릿을 인자 목록으로 나눈 뒤 인자별로 치환하므로 경로에 공백/특수문자가 있어도 인자 하나
+    (파이프, 리다이렉트 등 셸 문법은 사용할 수 없음, 필요하면 스크립트로 감싸서 지정)
+    """
+    args = shlex.split(template, posix=os.name != "nt")
+    def run(job, path):
+        command = [arg.format(path=path, date=job["date"], prefix=job["prefix"], hf=job["hf"]) for arg in args]
+        subprocess.run(command, check=True)
+    return run
+
+class HourPipeline:
+    """
+    다운로드(생산)와 예측 시간별 처리(소비)를 잇는 대기열
+    다운로드가 끝난 파일은 put()으로 대기열에 들어가고 처리 스레드가 등록된 처리 함수를 순서대로 바로 실행
+    대기열이 depth개로 가득 차면 다운로드 스레드가 기다림 (처리가 밀리면 다운로드 속도를 맞춤)
+    처리 함수 오류는 해당 예측 시간만 실패로 기록
+    """
+    def __init__(self, hooks, depth=PIPELINE_DEPTH, workers=1):
+        self.hooks = hooks
+        self.queue = queue.Queue(maxsize=max(1, depth))
+        self.records = []
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(max(1, workers))]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, job, path):
+        self.queue.put((job, path, time.perf_counter()))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            job, path, queued = item
+            started = time.perf_counter()
+            status = "ok"
+            for name, hook in self.hooks:
+                try:
+                    hook(job, path)
+                except Exception as e:
+                    status = f"error({name}): {e}"
+                    print(f"  [처리 오류] {job['label']} {name}: {e}")
+                    break
+            done = time.perf_counter()
+            with self.lock:
+                self.records.append({
+                    "date": job["date"], "prefix": job["prefix"], "hf": job["hf"], "status": status,
+                    "ready_s": round(queued - self.start, 3), "wait_s": round(started - queued, 3),
+                    "process_s": round(done - started, 3), "done_s": round(done - self.start, 3),
+                })
+
+    def close(self):
+        """
+        남은 대기열 처리를 기다리고 종료, 반환값: 예측 시간별 처리 기록 (받은 시각, 대기/처리 시간, 완료 시각)
+        """
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        return sorted(self.records, key=lambda r: (r["ready_s"], r["hf"]))
+
+def expand_dates(dates=None, start=None, end=None, step_hours=12):
+    """
+    기준 시각 목록 또는 시작~종료 범위(step_hours 간격)를 YYYYMMDDHH 문자열 목록으로 변환 (중복 제거, 입력 순서 유지)
+    """
+    result = list(dates or [])
+    if start:
+        t = datetime.strptime(start, "%Y%m%d%H")
+        t_end = datetime.strptime(end or start, "%Y%m%d%H")
+        while t <= t_end:
+            result.append(t.strftime("%Y%m%d%H"))
+            t += timedelta(hours=step_hours)
+    return list(dict.fromkeys(result))
+
+def build_jobs(dates=(DATA_DATE,), prefixes=(FILE_PREFIX,), hf_start=HF_START, hf_end=HF_END,
+               auth_key=AUTH_KEY, base_url_format=BASE_URL_FORMAT, save_dir=None):
+    """
+    기준 시각 x 자료(접두사) x 예측 시간별 다운로드 목록
+    순서(우선순위): 최신 기준 시각 먼저, 같은 기준 시각 안에서는 이른 예측 시간 먼저 (자료 목록 순서)
+    → 최신 기준 시각의 앞 예측 시간이 먼저 도착하여 CALMET/CALPUFF 준비를 먼저 시작할 수 있음
+    save_dir: 저장 경로, {date} {month} {prefix} 포함 가능 ex) /nas/RDAPS-KIM/{month}
+    """
+    jobs = []
+    for data_date in sorted(dates, reverse=True):
+        for hf in range(hf_start, hf_end + 1):
+            for prefix in prefixes:
+                hf_str = f'h{hf:03d}' 
+                grib_filename = f'{prefix}_{hf_str}.{data_date}.gb2'
+                file_url = base_url_format.format(filename=grib_filename, authKey=auth_key)
+                # 한 기준 시각, 한 자료만 받으면 기존과 같이 예측 시간만 표시
+                label = hf_str
+                if len(prefixes) > 1:
+                    label = f"{prefix}_{label}"
+                if len(dates) > 1:
+                    label = f"{data_date} {label}"
+                jobs.append({
+                    "label": label, "date": data_date, "prefix": prefix, "hf": hf, "filename": grib_filename,
+                    "url": file_url,
+                    "save_dir": save_dir.format(date=data_date, month=data_date[:6], prefix=prefix) if save_dir else None,
+                })
+    return jobs
+
+def write_summary(path, results, run_info):
+    """
+    실행 요약 json 저장: 실행 설정, 기준 시각/자료별 성공/건너뜀/실패 수, 파일별 결과
+    """
+    groups = {}
+    for r in results:
+        g = groups.setdefault(f"{r['date']} {r['prefix']}", {"ok": 0, "skipped": 0, "fail": 0, "bytes": 0,
+                                                             "failed_hours": []})
+        g[r["status"]] += 1
+        g["bytes"] += r["bytes"]
+        if r["status"] == "fail":
+            g["failed_hours"].append(r["hf"])
+    downloaded = sum(r["bytes"] for r in results if r["status"] == "ok")
+    summary = {
+        **run_info,
+        "files": len(results),
+        "ok": sum(r["status"] == "ok" for r in results),
+        "skipped": sum(r["status"] == "skipped" for r in results),
+        "fail": sum(r["status"] == "fail" for r in results),
+        "downloaded_mb": round(downloaded / 2**20, 3),
+        "mb_per_s": round(downloaded / 2**20 / run_info["wall_s"], 3) if run_info["wall_s"] else None,
+        "cycles": groups,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=1)
+    return summary
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="KMA API허브 KIM GRIB2 파일 다운로드")
+    parser.add_argument("--config", default=None,
+                        help="설정 json (키는 옵션 이름, ex. {\"dates\": [...], \"prefixes\": [...]}), 명령행 옵션이 우선")
+    parser.add_argument("--dates", nargs="+", default=[DATA_DATE],
+                        help=f"기준 시각 목록 YYYYMMDDHH (기본: {DATA_DATE}, --start 지정 시 범위만 사용)")
+    parser.add_argument("--start", default=None, help="기준 시각 범위 시작 (YYYYMMDDHH)")
+    parser.add_argument("--end", default=None, help="기준 시각 범위 종료 (YYYYMMDDHH, 포함)")
+    parser.add_argument("--step-hours", type=int, default=12, help="기준 시각 범위 간격(시간, 기본: 12)")
+    parser.add_argument("--prefixes", nargs="+", default=[FILE_PREFIX],
+                        help=f"자료 파일 접두사 목록 (기본: {FILE_PREFIX})")
+    parser.add_argument("--hf-start", type=int, default=HF_START, help=f"예측 시간 시작 (기본: {HF_START})")
+    parser.add_argument("--hf-end", type=int, default=HF_END, help=f"예측 시간 종료 (기본: {HF_END})")
+    parser.add_argument("--auth-key", default=os.environ.get("KMA_AUTH_KEY", AUTH_KEY),
+                        help="API허브 인증키 (기본: 환경변수 KMA_AUTH_KEY 또는 AUTH_KEY)")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help=f"동시 다운로드 스레드 수 (기본: {MAX_WORKERS}, 1이면 순차 다운로드)")
+    parser.add_argument("--rate", type=float, default=RATE_LIMIT,
+                        help=f"초당 최대 요청 수 (기본: {RATE_LIMIT})")
+    parser.add_argument("--burst", type=int, default=RATE_BURST,
+                        help=f"동시 다운로드 최대 연속 요청 수 (기본: {RATE_BURST})")
+    parser.add_argument("--base-url", default=BASE_URL_FORMAT,
+                        help="다운로드 URL 형식, {filename} {authKey} 포함 (로컬 테스트 서버 지정용)")
+    parser.add_argument("--save-dir", default=SAVE_DIR,
+                        help="저장 경로, {date} {month} {prefix} 포함 가능 ex) /nas/RDAPS-KIM/{month}")
+    parser.add_argument("--check-grib", action="store_true", default=CHECK_GRIB,
+                        help="GRIB 시작/끝 표시(GRIB/7777) 확인 후 저장, 기존 파일도 확인하여 손상 시 다시 받음")
+    parser.add_argument("--summary", default=None,
+                        help="실행 요약 json 경로 (기본: 첫 저장 경로의 kma_download_{시작 시각}.json)")
+    parser.add_argument("--subset", action="store_true",
+                        help="받은 GRIB2에서 지정 변수/등압면/범위만 기준 시각별 압축 파일로 저장 (xarray, cfgrib 필요)")
+    parser.add_argument("--subset-vars", nargs="+", default=SUBSET_VARS,
+                        help=f"부분 저장 변수 GRIB shortName (기본: {' '.join(SUBSET_VARS)})")
+    parser.add_argument("--subset-levels", nargs="+", type=int, default=SUBSET_LEVELS,
+                        help=f"부분 저장 등압면 hPa (기본: {' '.join(map(str, SUBSET_LEVELS))})")
+    parser.add_argument("--subset-bbox", nargs=4, type=float, default=SUBSET_BBOX,
+                        metavar=("LAT_MIN", "LAT_MAX", "LON_MIN", "LON_MAX"),
+                        help=f"부분 저장 위경도 범위 (기본: {' '.join(map(str, SUBSET_BBOX))})")
+    parser.add_argument("--subset-format", choices=["netcdf", "zarr"], default=SUBSET_FORMAT,
+                        help=f"부분 저장 형식 (기본: {SUBSET_FORMAT})")
+    parser.add_argument("--subset-dir", default=None,
+                        help="부분 저장 경로, {date} {month} {prefix} 포함 가능 (기본: 원본 저장 경로)")
+    parser.add_argument("--subset-workers", type=int, default=SUBSET_WORKERS,
+                        help=f"부분 저장 프로세스 수 (기본: {SUBSET_WORKERS})")
+    parser.add_argument("--delete-raw", action="store_true",
+                        help="부분 저장 후 원본 GRIB2 삭제 (재실행 시 원본을 다시 받음)")
+    parser.add_argument("--hook-cmd", nargs="+", default=[],
+                        help="예측 시간 파일을 받을 때마다 실행할 명령 (셸 없이 실행), {path} {date} {prefix} {hf} 치환")
+    parser.add_argument("--hook-workers", type=int, default=1,
+                        help="--hook-cmd 처리 스레드 수 (기본: 1, --subset이면 --subset-workers 사용)")
+    parser.add_argument("--queue-depth", type=int, default=PIPELINE_DEPTH,
+                        help=f"처리 대기열 최대 길이, 가득 차면 다운로드가 기다림 (기본: {PIPELINE_DEPTH})")
+    return parser
+
+def parse_args(argv=None):
+    """
+    명령행 옵션 해석, --config json이 있으면 그 값을 기본값으로 사용 (명령행에서 지정한 옵션이 우선)
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            config = {k.replace("-", "_"): v for k, v in json.load(f).items()}
+        unknown = set(config) - set(vars(args))
+        if unknown:
+            parser.error(f"설정 json에 알 수 없는 항목: {sorted(unknown)}")
+        parser.set_defaults(**config)
+        args = parser.parse_args(argv)
+    return args
+
+# --- 메인 다운로드 루프 실행 ---
+def main(argv=None, hooks=None):
+    """
+    다운로드 실행, 반환값: 종료 코드 (실패가 있으면 1)
+    hooks: 예측 시간별 처리 함수 [(이름, func(job, path)), ...] (기본: register_hour_hook으로 등록한 HOUR_HOOKS)
+    ex) import KMAAPI_Downloader as kd; kd.register_hour_hook("prep", prep); kd.main(["--dates", "2024061012"])
+    """
+    args = parse_args(argv)
+    dates = expand_dates(None if args.start else args.dates, args.start, args.end, args.step_hours)
+    jobs = build_jobs(dates, args.prefixes, args.hf_start, args.hf_end, args.auth_key, args.base_url, args.save_dir)
+    n_hours = args.hf_end - args.hf_start + 1
+
+    print(f"--- KIM 모델 GRIB2 파일 다운로드 시작 ---")
+    print(f"기준 날짜: {', '.join(dates) if len(dates) <= 4 else f'{dates[0]} ~ {dates[-1]} ({len(dates)}개)'} (최신 기준 시각부터)")
+    print(f"자료: {', '.join(args.prefixes)}")
+    print(f"예측 시간: h{args.hf_start:03d} 부터 h{args.hf_end:03d} 까지 (총 {n_hours}개 x {len(dates) * len(args.prefixes)}세트)")
+    print(f"저장 경로: {args.save_dir}")
+    print("-" * 40)
+    
+    started = datetime.now()
+    start_time = time.perf_counter()
+    results = []
+    subsetter = None
+    pipeline_hooks = []
+    if args.subset:
+        subsetter = GribSubsetter(args.subset_dir, args.subset_vars, args.subset_levels, args.subset_bbox,
+                                  SUBSET_LEVEL_TYPE, args.subset_format, args.subset_workers, args.delete_raw)
+        pipeline_hooks.append(("subset", subsetter.process))
+        print(f"부분 저장: 변수 {args.subset_vars}, 등압면 {args.subset_levels}, 범위 {args.subset_bbox} "
+              f"({args.subset_format}, 프로세스 {args.subset_workers}개)")
+    pipeline_hooks += [(f"cmd{k}", command_hook(template)) for k, template in enumerate(args.hook_cmd, start=1)]
+    pipeline_hooks += HOUR_HOOKS if hooks is None else hooks
+
+    # === 예측 시간별 처리 파이프라인: 받는 대로 처리, 대기열이 가득 차면 다운로드가 기다림
+    pipeline = None
+    if pipeline_hooks:
+        pipeline = HourPipeline(pipeline_hooks, args.queue_depth, args.subset_workers if args.subset else args.hook_workers)
+        print(f"처리 파이프라인: {', '.join(name for name, _ in pipeline_hooks)} (대기열 {args.queue_depth}개)")
+    try:
+        success_count, fail_count = download_all(jobs, args.workers, args.rate, args.burst, args.save_dir,
+                                                 args.check_grib, results, pipeline.put if pipeline else None)
+        download_s = time.perf_counter() - start_time
+    finally:
+        pipeline_records = pipeline.close() if pipeline else None
+    subset_summary = subsetter.finish() if subsetter else None
+    wall_s = time.perf_counter() - start_time
+
+    summary_path = args.summary or os.path.join(jobs[0]["save_dir"] if jobs else args.save_dir,
+                                                f"kma_download_{started:%Y%m%d%H%M%S}.json")
+    summary = write_summary(summary_path, results, {
+        "started": started.isoformat(timespec="seconds"), "wall_s": round(wall_s, 3), "dates": dates,
+        "prefixes": args.prefixes, "hf_start": args.hf_start, "hf_end": args.hf_end, "workers": args.workers,
+        "rate": args.rate, "download_s": round(download_s, 3), "subset": subset_summary,
+        "pipeline": pipeline_records,
+    })
+
+    print(f"--- 다운로드 종료 ({wall_s:.1f}초, {summary['downloaded_mb']:,.1f} MB) ---")
+    print(f"총 시도: {len(jobs)}개")
+    print(f"성공: {success_count}개 (이미 받은 파일 {summary['skipped']}개), 실패: {fail_count}개")
+    if pipeline_records:
+        failed = sum(r["status"] != "ok" for r in pipeline_records)
+        print(f"처리 파이프라인: {len(pipeline_records)}개 예측 시간 처리 (실패 {failed}개), "
+              f"최대 대기 {max(r['wait_s'] for r in pipeline_records):.1f}초, "
+              f"다운로드 종료 {download_s:.1f}초 → 마지막 처리 완료 {max(r['done_s'] for r in pipeline_records):.1f}초")
+        fail_count += failed
+    print(f"실행 요약: {summary_path}")
+    return 1 if fail_count else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
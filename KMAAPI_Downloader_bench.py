@@ -0,0 +1,137 @@
+# ***************************************
+# Benchmark for KMAAPI_Downloader.py
+# 모의 KMA API허브(KMAAPI_mock_server.py)를 별도 프로세스로 띄우고 다운로드 스레드 수별
+# 전체 처리량(files/s, MB/s)과 서버 요청/전송량(재시도, 이어 받기 포함) 측정
+# ex) python KMAAPI_Downloader_bench.py --workers 1 4 8 --files 55 --file-size-mb 5 --latency 0.2 --bandwidth-mbps 10
+# ***************************************
+
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from urllib.request import urlopen
+
+import KMAAPI_Downloader
+import KMAAPI_mock_server
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def server_stats(port):
+    with urlopen(f"http://127.0.0.1:{port}/stats", timeout=5) as response:
+        return json.loads(response.read())
+
+def start_server(server_args):
+    """
+    모의 서버를 별도 프로세스로 시작 (다운로드 스레드와 GIL을 나누지 않도록), 반환값: (프로세스, 포트)
+    """
+    port = free_port()
+    process = multiprocessing.Process(target=KMAAPI_mock_server.main, args=(server_args + ["--port", str(port)],),
+                                      daemon=True)
+    process.start()
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            server_stats(port)
+            return process, port
+        except OSError:
+            if time.monotonic() > deadline or not process.is_alive():
+                process.terminate()
+                raise RuntimeError("모의 서버 시작 실패")
+            time.sleep(0.05)
+
+def bench_download(port, save_dir, n_files, workers, rate, burst, passes, check_grib):
+    """
+    n_files개 예측 시간 다운로드, 실패가 있으면 passes회까지 다시 실행(이어 받기)
+    반환값: 측정 결과 dict
+    """
+    jobs = KMAAPI_Downloader.build_jobs(["2024061012"], [KMAAPI_Downloader.FILE_PREFIX], 0, n_files - 1,
+                                        "bench", KMAAPI_mock_server.url_format(port), save_dir)
+    before = server_stats(port)
+    start = time.perf_counter()
+    for n_pass in range(1, passes + 1):
+        # 파일별 진행 출력은 측정 결과만 보이도록 버림
+        with contextlib.redirect_stdout(io.StringIO()):
+            ok, fail = KMAAPI_Downloader.download_all(jobs, workers, rate, burst, save_dir, check_grib)
+        if not fail:
+            break
+    wall = time.perf_counter() - start
+    after = server_stats(port)
+    complete = [job for job in jobs if os.path.exists(os.path.join(save_dir, job["filename"]))]
+    mb = sum(os.path.getsize(os.path.join(save_dir, job["filename"])) for job in complete) / 2**20
+    return {
+        "workers": workers, "passes": n_pass, "wall_s": wall, "files": len(complete), "failed": len(jobs) - len(complete),
+        "mb": mb, "files_per_s": len(complete) / wall, "mb_per_s": mb / wall,
+        "requests": after["requests"] - before["requests"],
+        "range_requests": after["range_requests"] - before["range_requests"],
+        "server_errors": after["errors"] - before["errors"],
+        "sent_mb": (after["bytes_sent"] - before["bytes_sent"]) / 2**20,
+    }
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="KMAAPI_Downloader 다운로드 처리량 측정 (모의 KMA API허브 사용)")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 4, 8], help="측정할 스레드 수 (기본: 1 4 8)")
+    parser.add_argument("--files", type=int, default=20, help="예측 시간 파일 수 (기본: 20)")
+    parser.add_argument("--repeat", type=int, default=1, help="스레드 수별 반복 횟수 (기본: 1)")
+    parser.add_argument("--rate", type=float, default=1000.0,
+                        help="다운로드 초당 최대 요청 수 (기본: 1000, 실제 제한을 측정하려면 2)")
+    parser.add_argument("--burst", type=int, default=None, help="최대 연속 요청 수 (기본: 스레드 수)")
+    parser.add_argument("--passes", type=int, default=1, help="실패 시 다시 실행할 최대 횟수 (기본: 1)")
+    parser.add_argument("--check-grib", action="store_true", help="GRIB 시작/끝 표시 확인")
+    parser.add_argument("--file-size-mb", type=float, default=5.0, help="모의 서버 파일 크기 MB (기본: 5)")
+    parser.add_argument("--latency", type=float, default=0.1, help="모의 서버 첫 응답 지연(초, 기본: 0.1)")
+    parser.add_argument("--bandwidth-mbps", type=float, default=0.0, help="모의 서버 연결별 대역폭 MB/s (기본: 제한 없음)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="모의 서버 오류 비율 (기본: 0)")
+    parser.add_argument("--no-range", action="store_true", help="모의 서버 Range 미지원")
+    parser.add_argument("--no-length", action="store_true", help="모의 서버 Content-Length 미전송")
+    parser.add_argument("--workdir", default=None, help="다운로드 폴더 (기본: 임시 폴더, 종료 시 삭제)")
+    parser.add_argument("--json", default=None, help="측정 결과 json 저장 경로")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    server_args = ["--file-size-mb", str(args.file_size_mb), "--latency", str(args.latency),
+                   "--bandwidth-mbps", str(args.bandwidth_mbps), "--error-rate", str(args.error_rate)]
+    server_args += ["--no-range"] * args.no_range + ["--no-length"] * args.no_length
+    workdir = args.workdir or tempfile.mkdtemp(prefix="kma_download_bench_")
+    process, port = start_server(server_args)
+
+    print(f"== 모의 서버 파일 {args.file_size_mb} MB x {args.files}개, 지연 {args.latency}s, "
+          f"대역폭 {args.bandwidth_mbps or '제한 없음'} MB/s, 오류 비율 {args.error_rate}")
+    print(f"  {'workers':>7} {'wall_s':>8} {'files':>6} {'fail':>5} {'files/s':>8} {'MB/s':>8} "
+          f"{'requests':>8} {'range':>6} {'sent_MB':>8}")
+    results = []
+    try:
+        for workers in args.workers:
+            for r in range(args.repeat):
+                save_dir = os.path.join(workdir, f"w{workers}_{r}")
+                shutil.rmtree(save_dir, ignore_errors=True)
+                result = bench_download(port, save_dir, args.files, workers, args.rate, args.burst or workers,
+                                        args.passes, args.check_grib)
+                results.append({"repeat": r, **result})
+                print(f"  {workers:>7} {result['wall_s']:8.2f} {result['files']:>6} {result['failed']:>5} "
+                      f"{result['files_per_s']:8.2f} {result['mb_per_s']:8.1f} {result['requests']:>8} "
+                      f"{result['range_requests']:>6} {result['sent_mb']:8.1f}")
+    finally:
+        process.terminate()
+        process.join()
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"server": server_args, "files": args.files, "results": results}, f, ensure_ascii=False,
+                      indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
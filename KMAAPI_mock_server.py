@@ -0,0 +1,245 @@
+# ***************************************
+# Local mock of KMA API허브 nwp_file_down.php (KMAAPI_Downloader.py 오프라인 시험/성능 측정용)
+# nwp_file_down.php?file={파일명}&authKey={인증키} 요청에 GRIB 형태("GRIB" ... "7777")의 합성 파일 응답
+# 파일 크기, 첫 응답 지연, 연결별 대역폭, 오류 비율, Content-Disposition/Content-Length/Range/ETag 지원 여부 설정 가능
+# ex) python KMAAPI_mock_server.py --port 8080 --file-size-mb 30 --latency 0.2 --bandwidth-mbps 20 --error-rate 0.05
+#     python KMAAPI_Downloader.py --base-url "http://127.0.0.1:8080/api/typ06/url/nwp_file_down.php?file={filename}&authKey={authKey}"
+# ***************************************
+
+import re
+import sys
+import json
+import time
+import random
+import zlib
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8080
+URL_PATH = "/api/typ06/url/nwp_file_down.php"
+BLOCK_SIZE = 64 * 1024 # 전송 단위 (대역폭 제한도 이 단위로 적용)
+LAST_MODIFIED = "Mon, 10 Jun 2024 12:00:00 GMT"
+
+def url_format(port, host="127.0.0.1"):
+    """
+    KMAAPI_Downloader --base-url 형식
+    """
+    return f"http://{host}:{port}{URL_PATH}?file={{filename}}&authKey={{authKey}}"
+
+def file_etag(filename, size):
+    """
+    파일명과 크기로 정한 ETag (크기를 바꾸면 다른 파일로 취급)
+    """
+    return f'"{zlib.crc32(filename.encode()):08x}-{size}"'
+
+def file_bytes(filename, start, end, size):
+    """
+    파일명별 합성 내용의 [start, end) 구간: "GRIB" + 파일명으로 정한 반복 패턴 + "7777"
+    같은 파일명은 항상 같은 내용이므로 이어 받기(Range) 결과를 비교할 수 있음
+    """
+    seed = zlib.crc32(filename.encode())
+    pattern = bytes((seed + i) % 251 for i in range(251))
+    offset = (start - 4) % len(pattern)
+    body = bytearray((pattern * ((end - start) // len(pattern) + 2))[offset:offset + end - start])
+    for pos in range(start, min(end, 4)):
+        body[pos - start] = b"GRIB"[pos]
+    for pos in range(max(start, size - 4), end):
+        body[pos - start] = b"7777"[pos - (size - 4)]
+    return bytes(body)
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # 연결 재사용(keep-alive) 지원
+
+    def log_message(self, format, *args):
+        if self.server.options["verbose"]:
+            super().log_message(format, *args)
+
+    def send_text(self, status, text):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        opts = self.server.options
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            self.send_text(200, json.dumps(self.server.snapshot()))
+            return
+        if url.path != URL_PATH:
+            self.send_text(404, "not found")
+            return
+
+        query = parse_qs(url.query)
+        filename = query.get("file", [""])[0]
+        self.server.count("requests")
+        if opts["auth_key"] and query.get("authKey", [""])[0] != opts["auth_key"]:
+            self.send_text(401, "인증키가 유효하지 않습니다.")
+            return
+        hf = re.search(r"_h(\d{3})\.", filename)
+        if not filename or (hf and int(hf.group(1)) in opts["missing_hours"]):
+            self.send_text(404, f"파일이 존재하지 않습니다: {filename}")
+            return
+
+        time.sleep(opts["latency"])
+        fault = self.server.draw_fault()
+        if fault == "status":
+            self.server.count("errors")
+            self.send_text(500, "일시적인 서버 오류")
+            return
+
+        size = opts["file_size"]
+        start, end = 0, size
+        etag = file_etag(filename, size)
+        match = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if if_range and if_range not in ((etag, LAST_MODIFIED) if opts["validators"] else ()):
+            # If-Range가 현재 파일과 다르면 Range를 무시하고 전체 파일 응답
+            match = None
+        if match and opts["range"]:
+            start = int(match.group(1))
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+            self.server.count("range_requests")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        if opts["validators"]:
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", LAST_MODIFIED)
+        if opts["disposition"]:
+            name = opts["disposition"] if isinstance(opts["disposition"], str) else filename
+            self.send_header("Content-Disposition", f'attachment; filename="{name}"')
+        if opts["length"]:
+            self.send_header("Content-Length", str(end - start))
+        else:
+            # 길이를 알리지 않으면 연결 종료로 끝을 표시
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+
+        # 중간 끊김 오류는 절반만 보내고 연결 종료
+        stop = start + (end - start) // 2 if fault == "truncate" else end
+        sent = 0
+        began = time.perf_counter()
+        try:
+            for pos in range(start, stop, BLOCK_SIZE):
+                chunk = file_bytes(filename, pos, min(stop, pos + BLOCK_SIZE), size)
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                self.server.count("bytes_sent", len(chunk))
+                if opts["bandwidth"]:
+                    ahead = sent / opts["bandwidth"] - (time.perf_counter() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        if fault == "truncate":
+            self.server.count("errors")
+            self.close_connection = True
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options):
+        super().__init__(address, MockHandler)
+        self.options = options
+        self.random = random.Random(options["seed"])
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "range_requests": 0, "errors": 0, "bytes_sent": 0}
+
+    def handle_error(self, request, client_address):
+        # 클라이언트가 응답 도중 연결을 끊은 경우(이어 받기 재요청 등)는 오류로 출력하지 않음
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def draw_fault(self):
+        """
+        error_rate 비율로 오류 선택: HTTP 500 또는 전송 중 끊김 (truncate_share 비율)
+        """
+        with self.lock:
+            if self.random.random() >= self.options["error_rate"]:
+                return None
+            return "truncate" if self.random.random() < self.options["truncate_share"] else "status"
+
+def make_options(file_size_mb=1.0, latency=0.0, bandwidth_mbps=0.0, error_rate=0.0, truncate_share=0.5,
+                 disposition=True, length=True, range_support=True, auth_key=None, missing_hours=(), seed=0,
+                 verbose=False, validators=True):
+    """
+    모의 서버 설정 dict (크기 MB, 지연 초, 연결별 대역폭 MB/s (0이면 제한 없음), 오류 비율 0~1)
+    disposition: 문자열이면 Content-Disposition 파일명으로 요청 파일명 대신 사용
+    """
+    return {
+        "file_size": max(8, int(file_size_mb * 2**20)), "latency": latency, "bandwidth": bandwidth_mbps * 2**20,
+        "error_rate": error_rate, "truncate_share": truncate_share, "disposition": disposition, "length": length,
+        "range": range_support, "auth_key": auth_key, "missing_hours": set(missing_hours), "seed": seed,
+        "verbose": verbose, "validators": validators,
+    }
+
+def start_mock_server(port=0, **options):
+    """
+    모의 서버를 백그라운드 스레드로 시작, 반환값: (서버, --base-url 형식)
+    port 0이면 빈 포트 사용, 종료는 server.shutdown()
+    """
+    server = MockServer(("127.0.0.1", port), make_options(**options))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, url_format(server.server_address[1])
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="KMA API허브 nwp_file_down.php 모의 서버")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"포트 (기본: {DEFAULT_PORT})")
+    parser.add_argument("--file-size-mb", type=float, default=1.0, help="응답 파일 크기 MB (기본: 1)")
+    parser.add_argument("--latency", type=float, default=0.0, help="요청별 첫 응답 지연(초, 기본: 0)")
+    parser.add_argument("--bandwidth-mbps", type=float, default=0.0,
+                        help="연결별 전송 속도 제한 MB/s (기본: 0, 제한 없음)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="오류 응답 비율 0~1 (기본: 0)")
+    parser.add_argument("--truncate-share", type=float, default=0.5,
+                        help="오류 중 전송 중 끊김 비율, 나머지는 HTTP 500 (기본: 0.5)")
+    parser.add_argument("--no-disposition", action="store_true", help="Content-Disposition 헤더 보내지 않음")
+    parser.add_argument("--no-length", action="store_true", help="Content-Length 헤더 보내지 않음 (연결 종료로 끝 표시)")
+    parser.add_argument("--no-range", action="store_true", help="Range 요청 무시 (항상 전체 파일 응답)")
+    parser.add_argument("--no-validators", action="store_true", help="ETag/Last-Modified 헤더 보내지 않음")
+    parser.add_argument("--auth-key", default=None, help="지정하면 authKey가 다른 요청은 401 응답")
+    parser.add_argument("--missing-hours", nargs="+", type=int, default=[], help="404 응답할 예측 시간 ex) 7 30")
+    parser.add_argument("--seed", type=int, default=0, help="오류 발생 난수 시드 (기본: 0)")
+    parser.add_argument("--verbose", action="store_true", help="요청 로그 출력")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    options = make_options(args.file_size_mb, args.latency, args.bandwidth_mbps, args.error_rate,
+                           args.truncate_share, not args.no_disposition, not args.no_length, not args.no_range,
+                           args.auth_key, args.missing_hours, args.seed, args.verbose, not args.no_validators)
+    server = MockServer(("127.0.0.1", args.port), options)
+    print(f"--- 모의 KMA API허브 시작: {url_format(server.server_address[1])} ---")
+    print(f"통계: http://127.0.0.1:{server.server_address[1]}/stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"--- 모의 KMA API허브 종료: {server.snapshot()} ---")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
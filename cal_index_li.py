@@ -1,324 +1,1883 @@
-# ***************************************
-# version. 20250917. 
-# This process calculates CALPUFF nc file to Li area average
-# add address code number
-# And Unify CALMET nc file and CALPUFF nc file
-# ***************************************
-
-import pandas as pd
-import os
-import netCDF4 as nc
-import numpy as np
-import sys
-import logging
-
-# ***************************************
-# logging 설정
-# ***************************************
-
-# log_dir = "./logs"
-log_dir = f"{sys.argv[7]}/{sys.argv[1]}/{sys.argv[3]}"
-os.makedirs(log_dir, exist_ok=True)
-
-log_file = os.path.join(log_dir, f"calpuff_process_{sys.argv[1]}_{sys.argv[3]}.log")
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler(log_file, encoding="utf-8"),
-        logging.StreamHandler(sys.stdout)  # 콘솔 출력도 동시에
-    ]
-)
-logger = logging.getLogger(__name__)
-logger.info(log_file)
-# ***************************************
-# set
-# ***************************************
-
-# ===== 영향지수 등급 함수 =====
-def grade_nh3(value):
-    if value < 50:
-        return 1
-    elif value < 100:
-        return 2
-    elif value < 200:
-        return 3
-    else:
-        return 4
-
-def grade_co(value):
-    if value < 10:
-        return 1
-    elif value < 15:
-        return 2
-    elif value < 20:
-        return 3
-    else:
-        return 4
-
-# =====   사용자 설정   =====
-# print(f"[1] 영향지수 생산 시작 ")
-logger.info("[1] 영향지수 생산 시작")
-date = sys.argv[1] # smaple: klaps 2024091203, rdaps 2024091121
-target = sys.argv[2]  # 'jb' or 'ns'
-target_model = sys.argv[3] # "klaps" or "rdaps"
-
-# === input - CALMET nc file
-input_dir = f"{sys.argv[4]}" # CALMET nc file ex: /windlidar/model_output/CALMET/2024091121_rdaps_ns/
-input_folder_name = f"{date}_{target_model}_{target}" # nc file
-calmet_file = os.path.join(input_dir, input_folder_name, f"{target_model}_{date}_{target}.nc")
-
-# === input - CALPUFF nc file
-input_dir2 = f"{sys.argv[5]}" # CALPUFF nc file ex: /windlidar/model_output/CALPUFF/2024091121_rdaps_ns/nc_nh3/
-
-# === latlon-address information file for Li average
-info_dir = f"{sys.argv[6]}" # latlon-address information
-region_info_file = f"{info_dir}/addresses_code_{target}.csv"
-
-# print(f"[1] input nc폴더: {input_folder_name}, 지역: {target}, 모델: {target_model}, 날짜 = {date}")
-logger.info(f"[1] input nc폴더: {input_folder_name}, 지역: {target}, 모델: {target_model}, 날짜 = {date}")
-
-
-# === set case
-if target_model == "klaps": # set model fcst time numbur
-    # files_num = 12
-    files_num = 13
-else:
-    # files_num = 48
-    files_num = 49
-    
-
-# =====   nc 경로 지정   =====
-nh3_dir = os.path.join(input_dir2, input_folder_name, "nc_nh3")
-co_dir = os.path.join(input_dir2, input_folder_name, "nc_co")
-
-if not os.path.exists(nh3_dir):
-    logger.error(f"❌ NH3 폴더 없음: {nh3_dir}")
-    raise FileNotFoundError(f"❌ NH3 폴더 없음: {nh3_dir}")
-if not os.path.exists(co_dir):
-    logger.error(f"❌ CO 폴더 없음: {co_dir}")
-    raise FileNotFoundError(f"❌ CO 폴더 없음: {co_dir}")
-if not os.path.exists(calmet_file):
-    logger.error(f"❌ CALMET 파일 없음: {calmet_file}")
-    raise FileNotFoundError(f"❌ CALMET 파일 없음: {calmet_file}")
-
-logger.info(f"[2] 폴더 경로 확인 완료")
-logger.info(f"nh3_dir = {nh3_dir}")
-logger.info(f"co_dir = {co_dir}")
-logger.info(f"calmet_file = {calmet_file}")
-# print(f"[2] 폴더 경로 확인 완료")
-# print(f"nh3_dir = {nh3_dir}")
-# print(f"co_dir = {co_dir}")
-
-# =====   결과 저장 리스트   =====
-all_data = []
-nc_all_data = []
-df_nc = pd.DataFrame()
-df_merged = pd.DataFrame()
-
-# ***************************************
-# process - load and merge
-# ***************************************
-
-# =====   NH3와 CO 파일 이름 매칭 후 처리   =====
-nh3_files = sorted(f for f in os.listdir(nh3_dir) if f.endswith(".nc"))
-co_files = sorted(f for f in os.listdir(co_dir) if f.endswith(".nc"))
-common_files = sorted(set(nh3_files) & set(co_files))[:files_num] # klaps forecast 12h, file nums 12 / rdaps forecast 48h, file nums 48
-
-# === 지역 정보 불러오기
-logger.info(f"[3] 지역 정보 파일 로드 중: {region_info_file}")
-# print(f"[3] 지역 정보 파일 로드 중: {region_info_file}")
-df_region_info = pd.read_csv(region_info_file)
-
-# =====   지수 프로페스   =====
-
-# === nc를 dataframe으로
-logger.info(f"[4] nc to dataframe")
-logger.info(common_files)
-
-# CALMET 파일 로드
-try:
-    ds_calmet = nc.Dataset(calmet_file)
-    logger.info("✅ CALMET 데이터 추출 완료")
-
-except Exception as e:
-    logger.error(f"Error processing CALMET file: {e}")
-    ds_calmet = None # 오류 발생 시 빈 DataFrame 생성
-
-
-# print(f"[4] nc to dataframe")
-# for file_name in common_files[:files_num]:
-
-for i, file_name in enumerate(common_files[:files_num]):  
-    nh3_path = os.path.join(nh3_dir, file_name)
-    co_path = os.path.join(co_dir, file_name)
-    logger.info(f"{nh3_path}")
-    try:
-        
-        # === load calpuff nc file
-        ds_nh3 = nc.Dataset(nh3_path)
-        ds_co = nc.Dataset(co_path)
-        
-        nh3 = ds_nh3.variables['NH3'][0, 0, :, :]
-        co = ds_co.variables['OU'][0, 0, :, :]
-        lat = ds_nh3.variables['lat'][:] # ns, co 동일
-        lon = ds_nh3.variables['lon'][:] # ns, co 동일
-        x = ds_nh3.variables['x'][:]
-        y = ds_nh3.variables['y'][:]
-
-        # Flatten calpuff data
-        lat_flat = lat.flatten()
-        lon_flat = lon.flatten()
-        x_grid, y_grid = np.meshgrid(x, y)
-        x_flat = x_grid.flatten()
-        y_flat = y_grid.flatten()
-        nh3_flat = nh3.flatten()
-        co_flat = co.flatten()
-
-        # 날짜와 시간 추출
-        parts = file_name.replace(".nc", "").split("_")  # ['rdaps', '2024091121', '2024091201', 'jb']
-        date_part = parts[2][:8]  # yyyymmdd
-        time_part = parts[2][8:]  # hh
-
-        nc_df = pd.DataFrame({
-            "Date": [date_part] * len(nh3_flat),
-            "Time": [time_part] * len(nh3_flat),
-            "X": x_flat,
-            "Y": y_flat,
-            "Lat": lat_flat,
-            "Lon": lon_flat,
-            "NH3": nh3_flat,
-            "CO": co_flat
-        })
-        
-        # === CALMET 데이터 추출 및 병합
-        if ds_calmet:
-            # CALMET 파일에서 해당하는 시간(i)과 첫 번째 레벨(0)의 데이터를 추출
-            # 담당자 문의 결과 CALMET 영역을 CALPUFF와 맞춰야 한다고 함
-            # 상대습도(RH)는 3차원이 아닌 2차원 데이터
-            calmet_u_wind = ds_calmet.variables['U'][i, 0, 10:-10, 10:-10]
-            calmet_v_wind = ds_calmet.variables['V'][i, 0, 10:-10:, 10:-10]
-            calmet_temp = ds_calmet.variables['T'][i, 0, 10:-10, 10:-10]
-            calmet_rh = ds_calmet.variables['RH'][i, 10:-10, 10:-10]
-            
-            # 풍속(wind speed) 계산
-            calmet_wind_speed = np.sqrt(calmet_u_wind**2 + calmet_v_wind**2)
-            
-            # 풍향 계산
-            # np.arctan2(v, u)는 y축과 x축 벡터를 인자로 받으며, atan2(y, x)로 계산.
-            # 90도를 더하고 360으로 나눈 나머지를 취하여 북쪽을 0도로 맞춤.
-            calmet_wind_dir = (270 - np.degrees(np.arctan2(calmet_v_wind, calmet_u_wind))) % 360
-
-            # Flatten
-            calmet_wind_speed_flat = calmet_wind_speed.flatten()
-            calmet_wind_dir_flat = calmet_wind_dir.flatten()
-            calmet_temp_flat = calmet_temp.flatten()
-            calmet_rh_flat = calmet_rh.flatten()
-
-            # 임시 DataFrame 생성
-            df_calmet_temp = pd.DataFrame({
-                "X": x_flat, # CALPUFF와 동일한 X, Y 사용
-                "Y": y_flat, # CALPUFF와 동일한 X, Y 사용
-                "Temperature": calmet_temp_flat,
-                "Relative_Humidity": calmet_rh_flat,
-                "Wind_Speed": calmet_wind_speed_flat,
-                "Wind_Direction": calmet_wind_dir_flat
-            })
-            
-            # CALPUFF 데이터에 CALMET 풍속 데이터 병합
-            nc_df = pd.merge(nc_df, df_calmet_temp, on=['X', 'Y'], how='left')
-
-        nc_all_data.append(nc_df)
-
-    except Exception as e:
-        logger.error(f"Error processing {file_name}: {e}")
-        # print(f"Error processing {file_name}: {e}")
-        continue
-    
-# === nc와 지역 정보 dataframe 합치기
-logger.info(f"[5] nc와 지역 정보 합치기")
-# print(f"[5] nc와 지역 정보 합치기")
-df_nc = pd.concat(nc_all_data, ignore_index=True) # nc to dataframe
-
-# nc dataframe을 csv로 저장한 후에 불러와서 지역 정보와 합침(오류 대책)
-csv_name_sdate = common_files[0].split('_')[-2] # for csv file name date
-csv_name_edate = common_files[-1].split('_')[-2]
-data_csv_path = f"{sys.argv[7]}/{date}/{target_model}"
-# data_csv_name = f"{target_model}_{csv_name_sdate}_{csv_name_edate}_{target}_data"
-data_csv_name = f"{target_model}_{csv_name_sdate}_{csv_name_edate}_index_data"
-data_csv = f"{data_csv_path}/{data_csv_name}.csv"
-
-# print(f"[6] 농도 데이터를 가진 nc와 지역 정보 합친 data csv 저장 {data_csv}")
-# print(f"{data_csv}")
-logger.info(f"[6] 농도 데이터를 가진 nc와 지역 정보 합친 data csv 저장 {data_csv}")
-df_nc.to_csv(data_csv, index=False, encoding='utf-8-sig')
-
-df_data = pd.read_csv(f"{data_csv_path}/{data_csv_name}.csv")
-# print(f"df_data  → {len(df_data):,}건 로드됨")
-logger.info(f"df_data  → {len(df_data):,}건 로드됨")
-
-df_merged = pd.merge(df_region_info, df_data, how="outer", on=['X','Y','Lat','Lon'])
-# print(f"df_merged  → {len(df_merged):,}건 로드됨")
-logger.info(f"df_merged  → {len(df_merged):,}건 로드됨")
-
-# ***************************************
-# process - calculate
-# ***************************************
-
-# =====   리 지명(LI_KOR_NM)과 코드(LI_CD) 채우기   =====
-# LI_KOR_NM(리) 값이 없는 경우, EMD_KOR_NM(읍면동)으로 채움
-df_merged.loc[:, 'LI_KOR_NM'] = df_merged['LI_KOR_NM'].fillna(df_merged['EMD_KOR_NM'])
-df_merged.loc[:, 'LI_CD'] = df_merged['LI_CD'].fillna(df_merged['EMD_CD'])
-
-# =====   level2 지역 필터   =====
-# SIG_KOR_NM(시군구) 값에서 논산시만 필터
-if target == 'ns':
-    df_merged = df_merged[(df_merged['SIG_KOR_NM'] == '논산시')]
-
-# =====   평균 계산   =====
-# print(f"[6] 리 단위 그룹화 및 평균 산출")
-logger.info(f"[6] 리 단위 그룹화 및 평균 산출")
-
-df_grouped = df_merged.groupby(['Date','Time','CTP_KOR_NM','CTPRVN_CD','SIG_KOR_NM','SIG_CD','EMD_KOR_NM','EMD_CD','LI_KOR_NM','LI_CD']).agg({
-    'NH3':'mean',
-    'CO':'mean',
-    'Temperature':'mean',
-    'Relative_Humidity':'mean',
-    'Wind_Speed':'mean',
-    'Wind_Direction':'mean'
-}).reset_index()
-
-df_grouped['NH3'] = df_grouped['NH3'].apply(grade_nh3).astype(int)
-df_grouped['CO'] = df_grouped['CO'].apply(grade_co).astype(int)
-
-# 온도단위 K에서 C로 변환
-df_grouped['Temperature_C'] = df_grouped['Temperature'] - 273.15
-
-# 변환한 온도단위 기존의 온도변수에 대입
-df_grouped['Temperature'] = df_grouped['Temperature_C']
-
-# 변환할때 쓴 데이터 변수 드롭
-df_grouped.drop(columns=['Temperature_C'], inplace=True)
-
-# ***************************************
-# save
-# ***************************************
-
-# print(f"[7] 리 평균 csv 저장")
-logger.info(f"[7] 리 평균 csv 저장")
-output_dir = f"{sys.argv[7]}/{date}/{target_model}"
-output_name = f"{target_model}_{csv_name_sdate}_{csv_name_edate}_index_li.csv" # ex. {target_model}_20250702122_2025070223_index.csv
-
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
-    # print(f"[8] 출력 디렉토리 생성됨: {output_dir}")
-    logger.info(f"[8] 출력 디렉토리 생성됨: {output_dir}")
-else:
-    # print(f"[8] 출력 디렉토리 존재 확인됨")
-    logger.info(f"[8] 출력 디렉토리 존재 확인됨")
-
-out_path = os.path.join(output_dir, output_name)
-df_grouped.to_csv(out_path, index=False, encoding='utf-8-sig')
-# print(f"✅ 저장 완료: {out_path}")
-logger.info(f"✅ 저장 완료: {out_path}")
+# ***************************************
+# version. 20250917. 
+# This process calculates CALPUFF nc file to Li area average
+# add address code number
+# And Unify CALMET nc file and CALPUFF nc file
+# ***************************************
+
+import pandas as pd
+import os
+import netCDF4 as nc
+import numpy as np
+import sys
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from collections import OrderedDict
+import hashlib
+import io
+import json
+import time
+import threading
+try:
+    import resource
+except ImportError: # windows
+    resource = None
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+logger = logging.getLogger(__name__)
+
+# ***************************************
+# set
+# ***************************************
+
+# ===== 오염물질 등록 정보 =====
+# column: 결과 컬럼명, dir: CALPUFF 출력 하위 폴더, var: nc 변수명
+# thresholds: 영향지수 등급 경계 (첫 경계 미만 1등급, ..., 마지막 경계 이상 최고 등급)
+# --species-config 로 같은 형식의 json 목록을 지정하면 기본 목록을 대체 (H2S 등 추가)
+DEFAULT_SPECIES = [
+    {"column": "NH3", "dir": "nc_nh3", "var": "NH3", "thresholds": [50, 100, 200]},
+    {"column": "CO", "dir": "nc_co", "var": "OU", "thresholds": [10, 15, 20]},
+]
+MET_COLS = ['Temperature', 'Relative_Humidity', 'Wind_Speed', 'Wind_Direction']
+
+def load_species(config_file=None):
+    """
+    오염물질 등록 정보 로드 (config_file이 없으면 기본 NH3, CO)
+    """
+    if config_file is None:
+        return DEFAULT_SPECIES
+    with open(config_file, encoding="utf-8") as f:
+        species = json.load(f)
+    for sp in species:
+        missing = {"column", "dir", "var", "thresholds"} - set(sp)
+        if missing:
+            raise ValueError(f"오염물질 설정 항목 누락 {sorted(missing)}: {sp}")
+        if list(sp["thresholds"]) != sorted(sp["thresholds"]):
+            raise ValueError(f"등급 경계는 오름차순이어야 함: {sp}")
+    return species
+
+# ===== 영향지수 등급 함수 =====
+def grade_values(values, thresholds):
+    """
+    등급 경계로 영향지수 등급(1 ~ len(thresholds)+1) 산출
+    결측(NaN)은 기존 등급 함수와 같이 최고 등급
+    """
+    return np.digitize(values, thresholds) + 1
+
+# ===== 격자-리 인덱스 =====
+# 지역 정보 파일(addresses_code_{target}.csv)은 실행마다 바뀌지 않으므로
+# 격자점(cell) -> 리 그룹 매핑을 한 번 만들어 디스크에 저장하고 재사용
+LI_INDEX_VERSION = 5 # 5: 격자-리 매핑을 리, 격자 번호 순으로 정렬 (합산 순서), 희소 행렬 제거
+GRID_KEYS = ['X', 'Y', 'Lat', 'Lon']
+LI_KEYS = ['CTP_KOR_NM', 'CTPRVN_CD', 'SIG_KOR_NM', 'SIG_CD', 'EMD_KOR_NM', 'EMD_CD', 'LI_KOR_NM', 'LI_CD']
+
+# 한 프로세스에서 여러 실행을 처리할 때(배치, 상주 작업 서버) 지역 정보 해시와 인덱스를 메모리에 유지
+# 오래 실행되는 프로세스에서 계속 늘지 않도록 최근 사용한 항목만 유지 (LRU)
+LI_INDEX_MEMO_SIZE = 8 # 지역 x 모델 x 필터 조합 수
+FILE_DIGEST_MEMO_SIZE = 64
+_file_digest_memo = OrderedDict()
+_li_index_memo = OrderedDict()
+
+def memo_get(memo, key):
+    """
+    LRU 메모에서 값 조회 (없으면 None), 조회한 항목은 최근 사용으로 이동
+    """
+    if key not in memo:
+        return None
+    memo.move_to_end(key)
+    return memo[key]
+
+def memo_put(memo, key, value, size):
+    """
+    LRU 메모에 값 저장, size개를 넘으면 가장 오래 사용하지 않은 항목 제거
+    """
+    memo[key] = value
+    memo.move_to_end(key)
+    while len(memo) > size:
+        memo.popitem(last=False)
+
+def file_digest(path):
+    """
+    파일 내용의 sha1 해시 (경로, 크기, 수정 시각이 같으면 이전 결과 재사용)
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    digest = memo_get(_file_digest_memo, memo_key)
+    if digest is None:
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        memo_put(_file_digest_memo, memo_key, digest, FILE_DIGEST_MEMO_SIZE)
+    return digest
+
+def grid_digest(grid_df):
+    """
+    격자 좌표(X, Y, Lat, Lon)의 sha1 해시
+    """
+    h = hashlib.sha1()
+    for col in GRID_KEYS:
+        h.update(np.ascontiguousarray(np.asarray(grid_df[col])).tobytes())
+    return h.hexdigest()
+
+# ===== 지역 필터 =====
+# 대상 지역별 기본 필터 (ns는 논산시만), --sig/--emd로 시군구/읍면동 이름 또는 코드 목록 지정 가능
+# 여러 단계를 지정하면 어느 하나에 해당하는 지역 선택
+REGION_FILTERS = {"ns": {"SIG": ["논산시"]}}
+REGION_LEVELS = {"SIG": ("SIG_KOR_NM", "SIG_CD"), "EMD": ("EMD_KOR_NM", "EMD_CD")}
+
+def resolve_region_filter(target, region_filter=None):
+    """
+    지정한 필터가 없으면(None) 대상 지역 기본 필터, 빈 목록 단계는 제외, 필터가 없으면 빈 dict
+    결과를 다시 넣어도 같은 결과 (빈 dict는 '필터 없음'이므로 기본 필터를 다시 적용하지 않음)
+    """
+    if region_filter is None:
+        region_filter = REGION_FILTERS.get(target)
+    region_filter = {level: [str(v) for v in values] for level, values in (region_filter or {}).items() if values}
+    unknown = set(region_filter) - set(REGION_LEVELS)
+    if unknown:
+        raise ValueError(f"알 수 없는 지역 필터 단계 {sorted(unknown)} (가능: {list(REGION_LEVELS)})")
+    return region_filter
+
+def region_filter_args(sig=None, emd=None):
+    """
+    명령행 --sig/--emd 목록을 지역 필터 dict로 변환, 둘 다 없으면 None (대상 지역 기본 필터)
+    """
+    if not sig and not emd:
+        return None
+    return {level: values for level, values in (("SIG", sig), ("EMD", emd)) if values}
+
+def region_mask(df, region_filter):
+    """
+    지역 필터에 해당하는 행 (이름 또는 코드 일치)
+    """
+    mask = np.zeros(len(df), dtype=bool)
+    for level, values in region_filter.items():
+        name_col, code_col = REGION_LEVELS[level]
+        codes = pd.to_numeric(df[code_col], errors='coerce').astype('Int64').astype(str)
+        mask |= (df[name_col].isin(values) | codes.isin(values)).to_numpy()
+    return mask
+
+def build_li_index(df_region_info, grid_df, region_filter=None):
+    """
+    한 시간분 격자 좌표(grid_df)와 지역 정보를 병합하여 격자점-리 매핑 생성
+    region_filter: 지역 필터 (resolve_region_filter 결과), 해당 지역의 리만 포함
+    반환값: cell(격자 번호), li(리 그룹 번호), weight(가중치) 배열과 리 정보 테이블,
+            격자점 매칭이 없는 리 정보 테이블 (li_unmatched, 면적 가중에서 경계 폴리곤으로 격자 매칭),
+            필터 전 지역 정보의 전체 리 코드 (region_codes)
+    """
+    # 기존 csv 저장/재로드와 동일한 float 키를 얻기 위해 격자 좌표만 한 번 텍스트 변환
+    keys = pd.read_csv(io.StringIO(pd.DataFrame({k: grid_df[k] for k in GRID_KEYS}).to_csv(index=False)))
+    keys['cell'] = np.arange(len(keys))
+
+    merged = pd.merge(df_region_info, keys, how="outer", on=GRID_KEYS)
+    # 격자와 매칭되지 않은 지역 정보 행이 있으면 기존 outer merge 결과에서 Date, Time이 float이 됨
+    time_as_float = bool(merged['cell'].isna().any())
+
+    merged.loc[:, 'LI_KOR_NM'] = merged['LI_KOR_NM'].fillna(merged['EMD_KOR_NM'])
+    merged.loc[:, 'LI_CD'] = merged['LI_CD'].fillna(merged['EMD_CD'])
+    region_codes = pd.unique(merged['LI_CD'].dropna())
+    if region_filter:
+        merged = merged[region_mask(merged, region_filter)]
+
+    # groupby는 키에 결측이 있는 행을 제외하므로 동일하게 제외
+    merged = merged.dropna(subset=LI_KEYS)
+    matched = merged.dropna(subset=['cell'])
+    grouped = matched.groupby(LI_KEYS)
+    li_table = grouped.size().reset_index()[LI_KEYS]
+    unmatched = merged[merged['cell'].isna()][LI_KEYS].drop_duplicates()
+    unmatched = unmatched.merge(li_table, how="left", indicator=True)
+    unmatched = unmatched[unmatched['_merge'] == "left_only"][LI_KEYS].reset_index(drop=True)
+
+    return {
+        'cell': matched['cell'].to_numpy(dtype=np.int64),
+        'li': grouped.ngroup().to_numpy(dtype=np.int64),
+        'weight': np.ones(len(matched)),
+        'li_table': li_table,
+        'li_unmatched': unmatched,
+        'region_codes': region_codes,
+        'time_as_float': time_as_float,
+    }
+
+# ===== 면적 가중 격자-리 인덱스 =====
+# 리 경계 폴리곤(GeoJSON/shapefile)과 격자 셀의 겹침 비율을 가중치로 사용
+# 폴리곤 계산은 느리므로 격자-리 인덱스 캐시에 함께 저장하여 한 번만 계산
+
+def grid_cell_polygons(lat, lon):
+    """
+    격자 중심 위경도(ny x nx)로 셀 경계 사각형 생성 (꼭짓점은 인접 중심 4개의 평균, 가장자리는 외삽)
+    """
+    import shapely
+
+    def corners(a):
+        p = np.pad(a, 1, mode='reflect', reflect_type='odd')
+        return (p[:-1, :-1] + p[1:, :-1] + p[:-1, 1:] + p[1:, 1:]) / 4
+
+    clat, clon = corners(lat), corners(lon)
+    ring = [(slice(None, -1), slice(None, -1)), (slice(None, -1), slice(1, None)),
+            (slice(1, None), slice(1, None)), (slice(1, None), slice(None, -1))]
+    coords = np.stack([np.stack([clon[j, i].ravel(), clat[j, i].ravel()], axis=-1) for j, i in ring], axis=1)
+    return shapely.polygons(coords)
+
+def polygon_li_table(polys, code_col, known_codes, region_filter=None):
+    """
+    지역 정보에 없고(known_codes 밖) 경계 파일에만 있는 리의 정보 테이블 (LI_KEYS 중 경계 파일에 있는 컬럼 사용, 나머지는 결측)
+    region_filter가 있으면 필터 컬럼(SIG/EMD 이름 또는 코드)이 경계 파일에 있을 때만 필터를 적용하여 포함
+    """
+    codes = pd.to_numeric(polys[code_col], errors='coerce')
+    table = pd.DataFrame({k: polys[k].to_numpy() if k in polys else None for k in LI_KEYS})
+    table['LI_CD'] = codes.to_numpy(dtype=float)
+    table = table[codes.notna().to_numpy() & ~codes.isin(known_codes).to_numpy()]
+    if region_filter:
+        columns = [col for level in region_filter for col in REGION_LEVELS[level]]
+        if not any(col in polys for col in columns):
+            return table.iloc[:0]
+        table = table[region_mask(table, region_filter)]
+    return table.drop_duplicates('LI_CD').reset_index(drop=True)
+
+def apply_area_weights(li_index, polygons_file, code_col, grid_df, grid_shape, logger=logger, region_filter=None):
+    """
+    리 경계 폴리곤이 있는 리는 겹치는 모든 격자 셀을 (겹친 면적 / 셀 면적) 가중치로 사용
+    폴리곤이 없는 리는 기존 격자점 매칭(가중치 1) 유지
+    리 목록은 격자점 매칭 리, 격자점 매칭이 없는 지역 정보 리, 경계 파일에만 있는 리의 합집합
+    (격자와 겹치는 셀이 없는 리는 제외), 리 정보 테이블은 기존과 같이 리 정보 순서로 정렬
+    같은 리 코드의 폴리곤이 여러 개면(다중 폴리곤) 모두 해당 리에 사용, 리 정보 테이블의 리 코드가 중복이면 오류
+    """
+    import geopandas as gpd
+
+    polys = gpd.read_file(polygons_file)
+    if code_col not in polys:
+        raise ValueError(f"리 경계 파일에 코드 컬럼 없음: {code_col}")
+    if polys.crs is None:
+        polys = polys.set_crs(4326)
+
+    lat = np.asarray(grid_df['Lat'], dtype=float).reshape(grid_shape)
+    lon = np.asarray(grid_df['Lon'], dtype=float).reshape(grid_shape)
+    cells = gpd.GeoSeries(grid_cell_polygons(lat, lon), crs=4326)
+    # 투영 좌표계 폴리곤이면 셀을 같은 좌표계로 변환하여 면적 계산
+    if polys.crs.is_geographic:
+        polys = polys.to_crs(4326)
+    else:
+        cells = cells.to_crs(polys.crs)
+
+    # 리 목록: 격자점 매칭 리 + 격자점 매칭이 없는 지역 정보 리 + 경계 파일에만 있는 리 (li 번호는 이 순서)
+    li_table = pd.concat([li_index['li_table'], li_index['li_unmatched']], ignore_index=True)
+    li_table = pd.concat([li_table, polygon_li_table(polys, code_col, li_index['region_codes'], region_filter)],
+                         ignore_index=True)
+    li_codes = li_table['LI_CD'].to_numpy(dtype=np.int64)
+    poly_codes = pd.to_numeric(polys[code_col], errors='coerce')
+    polys = polys[poly_codes.isin(li_codes).to_numpy()]
+    # 경계 폴리곤이 있는 리 코드가 지역 정보의 여러 리(이름, 상위 지역이 다름)에 쓰이면 어느 리인지 알 수 없음
+    duplicated = pd.unique(li_codes[pd.Series(li_codes).duplicated().to_numpy()])
+    duplicated = duplicated[np.isin(duplicated, poly_codes)]
+    if len(duplicated):
+        raise ValueError(f"리 경계 매칭 불가: 같은 리 코드(LI_CD)가 지역 정보의 여러 리에 쓰임 {duplicated[:10].tolist()}")
+    li_of_code = pd.Series(np.arange(len(li_codes)), index=li_codes)
+    li_of_code = li_of_code[~li_of_code.index.duplicated()]
+    poly_li = li_of_code.loc[poly_codes[poly_codes.isin(li_codes)].astype(np.int64)].to_numpy()
+
+    cell_idx, poly_idx = polys.sindex.query(cells.values, predicate='intersects')
+    overlap = cells.values[cell_idx].intersection(polys.geometry.values[poly_idx]).area
+    weight = overlap / cells.values[cell_idx].area
+    keep = weight > 0
+
+    has_poly = np.zeros(len(li_codes), dtype=bool)
+    has_poly[poly_li] = True
+    point = ~has_poly[li_index['li']]
+    cell = np.concatenate([li_index['cell'][point], cell_idx[keep].astype(np.int64)])
+    li = np.concatenate([li_index['li'][point], poly_li[poly_idx[keep]]])
+    weight = np.concatenate([li_index['weight'][point], np.asarray(weight)[keep]])
+
+    # 격자와 겹치는 셀이 있는 리만 남기고 리 정보 순서로 li 번호 재부여
+    used = np.zeros(len(li_codes), dtype=bool)
+    used[li] = True
+    order = li_table[used].sort_values(LI_KEYS, kind='stable').index.to_numpy()
+    new_li = np.full(len(li_codes), -1, dtype=np.int64)
+    new_li[order] = np.arange(len(order))
+    logger.info(f"면적 가중 리 {(has_poly & used).sum():,}개 (셀 겹침 {keep.sum():,}건, 격자점 매칭이 없던 리 "
+                f"{(has_poly & used)[len(li_index['li_table']):].sum():,}개 포함), "
+                f"격자점 매칭 유지 리 {(~has_poly & used).sum():,}개")
+
+    return {
+        **li_index,
+        'cell': cell,
+        'li': new_li[li],
+        'weight': weight,
+        'li_table': li_table.loc[order, LI_KEYS].reset_index(drop=True),
+    }
+
+def load_li_index(region_info_file, grid_df, grid_shape, target, cache_dir, logger=logger, li_polygons=None,
+                  region_filter=None):
+    """
+    지역 정보 파일 해시와 격자 크기로 캐시된 격자점-리 인덱스를 불러오고, 없으면 생성 후 저장
+    li_polygons: (리 경계 파일, 리 코드 컬럼)이면 면적 가중 인덱스 (경계 파일 해시도 캐시 키에 포함)
+    region_filter: 지역 필터 (None이면 대상 지역 기본 필터, 빈 dict면 필터 없음)
+    """
+    region_filter = resolve_region_filter(target, region_filter)
+    key_src = f"{LI_INDEX_VERSION}_{file_digest(region_info_file)}_{grid_digest(grid_df)}"
+    key_src += f"_{json.dumps(region_filter, ensure_ascii=False, sort_keys=True)}"
+    if li_polygons:
+        key_src += f"_{file_digest(li_polygons[0])}_{li_polygons[1]}"
+    key = hashlib.sha1(key_src.encode()).hexdigest()[:16]
+    kind = "li_area" if li_polygons else "li_index"
+    cache_file = os.path.join(cache_dir, f"{kind}_{target}_{grid_shape[0]}x{grid_shape[1]}_{key}.pkl")
+
+    li_index = memo_get(_li_index_memo, cache_file)
+    if li_index is not None:
+        logger.info(f"격자-리 인덱스 메모리 재사용: {cache_file}")
+        return li_index
+
+    if os.path.exists(cache_file):
+        logger.info(f"격자-리 인덱스 캐시 사용: {cache_file}")
+        li_index = pd.read_pickle(cache_file)
+    else:
+        logger.info(f"격자-리 인덱스 생성: {cache_file}")
+        li_index = build_li_index(pd.read_csv(region_info_file), grid_df, region_filter)
+        if li_polygons:
+            li_index = apply_area_weights(li_index, *li_polygons, grid_df, grid_shape, logger, region_filter)
+        li_index = sort_li_entries(li_index)
+        li_index['grid_shape'] = tuple(grid_shape)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        pd.to_pickle(li_index, tmp_file)
+        os.replace(tmp_file, cache_file)
+
+    memo_put(_li_index_memo, cache_file, li_index, LI_INDEX_MEMO_SIZE)
+    return li_index
+
+def li_index_bbox(li_index, grid_shape):
+    """
+    리에 쓰이는 격자를 모두 포함하는 행/열 범위 (r0, r1, c0, c1)
+    """
+    rows, cols = np.divmod(li_index['cell'], grid_shape[1])
+    if not len(rows):
+        return 0, 0, 0, 0
+    return int(rows.min()), int(rows.max()) + 1, int(cols.min()), int(cols.max()) + 1
+
+def subset_li_index(li_index, bbox):
+    """
+    격자 번호를 bbox 안의 격자 번호로 바꾼 격자-리 인덱스 (bbox 영역만 읽은 데이터에 사용)
+    bbox 안 격자 번호는 전체 격자 번호와 순서가 같으므로 리별 격자 순서(합산 순서) 유지
+    """
+    r0, r1, c0, c1 = bbox
+    rows, cols = np.divmod(li_index['cell'], li_index['grid_shape'][1])
+    return {**li_index, 'cell': (rows - r0) * (c1 - c0) + (cols - c0), 'bbox': bbox, 'grid_shape': (r1 - r0, c1 - c0)}
+
+def sort_li_entries(li_index):
+    """
+    격자-리 매핑을 리 번호, 격자 번호 순으로 정렬 (리 평균 합산 순서)
+    리마다 격자 번호 순서로 더하므로 행 범위(타일)로 나눠 누적해도 한 번에 누적한 결과와 같음
+    """
+    order = np.lexsort((li_index['cell'], li_index['li']))
+    return {**li_index, 'cell': li_index['cell'][order], 'li': li_index['li'][order],
+            'weight': li_index['weight'][order]}
+
+def new_li_sums(n_rows, n_li):
+    """
+    리별 누적 상태: 가중 합계, 보정 합산(Kahan) 보정값, 유효값 가중치 합, (행 x 리) 배열
+    """
+    return {"sums": np.zeros((n_rows, n_li)), "comp": np.zeros((n_rows, n_li)), "counts": np.zeros((n_rows, n_li))}
+
+def add_li_sums(acc, li_index, values, cell0=0):
+    """
+    (행 x 격자) 배열을 리별 합계에 누적, values의 열은 격자 번호 cell0부터 연속된 격자 (전체 또는 행 범위 타일)
+    리마다 격자 번호 순서로 pandas groupby mean과 같은 보정 합산(Kahan), 결측(NaN)은 평균에서 제외
+    리별 k번째 격자를 모든 리에 대해 한 번에 더함 (반복 횟수 = 범위 안 리별 최대 격자 수)
+    """
+    cells = li_index['cell']
+    sel = np.nonzero((cells >= cell0) & (cells < cell0 + values.shape[1]))[0]
+    sizes = np.bincount(li_index['li'][sel], minlength=acc["sums"].shape[1])
+    starts = np.cumsum(sizes) - sizes
+    sums, comp, counts = acc["sums"], acc["comp"], acc["counts"]
+    for k in range(int(sizes.max()) if len(sel) else 0):
+        li = np.nonzero(sizes > k)[0]
+        entry = sel[starts[li] + k]
+        weight = li_index['weight'][entry]
+        val = values[:, cells[entry] - cell0]
+        valid = ~np.isnan(val)
+        y = val * weight - comp[:, li]
+        t = sums[:, li] + y
+        c = t - sums[:, li] - y
+        comp[:, li] = np.where(valid, np.where(np.isnan(c), 0.0, c), comp[:, li])
+        sums[:, li] = np.where(valid, t, sums[:, li])
+        counts[:, li] += valid * weight
+    return acc
+
+def li_sums_mean(acc):
+    """
+    누적한 리별 합계의 가중 평균 (유효값이 없는 리는 NaN)
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(acc["counts"] > 0, acc["sums"] / acc["counts"], np.nan)
+
+def aggregate_li(li_index, values):
+    """
+    (행 x 격자) 배열을 리 단위 가중 평균 (행 x 리) 배열로 변환
+    행은 시간 또는 (변수, 시간) 묶음, 결측(NaN)은 pandas mean과 같이 평균에서 제외
+    """
+    acc = new_li_sums(values.shape[0], len(li_index['li_table']))
+    return li_sums_mean(add_li_sums(acc, li_index, values))
+
+# 기존 방식은 float32 nc 값을 csv에 최단 10진 표현으로 저장한 뒤 float64로 다시 읽어 평균함
+# 텍스트 변환 없이 nc 값을 그대로 float64로 바꾸면 값마다 float32 반 ulp 이내로 달라지므로
+# 리 평균(등급/단위 변환 전)은 기존 결과와 상대 오차 float32 1 ulp 이내
+LI_MEAN_RTOL = float(np.finfo(np.float32).eps)
+
+def li_means(li_index, df_nc, n_hours, grid_shape, species):
+    """
+    시간별 격자 데이터(df_nc, 시간 순서대로 격자 전체)의 리 단위 평균
+    df_nc는 DataFrame 또는 컬럼별 (시간 x 격자) 배열 dict (compact 모드)
+    nc 값(float32/float64)을 그대로 float64로 바꿔 평균하므로 기존 방식(격자 csv 저장 후 재로드)과는
+    상대 오차 LI_MEAN_RTOL(float32 1 ulp) 이내에서 같음
+    반환값: {컬럼: (시간 x 리) 평균 배열}, 등급/단위 변환 전 값
+    """
+    n_cells = grid_shape[0] * grid_shape[1]
+
+    # 오염물질과 기상 변수를 (변수 x 시간) 행으로 쌓아 한 번에 리 평균 계산
+    columns = [col for col in [sp["column"] for sp in species] + MET_COLS if col in df_nc]
+    values = np.empty((len(columns) * n_hours, n_cells))
+    for i, col in enumerate(columns):
+        values[i * n_hours:(i + 1) * n_hours] = np.asarray(df_nc[col], dtype=np.float64).reshape(n_hours, n_cells)
+    means = aggregate_li(li_index, values)
+    return {col: means[i * n_hours:(i + 1) * n_hours] for i, col in enumerate(columns)}
+
+def li_frame(li_index, means, hours, species):
+    """
+    리 평균(li_means 결과)으로 결과 DataFrame 생성
+    오염물질 등급과 온도 단위(K -> C) 변환까지 적용
+    """
+    li_table = li_index['li_table']
+    n_hours = len(hours)
+    n_li = len(li_table)
+
+    df_grouped = li_table.iloc[np.tile(np.arange(n_li), n_hours)].reset_index(drop=True)
+    time_dtype = float if li_index['time_as_float'] else int
+    df_grouped.insert(0, 'Date', np.repeat([int(d) for d, _ in hours], n_li).astype(time_dtype))
+    df_grouped.insert(1, 'Time', np.repeat([int(t) for _, t in hours], n_li).astype(time_dtype))
+    for col, values in means.items():
+        df_grouped[col] = values.ravel()
+
+    # 오염물질별 영향지수 등급
+    for sp in species:
+        df_grouped[sp["column"]] = grade_values(df_grouped[sp["column"]].to_numpy(), sp["thresholds"])
+
+    # 온도단위 K에서 C로 변환
+    df_grouped['Temperature_C'] = df_grouped['Temperature'] - 273.15
+
+    # 변환한 온도단위 기존의 온도변수에 대입
+    df_grouped['Temperature'] = df_grouped['Temperature_C']
+
+    # 변환할때 쓴 데이터 변수 드롭
+    df_grouped.drop(columns=['Temperature_C'], inplace=True)
+    return df_grouped
+
+def aggregate_hours(li_index, df_nc, hours, grid_shape, species):
+    """
+    시간별 격자 데이터를 리 단위 평균으로 집계하여 결과 DataFrame 반환 (li_means + li_frame)
+    """
+    return li_frame(li_index, li_means(li_index, df_nc, len(hours), grid_shape, species), hours, species)
+
+# ===== 시간별 결과 캐시 =====
+# 예보 시간별 리 평균(등급/단위 변환 전)을 입력 파일 크기/수정 시각과 지역 정보 해시로 만든 키와 함께 저장
+# 재실행 시 입력이 바뀌지 않은 시간은 캐시에서 읽고, 실패했거나 다시 생성된 시간만 처리
+# 등급 경계는 키에 포함하지 않으므로 경계만 바꾼 재실행은 nc를 다시 읽지 않음
+HOUR_CACHE_VERSION = 3 # 3: 리 평균을 nc 값 그대로 계산 (csv 재로드 값 사용 안 함)
+
+def hour_cache_key(species_paths, calmet_file, calmet_index, region_info_file, li_polygons=None, region_filter=None):
+    """
+    한 예보 시간의 캐시 키: 오염물질 nc(컬럼, 변수, 크기, 수정 시각), CALMET 파일과 시간 위치, 지역 정보 해시, 지역 필터
+    """
+    parts = [HOUR_CACHE_VERSION, LI_INDEX_VERSION, file_digest(region_info_file), calmet_index,
+             json.dumps(region_filter, ensure_ascii=False, sort_keys=True)]
+    if li_polygons:
+        parts += [file_digest(li_polygons[0]), li_polygons[1]]
+    for column, var, path in species_paths:
+        st = os.stat(path)
+        parts += [column, var, st.st_size, st.st_mtime_ns]
+    if os.path.exists(calmet_file):
+        st = os.stat(calmet_file)
+        parts += [st.st_size, st.st_mtime_ns]
+    return hashlib.sha1("_".join(map(str, parts)).encode()).hexdigest()
+
+def load_hour_cache(cache_dir, file_name, key):
+    """
+    캐시된 시간별 리 평균 로드, 없거나 키가 다르면(입력 변경) None
+    반환값: (날짜, 시간, {컬럼: 리 평균 1차원 배열})
+    """
+    path = os.path.join(cache_dir, file_name.replace(".nc", ".npz"))
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            if str(data["key"]) != key:
+                return None
+            columns = [str(c) for c in data["columns"]]
+            return str(data["date"]), str(data["time"]), {col: data[f"v_{col}"] for col in columns}
+    except Exception:
+        return None
+
+def save_hour_cache(cache_dir, file_name, key, date_part, time_part, means):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, file_name.replace(".nc", ".npz"))
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, key=key, date=date_part, time=time_part, columns=np.array(list(means)),
+             **{f"v_{col}": values for col, values in means.items()})
+    os.replace(tmp_path, path)
+
+# ===== CALPUFF 시간별 처리 =====
+def species_dirs(calpuff_dir, input_folder_name, species):
+    """
+    오염물질별 CALPUFF nc 폴더 경로
+    """
+    return [os.path.join(calpuff_dir, input_folder_name, sp["dir"]) for sp in species]
+
+def list_common_files(dirs):
+    """
+    모든 오염물질 폴더에 공통으로 있는 nc 파일 이름 (정렬)
+    """
+    common = None
+    for d in dirs:
+        files = set(f for f in os.listdir(d) if f.endswith(".nc"))
+        common = files if common is None else common & files
+    return sorted(common or [])
+
+def hour_of_file(file_name):
+    """
+    CALPUFF 파일 이름에서 (날짜, 시간) 추출
+    """
+    # 날짜와 시간 추출
+    parts = file_name.replace(".nc", "").split("_")  # ['rdaps', '2024091121', '2024091201', 'jb']
+    date_part = parts[2][:8]  # yyyymmdd
+    time_part = parts[2][8:]  # hh
+    return date_part, time_part
+
+def file_time(file_name):
+    """
+    CALPUFF 파일 이름의 시각 (pd.Timestamp)
+    """
+    return pd.to_datetime(file_name.replace(".nc", "").split("_")[2], format="%Y%m%d%H")
+
+def hour_position(file_name, first_file):
+    """
+    CALMET 시간 위치: 첫 CALPUFF 시간 파일(first_file)부터 몇 시간 뒤 파일인지
+    기존 방식과 같이 CALMET 첫 시간은 첫 CALPUFF 시간 파일에 대응 (첫 파일 시각이 실행 기준 시각이든 +1시간이든 같음)
+    중간 시간 파일이 없어도 뒤 시간 파일은 목록 순서가 아니라 파일 시각에 맞는 CALMET 시간 사용
+    일괄 처리와 실시간 모드가 같은 방식 사용
+    """
+    return int((file_time(file_name) - file_time(first_file)) / pd.Timedelta(hours=1))
+
+def bbox_slices(bbox):
+    """
+    (r0, r1, c0, c1) 범위를 (행, 열) slice로 변환, bbox가 없으면 전체
+    """
+    if bbox is None:
+        return slice(None), slice(None)
+    r0, r1, c0, c1 = bbox
+    return slice(r0, r1), slice(c0, c1)
+
+def read_calpuff_grid(ds, bbox=None):
+    """
+    열린 CALPUFF 파일의 격자 좌표를 격자 순서대로 펼친 (X, Y, Lat, Lon), bbox가 있으면 해당 범위만
+    """
+    rows, cols = bbox_slices(bbox)
+    lat = ds.variables['lat'][rows, cols]
+    lon = ds.variables['lon'][rows, cols]
+    x = ds.variables['x'][cols]
+    y = ds.variables['y'][rows]
+
+    # Flatten calpuff data
+    lat_flat = lat.flatten()
+    lon_flat = lon.flatten()
+    x_grid, y_grid = np.meshgrid(x, y)
+    x_flat = x_grid.flatten()
+    y_flat = y_grid.flatten()
+    return x_flat, y_flat, lat_flat, lon_flat
+
+def load_calpuff_hour(species_paths, file_name, compact=False, bbox=None):
+    """
+    한 예보 시간의 오염물질별 nc 파일을 읽어 격자 단위 DataFrame으로 변환
+    species_paths: [(컬럼명, nc 변수명, 파일 경로), ...], 격자 좌표는 첫 파일에서 읽음
+    compact: True면 DataFrame 대신 컬럼별 1차원 배열 dict 반환 (nc 자료형 유지, 최소 float32, 결측은 NaN)
+    bbox: (r0, r1, c0, c1)이면 해당 행/열 범위만 읽음 (지역 필터)
+    반환값: (DataFrame 또는 dict, 날짜, 시간, 격자 크기)
+    """
+    # === load calpuff nc file
+    rows, cols = bbox_slices(bbox)
+    fields = {}
+    for i, (column, var, path) in enumerate(species_paths):
+        with nc.Dataset(path) as ds:
+            fields[column] = ds.variables[var][0, 0, rows, cols]
+            if i == 0: # 오염물질별 격자 동일
+                x_flat, y_flat, lat_flat, lon_flat = read_calpuff_grid(ds, bbox)
+
+    date_part, time_part = hour_of_file(file_name)
+    grid_shape = next(iter(fields.values())).shape
+
+    if compact:
+        # masked 값은 한 번에 NaN으로 채우고 자료형 유지(기존 방식과 같은 값), 날짜/시간은 행마다 반복하지 않음
+        data = {
+            "X": np.ma.filled(x_flat, np.nan),
+            "Y": np.ma.filled(y_flat, np.nan),
+            "Lat": np.ma.filled(lat_flat, np.nan),
+            "Lon": np.ma.filled(lon_flat, np.nan),
+            **{column: np.ma.filled(field.astype(np.promote_types(field.dtype, np.float32)), np.nan).ravel()
+               for column, field in fields.items()}
+        }
+        return data, date_part, time_part, grid_shape
+
+    nc_df = pd.DataFrame({
+        "Date": [date_part] * len(lat_flat),
+        "Time": [time_part] * len(lat_flat),
+        "X": x_flat,
+        "Y": y_flat,
+        "Lat": lat_flat,
+        "Lon": lon_flat,
+        **{column: field.flatten() for column, field in fields.items()}
+    })
+    return nc_df, date_part, time_part, grid_shape
+
+def compact_to_frame(grid, hours, cube):
+    """
+    compact 모드 데이터(격자 좌표 1회분 + 컬럼별 (시간 x 격자) 배열)를 기존 형식의 DataFrame으로 변환
+    날짜/시간은 categorical로 저장 (중간 데이터 저장용)
+    """
+    n_hours = len(hours)
+    n_cells = len(grid["X"])
+    hour_codes = np.repeat(np.arange(n_hours), n_cells)
+    frame = {
+        "Date": pd.Categorical([d for d, _ in hours]).take(hour_codes),
+        "Time": pd.Categorical([t for _, t in hours]).take(hour_codes),
+    }
+    for col in GRID_KEYS:
+        frame[col] = np.tile(np.asarray(grid[col]), n_hours)
+    for col, values in cube.items():
+        frame[col] = values.ravel()
+    return pd.DataFrame(frame)
+
+def full_frame_row_bytes(n_species, with_met):
+    """
+    기존 방식(시간마다 DataFrame) 격자 데이터 한 행의 크기 추정 (문자열 객체 자체 크기는 제외)
+    Date/Time 객체 참조 8바이트씩, 좌표와 오염물질 float32, 기온/습도 float32, 풍속/풍향 float64
+    """
+    return 2 * 8 + len(GRID_KEYS) * 4 + n_species * 4 + (2 * 4 + 2 * 8 if with_met else 0)
+
+# ===== 리 결과 추가 출력 (cube) =====
+CUBE_FORMATS = ["netcdf", "zarr", "parquet"]
+
+def li_result_cube(df_grouped, li_table, hours, species):
+    """
+    리 평균 결과(시간 x 리 순서의 행)를 (time x li) xarray Dataset으로 변환
+    리 정보(시도/시군구/읍면동/리 이름과 코드)는 li 좌표로 한 번만 저장
+    """
+    import xarray as xr
+
+    n_hours = len(hours)
+    n_li = len(li_table)
+    times = pd.to_datetime([f"{d}{t}" for d, t in hours], format="%Y%m%d%H")
+    data_vars = {}
+    for sp in species:
+        data_vars[sp["column"]] = (("time", "li"), df_grouped[sp["column"]].to_numpy(dtype=np.int8).reshape(n_hours, n_li),
+                                   {"long_name": f"{sp['column']} 영향지수 등급", "thresholds": list(sp["thresholds"])})
+    for col in MET_COLS:
+        if col in df_grouped:
+            data_vars[col] = (("time", "li"), df_grouped[col].to_numpy(dtype=np.float64).reshape(n_hours, n_li),
+                              {"long_name": f"리 평균 {col}"})
+    coords = {"time": times, "li": np.arange(n_li)}
+    for key in LI_KEYS:
+        values = li_table[key].to_numpy()
+        coords[key] = ("li", values.astype(str) if values.dtype == object else values)
+    return xr.Dataset(data_vars, coords=coords)
+
+def write_cube_outputs(df_grouped, li_table, hours, species, formats, out_stem, parquet_root, date, target_model,
+                       logger=logger):
+    """
+    csv 외 추가 출력 저장, 실패해도 csv 결과는 유지하고 오류만 기록
+    netcdf/zarr: {out_stem}.nc / .zarr 에 (time x li) cube (압축)
+    parquet: {parquet_root}/model=.../date=.../ 로 분할된 dataset, 행은 리 코드(LI_CD, int64)로 구분
+             리 정보는 실행마다 {parquet_root}_li_meta/model=.../date=.../ 에 같은 분할로 저장 (LI_CD로 결합)
+    """
+    for fmt in formats:
+        try:
+            if fmt in ("netcdf", "zarr"):
+                cube = li_result_cube(df_grouped, li_table, hours, species)
+                if fmt == "netcdf":
+                    path = f"{out_stem}.nc"
+                    encoding = {name: {"zlib": True, "complevel": 4} for name in cube.data_vars}
+                    cube.to_netcdf(path, engine="netcdf4", encoding=encoding)
+                else:
+                    path = f"{out_stem}.zarr"
+                    cube.to_zarr(path, mode="w")
+            elif fmt == "parquet":
+                n_li = len(li_table)
+                if li_table["LI_CD"].duplicated().any():
+                    logger.warning("리 코드(LI_CD)가 중복된 리가 있어 parquet 행을 리 코드로 구분할 수 없음")
+                rows = pd.DataFrame({
+                    "time": np.repeat(pd.to_datetime([f"{d}{t}" for d, t in hours], format="%Y%m%d%H"), n_li),
+                    "LI_CD": df_grouped["LI_CD"].to_numpy(dtype=np.int64),
+                })
+                for col in [sp["column"] for sp in species] + MET_COLS:
+                    if col in df_grouped:
+                        rows[col] = df_grouped[col].to_numpy()
+                rows["model"] = target_model
+                rows["date"] = date
+                os.makedirs(parquet_root, exist_ok=True)
+                rows.to_parquet(parquet_root, index=False, partition_cols=["model", "date"],
+                                existing_data_behavior="delete_matching")
+                # 리 정보도 실행(모델/날짜)별로 저장하여 다른 실행의 리 목록을 덮어쓰지 않음, 코드 컬럼은 정수
+                meta = li_table[LI_KEYS].copy()
+                for key in LI_KEYS:
+                    if key.endswith("_CD"):
+                        meta[key] = pd.to_numeric(meta[key]).astype("Int64")
+                meta["model"] = target_model
+                meta["date"] = date
+                meta.to_parquet(f"{parquet_root}_li_meta", index=False, partition_cols=["model", "date"],
+                                existing_data_behavior="delete_matching")
+                path = os.path.join(parquet_root, f"model={target_model}", f"date={date}")
+            logger.info(f"✅ 추가 출력({fmt}) 저장 완료: {path}")
+        except Exception as e:
+            logger.error(f"Error saving {fmt} output: {e}")
+
+# ===== 중간 데이터 저장 =====
+def dump_intermediate_data(df, path_stem, fmt):
+    """
+    격자 단위 중간 데이터를 지정한 형식으로 저장 (parquet/feather는 pyarrow 필요)
+    """
+    if fmt == "parquet":
+        path = f"{path_stem}.parquet"
+        df.to_parquet(path, index=False)
+    elif fmt == "feather":
+        path = f"{path_stem}.feather"
+        df.to_feather(path)
+    elif fmt == "netcdf":
+        path = f"{path_stem}.nc"
+        with nc.Dataset(path, "w") as ds:
+            ds.createDimension("row", len(df))
+            for col in df.columns:
+                values = np.asarray(df[col])
+                if values.dtype == object: # Date, Time 문자열은 정수로 저장
+                    values = values.astype(np.int64)
+                var = ds.createVariable(col, values.dtype, ("row",), zlib=True, complevel=1)
+                var[:] = values
+    else:
+        path = f"{path_stem}.csv"
+        df.to_csv(path, index=False, encoding='utf-8-sig')
+    return path
+
+# ***************************************
+# logging 설정
+# ***************************************
+
+def setup_run_logger(log_file):
+    """
+    실행(날짜, 모델)별 로거 생성: 로그 파일과 콘솔에 동시에 출력
+    배치에서 여러 실행이 한 프로세스를 공유해도 로그 파일이 섞이지 않도록 실행마다 별도 로거 사용
+    """
+    run_logger = logging.getLogger(f"{__name__}.{log_file}")
+    run_logger.setLevel(logging.INFO)
+    run_logger.propagate = False
+    for handler in list(run_logger.handlers):
+        run_logger.removeHandler(handler)
+        handler.close()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in (logging.FileHandler(log_file, encoding="utf-8"),
+                    logging.StreamHandler(sys.stdout)):  # 콘솔 출력도 동시에
+        handler.setFormatter(formatter)
+        run_logger.addHandler(handler)
+    return run_logger
+
+def close_run_logger(run_logger):
+    for handler in list(run_logger.handlers):
+        run_logger.removeHandler(handler)
+        handler.close()
+
+# ===== 단계별 성능 지표 =====
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+RSS_SAMPLE_INTERVAL = 0.01 # 단계 중 RSS 확인 간격(초)
+
+def current_rss_mb():
+    """
+    현재 프로세스 RSS(MB), /proc 가 없으면 None
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * PAGE_SIZE / 2**20, 1)
+    except (OSError, ValueError, IndexError):
+        return None
+
+def max_rss_mb():
+    """
+    프로세스 시작 이후 최대 RSS(MB, 현재 프로세스와 종료된 작업 프로세스 중 큰 값), 확인 불가하면 None
+    워커 서버/배치처럼 한 프로세스에서 여러 실행을 하면 이전 실행의 최대값도 포함됨
+    """
+    if resource is None:
+        return None
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1 / 2**20 if sys.platform == "darwin" else 1 / 1024 # macOS는 바이트 단위
+    return round(max(self_kb, child_kb) * scale, 1)
+
+class RssSampler(threading.Thread):
+    """
+    단계 실행 중 현재 프로세스 RSS(MB)를 interval초 간격으로 확인하여 최대값 기록 (tracemalloc처럼 실행을 느리게 하지 않음)
+    start_rss/peak: 시작 시 값/최대값, /proc 가 없으면 None
+    """
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.start_rss = current_rss_mb()
+        self.peak = self.start_rss
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        rss = current_rss_mb()
+        if rss is not None:
+            self.peak = rss if self.peak is None else max(self.peak, rss)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.sample()
+        return self.peak
+
+def loaded_nbytes(data):
+    """
+    nc에서 읽은 배열 크기 합(nbytes), data: 배열 dict 또는 DataFrame (숫자 컬럼만, 행마다 반복한 날짜/시간 제외)
+    """
+    if isinstance(data, pd.DataFrame):
+        return int(data.select_dtypes("number").memory_usage(index=False).sum())
+    return int(sum(np.asarray(values).nbytes for values in data.values()))
+
+class RunMetrics:
+    """
+    실행 단계별 경과 시간, CPU 시간, RSS(단계 종료 시 값, 단계 중 증감, 단계 중 최대값), 입출력 행 수,
+    입력 크기(file_bytes: 단계가 여는 nc 파일 크기 합, loaded_bytes: 실제로 읽은 배열 nbytes 합)와
+    예보 시간별 파일 처리 시간 기록
+    로그 파일 옆 calpuff_process_{date}_{model}_metrics.json 으로 저장하여 어느 단계가 느려졌는지 확인
+    단계 최대 RSS는 이 프로세스만 확인 (작업 프로세스 메모리는 요약의 process_max_rss_mb 참고)
+    """
+    def __init__(self, **run_info):
+        self.run_info = run_info
+        self.stages = []
+        self.hours = []
+        self.current = None
+        self._sampler = None
+        self._start = (time.perf_counter(), time.process_time())
+
+    def begin(self, name, **counts):
+        """
+        단계 시작 (진행 중인 이전 단계는 종료), 반환한 dict에 행 수 등을 추가 기록
+        """
+        self.end()
+        self.current = {"stage": name, **counts}
+        self._stage_start = (time.perf_counter(), time.process_time())
+        self._sampler = RssSampler()
+        if self._sampler.start_rss is not None:
+            self._sampler.start()
+        return self.current
+
+    def end(self, **counts):
+        if self.current is None:
+            return
+        wall, cpu = self._stage_start
+        self.current.update(counts)
+        self.current["wall_s"] = round(time.perf_counter() - wall, 4)
+        self.current["cpu_s"] = round(time.process_time() - cpu, 4)
+        peak = self._sampler.stop()
+        rss = current_rss_mb()
+        start_rss = self._sampler.start_rss
+        self.current["rss_mb"] = rss
+        self.current["rss_delta_mb"] = (round(rss - start_rss, 1)
+                                        if rss is not None and start_rss is not None else None)
+        self.current["peak_rss_mb"] = peak
+        self.current["peak_delta_mb"] = (round(peak - start_rss, 1)
+                                         if peak is not None and start_rss is not None else None)
+        self.stages.append(self.current)
+        self.current = None
+        self._sampler = None
+
+    def add_hour(self, file_name, wall_s, cpu_s, file_bytes, loaded_bytes=0, status="ok"):
+        self.hours.append({"file": file_name, "wall_s": round(wall_s, 4), "cpu_s": round(cpu_s, 4),
+                           "file_bytes": file_bytes, "loaded_bytes": loaded_bytes, "status": status})
+
+    def summary(self, status="ok"):
+        if self.current is not None and status != "ok":
+            self.current["status"] = "error" # 오류가 난 단계
+        self.end()
+        wall, cpu = self._start
+        peaks = [st["peak_rss_mb"] for st in self.stages if st["peak_rss_mb"] is not None]
+        return {
+            **self.run_info,
+            "status": status,
+            "wall_s": round(time.perf_counter() - wall, 4),
+            "cpu_s": round(time.process_time() - cpu, 4),
+            "rss_mb": current_rss_mb(),
+            "peak_rss_mb": max(peaks) if peaks else None,
+            "process_max_rss_mb": max_rss_mb(),
+            "file_bytes": sum(st.get("file_bytes", 0) for st in self.stages),
+            "loaded_bytes": sum(st.get("loaded_bytes", 0) for st in self.stages),
+            "stages": self.stages,
+            "hours": self.hours,
+        }
+
+    def write(self, path, status="ok"):
+        metrics = self.summary(status)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(metrics, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+        return metrics
+
+def timed_call(func, *args):
+    """
+    func(*args) 실행 결과와 경과 시간, CPU 시간 반환 (작업 프로세스에서 시간별 처리 시간 측정용)
+    """
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = func(*args)
+    return result, time.perf_counter() - wall, time.process_time() - cpu
+
+def nc_bytes(paths):
+    """
+    입력 파일 크기 합 (지역 필터/타일 처리는 파일 일부만 읽으므로 실제 읽은 양은 loaded_nbytes로 기록)
+    """
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+# ***************************************
+# process
+# ***************************************
+
+# ===== CALMET 처리 =====
+# 담당자 문의 결과 CALMET 영역을 CALPUFF와 맞춰야 한다고 함 (가장자리 10격자 제외)
+CALMET_BORDER = 10
+CALMET_COORD_TOL = 1e-3 # CALPUFF 격자와 비교할 좌표 허용 오차
+CALMET_COORD_VARS = ['x', 'y', 'lat', 'lon'] # CALMET 파일에 있으면 CALPUFF 좌표와 비교
+
+def calmet_grid_shape(ds_calmet):
+    """
+    가장자리를 제외한 CALMET 격자 크기
+    """
+    ny, nx = ds_calmet.variables['T'].shape[-2:]
+    return ny - 2 * CALMET_BORDER, nx - 2 * CALMET_BORDER
+
+def read_calmet_block(ds_calmet, hours, rows=slice(None), cols=slice(None)):
+    """
+    열린 CALMET 파일에서 시간(hours) x 행(rows) x 열(cols) 범위를 읽고 풍속/풍향 계산
+    행/열은 가장자리를 제외한 격자(CALPUFF 격자) 기준
+    반환값: 컬럼별 (time, y, x) 배열 (결측은 NaN)
+    """
+    b = CALMET_BORDER
+    ny, nx = calmet_grid_shape(ds_calmet)
+    r0, r1, _ = rows.indices(ny)
+    c0, c1, _ = cols.indices(nx)
+    ys = slice(b + r0, b + r1)
+    xs = slice(b + c0, b + c1)
+    # 상대습도(RH)는 3차원이 아닌 2차원 데이터
+    calmet_u_wind = ds_calmet.variables['U'][hours, 0, ys, xs]
+    calmet_v_wind = ds_calmet.variables['V'][hours, 0, ys, xs]
+    calmet_temp = ds_calmet.variables['T'][hours, 0, ys, xs]
+    calmet_rh = ds_calmet.variables['RH'][hours, ys, xs]
+
+    # 풍속(wind speed) 계산
+    calmet_wind_speed = np.sqrt(calmet_u_wind**2 + calmet_v_wind**2)
+
+    # 풍향 계산
+    # np.arctan2(v, u)는 y축과 x축 벡터를 인자로 받으며, atan2(y, x)로 계산.
+    # 90도를 더하고 360으로 나눈 나머지를 취하여 북쪽을 0도로 맞춤.
+    calmet_wind_dir = (270 - np.degrees(np.arctan2(calmet_v_wind, calmet_u_wind))) % 360
+
+    return {
+        "Temperature": np.ma.filled(calmet_temp, np.nan),
+        "Relative_Humidity": np.ma.filled(calmet_rh, np.nan),
+        "Wind_Speed": np.ma.filled(calmet_wind_speed, np.nan),
+        "Wind_Direction": np.ma.filled(calmet_wind_dir, np.nan),
+    }
+
+def read_calmet_coords(ds_calmet, bbox=None):
+    """
+    가장자리를 제외한 CALMET 좌표 (파일에 있는 CALMET_COORD_VARS만), bbox가 있으면 해당 범위만
+    """
+    b = CALMET_BORDER
+    rows, cols = bbox_slices(bbox)
+    coords = {}
+    for name in CALMET_COORD_VARS:
+        if name in ds_calmet.variables and ds_calmet.variables[name].ndim in (1, 2):
+            var = ds_calmet.variables[name]
+            if var.ndim == 1:
+                trimmed = var[b:-b][cols if name == 'x' else rows]
+            else:
+                trimmed = var[b:-b, b:-b][rows, cols]
+            coords[name] = np.ma.filled(trimmed.astype(np.float64), np.nan)
+    return coords
+
+def read_calmet(calmet_file, n_hours, logger=logger, bbox=None):
+    """
+    CALMET 파일 로드
+    예보 시간 전체를 (time, y, x) 블록으로 한 번에 읽고 풍속/풍향도 한 번에 계산
+    bbox: (r0, r1, c0, c1)이면 가장자리를 제외한 격자 기준 해당 범위만 읽음 (지역 필터)
+    반환값: {"fields": 컬럼별 블록, "coords": 가장자리 제외한 좌표, "shape": 격자 크기}, 오류 발생 시 None
+    """
+    try:
+        with nc.Dataset(calmet_file) as ds_calmet:
+            rows, cols = bbox_slices(bbox)
+            fields = read_calmet_block(ds_calmet, slice(None, n_hours), rows, cols)
+            coords = read_calmet_coords(ds_calmet, bbox)
+            shape = calmet_grid_shape(ds_calmet)
+            if bbox is not None:
+                if any(v > limit for v, limit in zip((bbox[1], bbox[3]), shape)):
+                    raise ValueError(f"CALMET 격자 {shape} 가 읽을 범위 {bbox} 보다 작음")
+                shape = (bbox[1] - bbox[0], bbox[3] - bbox[2])
+        logger.info(f"✅ CALMET 데이터 추출 완료 {fields['Temperature'].shape}")
+        return {"fields": fields, "coords": coords, "shape": shape}
+
+    except Exception as e:
+        logger.error(f"Error processing CALMET file: {e}")
+        return None
+
+def calmet_nbytes(calmet):
+    """
+    read_calmet 결과에서 읽은 배열 크기 합(nbytes), CALMET이 없으면 0
+    """
+    if not calmet:
+        return 0
+    return loaded_nbytes(calmet["fields"]) + loaded_nbytes(calmet["coords"])
+
+def check_calmet_alignment(calmet, nc_df, grid_shape, tol=CALMET_COORD_TOL):
+    """
+    가장자리를 제외한 CALMET 격자가 CALPUFF 격자와 같은지 실행마다 한 번 확인
+    격자 크기와 (CALMET에 있는) 좌표를 허용 오차 안에서 비교하고, 다르면 ValueError
+    확인이 끝나면 CALMET 값은 CALPUFF 격자 순서 그대로 붙임 (X, Y 병합 없음)
+    반환값: 비교한 좌표 이름 목록
+    """
+    calmet_shape = calmet["shape"]
+    if tuple(calmet_shape) != tuple(grid_shape):
+        raise ValueError(f"CALMET 격자 크기 {tuple(calmet_shape)} 와 CALPUFF 격자 크기 {tuple(grid_shape)} 불일치 "
+                         f"(CALMET 가장자리 {CALMET_BORDER}격자 제외)")
+
+    calpuff_coords = {
+        "x": np.asarray(nc_df["X"], dtype=np.float64).reshape(grid_shape)[0, :],
+        "y": np.asarray(nc_df["Y"], dtype=np.float64).reshape(grid_shape)[:, 0],
+        "lat": np.asarray(nc_df["Lat"], dtype=np.float64).reshape(grid_shape),
+        "lon": np.asarray(nc_df["Lon"], dtype=np.float64).reshape(grid_shape),
+    }
+    for name, values in calmet["coords"].items():
+        expected = calpuff_coords[name]
+        if values.shape != expected.shape:
+            raise ValueError(f"CALMET 좌표 {name} 크기 {values.shape} 와 CALPUFF {expected.shape} 불일치")
+        max_diff = np.nanmax(np.abs(values - expected)) if values.size else 0.0
+        if not max_diff <= tol:
+            raise ValueError(f"CALMET 좌표 {name} 불일치: 최대 차이 {max_diff:g} (허용 오차 {tol:g})")
+    return list(calmet["coords"])
+
+def attach_calmet_hour(nc_df, calmet, i):
+    """
+    미리 읽어 둔 CALMET 블록에서 해당 시간(i)을 잘라 CALPUFF 격자 순서대로 붙임
+    """
+    for col, block in calmet["fields"].items():
+        nc_df[col] = block[i].ravel()
+
+def stable_files(dirs, prev_stats):
+    """
+    모든 오염물질 폴더에 있고 이전 확인 이후 크기/수정 시각이 변하지 않은(쓰기 완료된) nc 파일 이름
+    반환값: (완료 파일 목록, 이번 확인의 파일 상태)
+    """
+    stats = {}
+    for f in list_common_files(dirs):
+        try:
+            st = [os.stat(os.path.join(d, f)) for d in dirs]
+        except FileNotFoundError:
+            continue
+        stats[f] = tuple((x.st_size, x.st_mtime_ns) for x in st)
+    done = sorted(f for f, st in stats.items() if prev_stats.get(f) == st and all(size > 0 for size, _ in st))
+    return done, stats
+
+def _follow_index(logger, metrics, *, calpuff_dirs, species, files_num, calmet_file, region_info_file, target,
+                  target_model, li_index_cache_dir, output_dir, calmet_coord_tol, poll_interval, timeout,
+                  cube_output, output_root, date, li_polygons, region_filter):
+    """
+    실시간 모드: 오염물질 폴더를 poll_interval초마다 확인하여 쓰기 완료된 시간 파일을 바로 처리하고
+    해당 시간의 리 평균을 결과 csv에 이어 씀. files_num개를 처리하거나 timeout초가 지나면 종료
+    처리 중 결과는 *_index_li.partial.csv 에 쓰고 종료 시 기존 결과 파일 이름으로 변경
+    """
+    logger.info(f"[4] 실시간 모드 시작: {files_num}개 시간 대기 (확인 간격 {poll_interval}초, 제한 {timeout}초)")
+    os.makedirs(output_dir, exist_ok=True)
+
+    calmet_stage = metrics.begin("read_calmet", file_bytes=nc_bytes([calmet_file]))
+    calmet = read_calmet(calmet_file, files_num, logger)
+    calmet_stage["loaded_bytes"] = calmet_nbytes(calmet)
+    follow_stage = metrics.begin("follow", files_in=0, rows_out=0, file_bytes=0, loaded_bytes=0)
+    li_index = None
+    grid_shape = None
+    partial_path = None
+    hour_rows = {} # 파일 이름별 시간 리 평균 (늦게 도착한 앞 시간이 있으면 시간 순서로 다시 씀, 추가 출력용)
+    seen = [] # 처리(또는 오류 처리)한 파일
+    skipped = set() # 기대하는 시간 목록 밖의 파일
+    prev_stats = {}
+    first_file = None # CALMET 첫 시간에 대응하는 파일 (처음 확인된 완료 파일 중 가장 이른 시간)
+    deadline = time.monotonic() + timeout
+
+    while len(seen) < files_num:
+        done, prev_stats = stable_files(calpuff_dirs, prev_stats)
+        new_files = [f for f in done if f not in seen and f not in skipped]
+        if first_file is None and new_files:
+            first_file = new_files[0]
+        for file_name in new_files:
+            if len(seen) >= files_num:
+                break
+            # CALMET 시간 위치는 도착 순서가 아니라 파일 시각으로 정함 (앞 시간 파일이 늦게 도착해도 같은 시간 사용)
+            try:
+                i = hour_position(file_name, first_file)
+            except (IndexError, ValueError):
+                i = -1
+            if not 0 <= i < files_num:
+                logger.warning(f"기대하는 {files_num}개 시간 밖의 파일이라 건너뜀: {file_name}")
+                skipped.add(file_name)
+                continue
+            seen.append(file_name)
+            species_paths = [(sp["column"], sp["var"], os.path.join(d, file_name)) for sp, d in zip(species, calpuff_dirs)]
+            logger.info(f"{species_paths[0][2]}")
+            hour_start = (time.perf_counter(), time.process_time())
+            hour_bytes = nc_bytes([path for _, _, path in species_paths])
+            follow_stage["files_in"] += 1
+            follow_stage["file_bytes"] += hour_bytes
+            try:
+                nc_df, date_part, time_part, hour_shape = load_calpuff_hour(species_paths, file_name)
+                hour_loaded = loaded_nbytes(nc_df)
+                follow_stage["loaded_bytes"] += hour_loaded
+                if grid_shape is not None and hour_shape != grid_shape:
+                    raise ValueError(f"격자 크기 {hour_shape} 가 이전 시간 {grid_shape} 와 다름")
+            except Exception as e:
+                logger.error(f"Error processing {file_name}: {e}")
+                metrics.add_hour(file_name, 0.0, 0.0, hour_bytes, status=f"error: {e}")
+                continue
+
+            if grid_shape is None:
+                # === CALMET 격자 정합 확인과 격자-리 인덱스 로드 (첫 시간에 한 번)
+                if calmet:
+                    try:
+                        checked = check_calmet_alignment(calmet, nc_df, hour_shape, calmet_coord_tol)
+                    except ValueError as e:
+                        logger.error(f"❌ CALMET/CALPUFF 격자 불일치: {e}")
+                        raise
+                    logger.info(f"CALMET/CALPUFF 격자 일치 확인 {hour_shape}, 비교 좌표: {checked or '없음(격자 크기만 확인)'}")
+                li_index = load_li_index(region_info_file, nc_df, hour_shape, target, li_index_cache_dir, logger,
+                                         li_polygons, region_filter)
+                grid_shape = hour_shape
+
+            try:
+                if calmet:
+                    attach_calmet_hour(nc_df, calmet, i)
+            except Exception as e:
+                logger.error(f"Error processing {file_name}: {e}")
+                metrics.add_hour(file_name, 0.0, 0.0, hour_bytes, hour_loaded, status=f"error: {e}")
+                continue
+
+            df_hour = aggregate_hours(li_index, nc_df, [(date_part, time_part)], grid_shape, species)
+            if partial_path is None:
+                partial_path = os.path.join(
+                    output_dir, f"{target_model}_{file_name.split('_')[-2]}_index_li.partial.csv")
+            if not hour_rows or file_name > max(hour_rows):
+                hour_rows[file_name] = df_hour
+                if len(hour_rows) == 1:
+                    df_hour.to_csv(partial_path, index=False, encoding='utf-8-sig')
+                else:
+                    # utf-8-sig로 이어 쓰면 BOM이 중간에 다시 들어가므로 utf-8 사용
+                    df_hour.to_csv(partial_path, index=False, header=False, mode='a', encoding='utf-8')
+            else:
+                # 앞 시간 파일이 늦게 도착: 지금까지의 결과를 시간 순서로 다시 씀
+                logger.warning(f"이미 처리한 시간보다 앞선 파일이 늦게 도착하여 시간 순서로 다시 저장: {file_name}")
+                hour_rows[file_name] = df_hour
+                pd.concat([hour_rows[f] for f in sorted(hour_rows)], ignore_index=True).to_csv(
+                    partial_path, index=False, encoding='utf-8-sig')
+            follow_stage["rows_out"] += len(df_hour)
+            metrics.add_hour(file_name, time.perf_counter() - hour_start[0], time.process_time() - hour_start[1],
+                             hour_bytes, hour_loaded)
+            logger.info(f"[6] {date_part} {time_part}시 리 평균 {len(df_hour):,}건 추가 ({len(seen)}/{files_num})")
+
+        if len(seen) >= files_num:
+            break
+        if time.monotonic() >= deadline:
+            logger.warning(f"실시간 모드 제한 시간 {timeout}초 초과: {len(seen)}/{files_num}개 시간만 처리")
+            break
+        time.sleep(poll_interval)
+
+    if partial_path is None:
+        logger.error("❌ 처리된 CALPUFF 시간 파일 없음")
+        raise RuntimeError("❌ 처리된 CALPUFF 시간 파일 없음")
+
+    # print(f"[7] 리 평균 csv 저장")
+    logger.info(f"[7] 리 평균 csv 저장")
+    metrics.begin("save_csv", rows_out=follow_stage["rows_out"])
+    csv_name_sdate = min(hour_rows).split('_')[-2]
+    csv_name_edate = max(hour_rows).split('_')[-2]
+    out_path = os.path.join(output_dir, f"{target_model}_{csv_name_sdate}_{csv_name_edate}_index_li.csv")
+    os.replace(partial_path, out_path)
+    logger.info(f"✅ 저장 완료: {out_path}")
+
+    if cube_output:
+        metrics.begin("cube_output", rows_out=follow_stage["rows_out"])
+        cube_hours = [hour_of_file(f) for f in sorted(hour_rows)]
+        write_cube_outputs(pd.concat([hour_rows[f] for f in sorted(hour_rows)], ignore_index=True),
+                           li_index['li_table'], cube_hours, species,
+                           cube_output, out_path[:-len(".csv")], f"{output_root}/index_li_parquet", date,
+                           target_model, logger)
+    return out_path
+
+def run_index(date, target, target_model, calmet_dir, calpuff_dir, info_dir, output_root,
+              workers=1, dump_intermediate=None, species=None, calmet_coord_tol=CALMET_COORD_TOL,
+              follow=False, poll_interval=30, timeout=3 * 3600, compact=False, cube_output=None,
+              li_polygons=None, li_polygon_code="LI_CD", hour_cache=False, memory_budget=None, region_filter=None):
+    """
+    한 실행(날짜, 지역, 모델)의 리 단위 영향지수 산출 후 csv 저장
+    species: 오염물질 등록 정보 목록 (기본: DEFAULT_SPECIES)
+    calmet_coord_tol: CALMET/CALPUFF 좌표 비교 허용 오차
+    follow: True면 CALPUFF 시간 파일이 도착하는 대로 처리 (poll_interval초 간격, timeout초 제한)
+    compact: True면 격자 데이터를 컬럼별 시간 x 격자 배열로 보관하여 메모리 절감
+    cube_output: csv 외 추가 출력 형식 목록 (CUBE_FORMATS 중)
+    li_polygons: 리 경계 파일(GeoJSON/shapefile)이면 격자 셀 겹침 면적 가중 평균 (li_polygon_code: 리 코드 컬럼)
+    hour_cache: True면 시간별 리 평균을 캐시하고 입력이 바뀌지 않은 시간은 다시 처리하지 않음
+    memory_budget: 작업 메모리 예산(MB), 지정하면 시간 묶음 x 행 범위 단위 타일 처리
+    region_filter: 지역 필터 {"SIG": [...], "EMD": [...]} (이름 또는 코드), None이면 대상 지역 기본 필터(ns: 논산시),
+                   빈 dict면 필터 없이 지역 정보 전체
+                   필터가 있으면 해당 지역 리가 있는 격자 범위만 읽음 (실시간 모드는 전체 격자)
+    반환값: 저장한 csv 경로
+    """
+    # log_dir = "./logs"
+    log_dir = f"{output_root}/{date}/{target_model}"
+    os.makedirs(log_dir, exist_ok=True)
+
+    log_file = os.path.join(log_dir, f"calpuff_process_{date}_{target_model}.log")
+    logger = setup_run_logger(log_file)
+    logger.info(log_file)
+    metrics = RunMetrics(date=date, target=target, model=target_model, workers=workers, compact=compact,
+                         follow=follow, memory_budget_mb=memory_budget)
+    metrics_file = os.path.join(log_dir, f"calpuff_process_{date}_{target_model}_metrics.json")
+    status = "ok"
+    try:
+        return _run_index(logger, metrics, date=date, target=target, target_model=target_model,
+                          calmet_dir=calmet_dir, calpuff_dir=calpuff_dir, info_dir=info_dir, output_root=output_root,
+                          workers=workers, dump_intermediate=dump_intermediate, species=species or DEFAULT_SPECIES,
+                          calmet_coord_tol=calmet_coord_tol, follow=follow, poll_interval=poll_interval,
+                          timeout=timeout, compact=compact, cube_output=cube_output or [],
+                          li_polygons=(li_polygons, li_polygon_code) if li_polygons else None,
+                          hour_cache=hour_cache, memory_budget=memory_budget,
+                          region_filter=resolve_region_filter(target, region_filter))
+    except Exception as e:
+        status = f"error: {e}"
+        raise
+    finally:
+        try:
+            summary = metrics.write(metrics_file, status)
+            logger.info(f"[9] 성능 지표 저장: {metrics_file} (전체 {summary['wall_s']:.1f}초, "
+                        + ", ".join(f"{st['stage']} {st['wall_s']:.1f}초" for st in summary['stages']) + ")")
+        except Exception as e:
+            logger.error(f"Error saving metrics: {e}")
+        close_run_logger(logger)
+
+# ===== 지역 필터 격자 범위 =====
+def load_region_index(logger, hour_jobs, calmet_file, region_info_file, target, li_index_cache_dir, li_polygons,
+                      region_filter):
+    """
+    첫 시간 파일의 전체 격자로 지역 필터를 적용한 격자-리 인덱스를 만들고 리가 있는 격자 범위(bbox)로 자름
+    CALMET 격자 크기는 자르기 전에 전체 격자와 비교 (범위 안 좌표는 읽은 뒤 기존과 같이 비교)
+    반환값: bbox 기준 격자-리 인덱스 (li_index['bbox'] = (r0, r1, c0, c1))
+    """
+    species_paths, _ = hour_jobs[0]
+    with nc.Dataset(species_paths[0][2]) as ds:
+        x_flat, y_flat, lat_flat, lon_flat = read_calpuff_grid(ds)
+        grid_shape = tuple(ds.variables[species_paths[0][1]].shape[-2:])
+    grid = pd.DataFrame({"X": x_flat, "Y": y_flat, "Lat": lat_flat, "Lon": lon_flat})
+
+    if os.path.exists(calmet_file):
+        with nc.Dataset(calmet_file) as ds_calmet:
+            calmet_shape = calmet_grid_shape(ds_calmet)
+        if calmet_shape != grid_shape:
+            logger.error(f"❌ CALMET/CALPUFF 격자 불일치: 격자 크기 다름 CALMET {calmet_shape}, CALPUFF {grid_shape}")
+            raise ValueError(f"격자 크기 다름 CALMET {calmet_shape}, CALPUFF {grid_shape}")
+
+    li_index = load_li_index(region_info_file, grid, grid_shape, target, li_index_cache_dir, logger, li_polygons,
+                             region_filter)
+    if not len(li_index['cell']):
+        logger.error(f"❌ 지역 필터에 해당하는 격자 없음: {region_filter}")
+        raise ValueError(f"지역 필터에 해당하는 격자 없음: {region_filter}")
+    bbox = li_index_bbox(li_index, grid_shape)
+    sub = subset_li_index(li_index, bbox)
+    n_sub = sub['grid_shape'][0] * sub['grid_shape'][1]
+    logger.info(f"지역 필터 {region_filter} → 격자 범위 행 {bbox[0]}~{bbox[1]}, 열 {bbox[2]}~{bbox[3]} "
+                f"({n_sub:,}/{grid_shape[0] * grid_shape[1]:,}개 격자만 읽음)")
+    return sub
+
+# ===== 타일 처리 (메모리 제한) =====
+# 격자가 커서 전체 시간 x 전체 격자를 메모리에 올릴 수 없을 때 사용
+# 시간 묶음(chunk)과 행 범위(tile)로 nc 일부(hyperslab)만 읽어 리별 합계/개수에 누적
+TILE_BYTES_PER_VALUE = 40 # 변수 1개 격자 1개당 작업 메모리 추정 (읽기, masked, float64 변환, 유효값 배열)
+
+def plan_tiles(grid_shape, n_vars, n_hours, memory_budget_mb):
+    """
+    메모리 예산 안에서 한 번에 처리할 시간 수와 행 수
+    한 시간 전체 격자가 예산 안이면 여러 시간을 묶고, 아니면 한 시간씩 행 범위로 나눔
+    """
+    ny, nx = grid_shape
+    budget = memory_budget_mb * 2**20
+    row_bytes = nx * n_vars * TILE_BYTES_PER_VALUE
+    hour_bytes = ny * row_bytes
+    if hour_bytes <= budget:
+        return max(1, min(n_hours, int(budget // hour_bytes))), ny
+    return 1, max(1, int(budget // row_bytes))
+
+def _tiled_index(logger, metrics, *, hour_jobs, calmet_file, region_info_file, target, li_index_cache_dir,
+                 li_polygons, species, calmet_coord_tol, memory_budget_mb, output_root, date, target_model,
+                 csv_name_sdate, csv_name_edate, cube_output, positions, region_filter, region_index=None):
+    """
+    타일 처리 모드: 전체 격자 DataFrame을 만들지 않고 시간 묶음 x 행 범위 단위로 읽어 리 평균 산출
+    행 범위마다 해당 격자의 리별 합계/개수를 누적(add_li_sums)하고 시간 묶음이 끝나면 평균 계산
+    리마다 격자 번호 순서로 누적하므로 결과는 타일 처리를 하지 않은 실행과 같음
+    positions: 시간 파일별 CALMET 시간 위치 (hour_position)
+    region_filter: 지역 필터 (resolve_region_filter 결과, 빈 dict면 지역 정보 전체)
+    region_index: 지역 필터 격자-리 인덱스(load_region_index)이면 해당 격자 범위 안에서만 타일 처리
+    """
+    # === 격자 좌표와 격자-리 인덱스 (첫 시간 파일 기준)
+    metrics.begin("li_index")
+    bbox = region_index['bbox'] if region_index else None
+    with nc.Dataset(hour_jobs[0][0][0][2]) as ds:
+        x_flat, y_flat, lat_flat, lon_flat = read_calpuff_grid(ds, bbox)
+        file_shape = ds.variables[hour_jobs[0][0][0][1]].shape[-2:]
+    grid = pd.DataFrame({"X": x_flat, "Y": y_flat, "Lat": lat_flat, "Lon": lon_flat})
+    if region_index:
+        li_index = region_index
+        grid_shape = li_index['grid_shape']
+    else:
+        li_index = load_li_index(region_info_file, grid, file_shape, target, li_index_cache_dir, logger, li_polygons,
+                                 region_filter)
+        grid_shape = file_shape
+    rows, cols = bbox_slices(bbox)
+    row0 = rows.start or 0
+    li_table = li_index['li_table']
+    metrics.end(rows_out=len(li_table))
+    logger.info(f"격자-리 인덱스 → 리 {len(li_table):,}개, 격자 매칭 {len(li_index['cell']):,}건")
+    ny, nx = grid_shape
+
+    # === CALMET 격자 정합 확인 (값은 타일마다 읽음)
+    ds_calmet = None
+    try:
+        ds_calmet = nc.Dataset(calmet_file)
+        # bbox가 있으면 전체 격자 크기는 load_region_index에서 확인함
+        calmet = {"coords": read_calmet_coords(ds_calmet, bbox),
+                  "shape": tuple(grid_shape) if bbox else calmet_grid_shape(ds_calmet)}
+    except Exception as e:
+        logger.error(f"Error processing CALMET file: {e}")
+        if ds_calmet is not None:
+            ds_calmet.close()
+        ds_calmet = calmet = None
+    if calmet:
+        try:
+            checked = check_calmet_alignment(calmet, grid, grid_shape, calmet_coord_tol)
+        except ValueError as e:
+            ds_calmet.close()
+            logger.error(f"❌ CALMET/CALPUFF 격자 불일치: {e}")
+            raise
+        logger.info(f"CALMET/CALPUFF 격자 일치 확인 {grid_shape}, 비교 좌표: {checked or '없음(격자 크기만 확인)'}")
+
+    columns = [sp["column"] for sp in species] + (MET_COLS if calmet else [])
+    chunk_hours, tile_rows = plan_tiles(grid_shape, len(columns), len(hour_jobs), memory_budget_mb)
+    logger.info(f"[4] 타일 처리: 메모리 예산 {memory_budget_mb:,} MB → {chunk_hours}시간 x {tile_rows}행 단위 "
+                f"(격자 {ny}x{nx})")
+
+    # === 시간 묶음 x 행 범위별 읽기와 리별 합계/개수 누적
+    stage = metrics.begin("tiled_aggregate", files_in=len(hour_jobs), file_bytes=0, loaded_bytes=0, rows_in=0,
+                          chunk_hours=chunk_hours, tile_rows=tile_rows)
+    hours = []
+    hour_means = []
+    n_li = len(li_table)
+    try:
+        for c0 in range(0, len(hour_jobs), chunk_hours):
+            chunk = list(zip(positions, hour_jobs))[c0:c0 + chunk_hours]
+            chunk_start = (time.perf_counter(), time.process_time())
+            failed = set()
+            hour_loaded = dict.fromkeys(range(len(chunk)), 0)
+            acc = new_li_sums(len(columns) * len(chunk), n_li)
+            for r0 in range(0, ny, tile_rows):
+                r1 = min(ny, r0 + tile_rows)
+                values = np.full((len(columns) * len(chunk), (r1 - r0) * nx), np.nan)
+                for k, (i, (species_paths, file_name)) in enumerate(chunk):
+                    if file_name in failed:
+                        continue
+                    try:
+                        for j, (column, var, path) in enumerate(species_paths):
+                            with nc.Dataset(path) as ds:
+                                if ds.variables[var].shape[-2:] != file_shape:
+                                    raise ValueError(f"격자 크기 {ds.variables[var].shape[-2:]} 가 "
+                                                     f"첫 시간 {file_shape} 와 다름")
+                                field = ds.variables[var][0, 0, row0 + r0:row0 + r1, cols]
+                            hour_loaded[k] += np.asarray(field).nbytes
+                            values[j * len(chunk) + k] = np.ma.filled(field, np.nan).ravel()
+                    except Exception as e:
+                        logger.error(f"Error processing {file_name}: {e}")
+                        metrics.add_hour(file_name, 0.0, 0.0, nc_bytes([p for _, _, p in species_paths]),
+                                         hour_loaded[k], status=f"error: {e}")
+                        failed.add(file_name)
+                if calmet:
+                    i0, i1 = chunk[0][0], chunk[-1][0] + 1
+                    block = read_calmet_block(ds_calmet, slice(i0, i1), slice(row0 + r0, row0 + r1), cols)
+                    stage["loaded_bytes"] += loaded_nbytes(block)
+                    picks = [i - i0 for i, _ in chunk] # 빠진 시간 파일이 있으면 해당 CALMET 시간은 건너뜀
+                    for j, col in enumerate(MET_COLS, start=len(species)):
+                        values[j * len(chunk):(j + 1) * len(chunk)] = block[col][picks].reshape(len(chunk), -1)
+
+                add_li_sums(acc, li_index, values, cell0=r0 * nx)
+                stage["rows_in"] += values.shape[0] // len(columns) * values.shape[1]
+
+            stage["loaded_bytes"] += sum(hour_loaded.values())
+            means = li_sums_mean(acc)
+            chunk_wall = time.perf_counter() - chunk_start[0]
+            chunk_cpu = time.process_time() - chunk_start[1]
+            for k, (i, (species_paths, file_name)) in enumerate(chunk):
+                if file_name in failed:
+                    continue
+                hour_bytes = nc_bytes([p for _, _, p in species_paths])
+                stage["file_bytes"] += hour_bytes
+                metrics.add_hour(file_name, chunk_wall / len(chunk), chunk_cpu / len(chunk), hour_bytes,
+                                 hour_loaded[k])
+                hours.append(hour_of_file(file_name))
+                hour_means.append({col: means[j * len(chunk) + k] for j, col in enumerate(columns)})
+            logger.info(f"{chunk[-1][1][1]} 까지 {len(hours)}/{len(hour_jobs)}개 시간 처리")
+    finally:
+        if ds_calmet is not None:
+            ds_calmet.close()
+
+    if not hours:
+        logger.error("❌ 처리된 CALPUFF 시간 파일 없음")
+        raise RuntimeError("❌ 처리된 CALPUFF 시간 파일 없음")
+
+    logger.info(f"[6] 리 단위 평균 산출")
+    metrics.begin("aggregate", rows_in=len(hours) * n_li)
+    means = {col: np.stack([row[col] for row in hour_means]) for col in columns}
+    df_grouped = li_frame(li_index, means, hours, species)
+    metrics.end(rows_out=len(df_grouped))
+    return save_li_result(logger, metrics, df_grouped, li_table, hours, species, output_root, date, target_model,
+                          csv_name_sdate, csv_name_edate, cube_output)
+
+def save_li_result(logger, metrics, df_grouped, li_table, hours, species, output_root, date, target_model,
+                   csv_name_sdate, csv_name_edate, cube_output):
+    """
+    리 평균 결과 csv(와 추가 출력) 저장, 반환값: csv 경로
+    """
+    # print(f"[7] 리 평균 csv 저장")
+    logger.info(f"[7] 리 평균 csv 저장")
+    output_dir = f"{output_root}/{date}/{target_model}"
+    output_name = f"{target_model}_{csv_name_sdate}_{csv_name_edate}_index_li.csv" # ex. {target_model}_20250702122_2025070223_index.csv
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        # print(f"[8] 출력 디렉토리 생성됨: {output_dir}")
+        logger.info(f"[8] 출력 디렉토리 생성됨: {output_dir}")
+    else:
+        # print(f"[8] 출력 디렉토리 존재 확인됨")
+        logger.info(f"[8] 출력 디렉토리 존재 확인됨")
+
+    out_path = os.path.join(output_dir, output_name)
+    metrics.begin("save_csv", rows_out=len(df_grouped))
+    df_grouped.to_csv(out_path, index=False, encoding='utf-8-sig')
+    # print(f"✅ 저장 완료: {out_path}")
+    logger.info(f"✅ 저장 완료: {out_path}")
+
+    if cube_output:
+        metrics.begin("cube_output", rows_out=len(df_grouped))
+        write_cube_outputs(df_grouped, li_table, hours, species, cube_output, out_path[:-len(".csv")],
+                           f"{output_root}/index_li_parquet", date, target_model, logger)
+    return out_path
+
+def _run_index(logger, metrics, *, date, target, target_model, calmet_dir, calpuff_dir, info_dir, output_root,
+               workers, dump_intermediate, species, calmet_coord_tol, follow, poll_interval, timeout, compact,
+               cube_output, li_polygons, hour_cache, memory_budget, region_filter):
+    # =====   사용자 설정   =====
+    # print(f"[1] 영향지수 생산 시작 ")
+    logger.info("[1] 영향지수 생산 시작")
+    metrics.begin("check_inputs")
+    if memory_budget is not None and memory_budget <= 0:
+        logger.error(f"❌ 메모리 예산은 1 MB 이상이어야 함: {memory_budget}")
+        raise ValueError(f"메모리 예산은 1 MB 이상이어야 함: {memory_budget}")
+    # date smaple: klaps 2024091203, rdaps 2024091121
+    # target 'jb' or 'ns'
+    # target_model "klaps" or "rdaps"
+
+    # === input - CALMET nc file
+    input_dir = calmet_dir # CALMET nc file ex: /windlidar/model_output/CALMET/2024091121_rdaps_ns/
+    input_folder_name = f"{date}_{target_model}_{target}" # nc file
+    calmet_file = os.path.join(input_dir, input_folder_name, f"{target_model}_{date}_{target}.nc")
+
+    # === input - CALPUFF nc file
+    input_dir2 = calpuff_dir # CALPUFF nc file ex: /windlidar/model_output/CALPUFF/2024091121_rdaps_ns/nc_nh3/ (오염물질별 하위 폴더)
+
+    # === latlon-address information file for Li average
+    region_info_file = f"{info_dir}/addresses_code_{target}.csv"
+
+    # print(f"[1] input nc폴더: {input_folder_name}, 지역: {target}, 모델: {target_model}, 날짜 = {date}")
+    logger.info(f"[1] input nc폴더: {input_folder_name}, 지역: {target}, 모델: {target_model}, 날짜 = {date}")
+
+
+    # === set case
+    if target_model == "klaps": # set model fcst time numbur
+        # files_num = 12
+        files_num = 13
+    else:
+        # files_num = 48
+        files_num = 49
+
+
+    # =====   nc 경로 지정   =====
+    calpuff_dirs = species_dirs(input_dir2, input_folder_name, species)
+
+    if follow:
+        # 실시간 모드에서는 CALPUFF가 폴더를 만들 때까지 대기
+        deadline = time.monotonic() + timeout
+        while not all(os.path.exists(d) for d in calpuff_dirs) and time.monotonic() < deadline:
+            time.sleep(poll_interval)
+
+    for sp, sp_dir in zip(species, calpuff_dirs):
+        if not os.path.exists(sp_dir):
+            logger.error(f"❌ {sp['column']} 폴더 없음: {sp_dir}")
+            raise FileNotFoundError(f"❌ {sp['column']} 폴더 없음: {sp_dir}")
+    if not os.path.exists(calmet_file):
+        logger.error(f"❌ CALMET 파일 없음: {calmet_file}")
+        raise FileNotFoundError(f"❌ CALMET 파일 없음: {calmet_file}")
+
+    logger.info(f"[2] 폴더 경로 확인 완료")
+    for sp, sp_dir in zip(species, calpuff_dirs):
+        logger.info(f"{sp['dir']} = {sp_dir}")
+    logger.info(f"calmet_file = {calmet_file}")
+    # print(f"[2] 폴더 경로 확인 완료")
+    # print(f"nh3_dir = {nh3_dir}")
+    # print(f"co_dir = {co_dir}")
+
+    # =====   결과 저장 리스트   =====
+    nc_all_data = []
+    hours = [] # 처리 완료된 (날짜, 시간)
+    grid_shape = None
+
+    # ***************************************
+    # process - load and merge
+    # ***************************************
+
+    # =====   오염물질별(NH3, CO, ...) 파일 이름 매칭 후 처리   =====
+    # klaps forecast 12h, file nums 12 / rdaps forecast 48h, file nums 48
+    # 첫 시간 파일부터 files_num시간 안의 파일 (실시간 모드와 같은 시간 위치 사용, 빠진 시간이 없으면 기존 목록과 같음)
+    common_files = list_common_files(calpuff_dirs)
+    common_files = [f for f in common_files if hour_position(f, common_files[0]) < files_num]
+    positions = [hour_position(f, common_files[0]) for f in common_files] # CALMET 시간 위치
+
+    # === 지역 정보 불러오기 (격자-리 인덱스는 격자 확인 후 로드)
+    logger.info(f"[3] 지역 정보 파일 로드 중: {region_info_file}")
+    # print(f"[3] 지역 정보 파일 로드 중: {region_info_file}")
+    if not os.path.exists(region_info_file):
+        logger.error(f"❌ 지역 정보 파일 없음: {region_info_file}")
+        raise FileNotFoundError(f"❌ 지역 정보 파일 없음: {region_info_file}")
+    li_index_cache_dir = f"{output_root}/li_index_cache"
+
+    if follow:
+        # === 실시간 모드: CALPUFF 시간별 파일이 도착하는 대로 처리
+        if dump_intermediate:
+            logger.warning("실시간 모드에서는 중간 데이터 저장(--dump-intermediate)을 하지 않음")
+        if hour_cache:
+            logger.warning("실시간 모드에서는 시간별 결과 캐시(--hour-cache)를 사용하지 않음")
+        return _follow_index(logger, metrics, calpuff_dirs=calpuff_dirs, species=species, files_num=files_num,
+                             calmet_file=calmet_file, region_info_file=region_info_file, target=target,
+                             target_model=target_model, li_index_cache_dir=li_index_cache_dir,
+                             output_dir=f"{output_root}/{date}/{target_model}", calmet_coord_tol=calmet_coord_tol,
+                             poll_interval=poll_interval, timeout=timeout, cube_output=cube_output,
+                             output_root=output_root, date=date, li_polygons=li_polygons,
+                             region_filter=region_filter)
+
+    # =====   지수 프로페스   =====
+
+    # === nc를 dataframe으로
+    logger.info(f"[4] nc to dataframe")
+    logger.info(common_files)
+
+    # 예보 시간별 오염물질 파일 (CALMET 시간 위치는 positions)
+    hour_jobs = [
+        ([(sp["column"], sp["var"], os.path.join(sp_dir, f)) for sp, sp_dir in zip(species, calpuff_dirs)], f)
+        for f in common_files
+    ]
+
+    # === 지역 필터: 대상 지역 리가 있는 격자 범위(bbox)만 CALPUFF/CALMET에서 읽음
+    region_index = bbox = None
+    if region_filter and common_files:
+        metrics.begin("region_index")
+        region_index = load_region_index(logger, hour_jobs, calmet_file, region_info_file, target,
+                                         li_index_cache_dir, li_polygons, region_filter)
+        bbox = region_index['bbox']
+
+    # === 시간별 결과 캐시: 입력 파일이 바뀌지 않은 시간은 리 평균을 캐시에서 읽음
+    cached = {}
+    if hour_cache and not memory_budget:
+        hour_cache_dir = f"{output_root}/hour_cache/{input_folder_name}"
+        hour_keys = {f: hour_cache_key(paths, calmet_file, i, region_info_file, li_polygons, region_filter)
+                     for i, (paths, f) in zip(positions, hour_jobs)}
+        for f, key in hour_keys.items():
+            hit = load_hour_cache(hour_cache_dir, f, key)
+            if hit is not None:
+                cached[f] = hit
+        logger.info(f"시간별 결과 캐시 사용 {len(cached)}/{len(hour_jobs)}개, 처리 {len(hour_jobs) - len(cached)}개")
+        if dump_intermediate and cached:
+            logger.warning("캐시에서 읽은 시간은 중간 데이터(--dump-intermediate)에 포함되지 않음")
+    todo = [(i, job) for i, job in zip(positions, hour_jobs) if job[1] not in cached]
+
+    if memory_budget:
+        # === 타일 처리 모드: 메모리 예산 안에서 시간 묶음 x 행 범위 단위로 처리
+        if not hour_jobs:
+            logger.error("❌ 처리된 CALPUFF 시간 파일 없음")
+            raise RuntimeError("❌ 처리된 CALPUFF 시간 파일 없음")
+        for option, used in (("--hour-cache", hour_cache), ("--dump-intermediate", dump_intermediate),
+                             ("--compact", compact), ("--workers", workers > 1)):
+            if used:
+                logger.warning(f"타일 처리 모드에서는 {option} 옵션을 사용하지 않음")
+        return _tiled_index(logger, metrics, hour_jobs=hour_jobs, calmet_file=calmet_file,
+                            region_info_file=region_info_file, target=target, li_index_cache_dir=li_index_cache_dir,
+                            li_polygons=li_polygons, species=species, calmet_coord_tol=calmet_coord_tol,
+                            memory_budget_mb=memory_budget, output_root=output_root, date=date,
+                            target_model=target_model, csv_name_sdate=common_files[0].split('_')[-2],
+                            csv_name_edate=common_files[-1].split('_')[-2], cube_output=cube_output,
+                            positions=positions, region_filter=region_filter, region_index=region_index)
+
+    calmet_stage = metrics.begin("read_calmet", file_bytes=nc_bytes([calmet_file]) if todo else 0)
+    calmet = read_calmet(calmet_file, positions[-1] + 1, logger, bbox) if todo else None
+    calmet_stage["loaded_bytes"] = calmet_nbytes(calmet)
+
+    # compact 모드: 격자 좌표는 실행마다 한 번만, 값은 컬럼별 (시간 x 격자) 배열에 저장
+    # 자료형은 그대로 유지 (오염물질/기온/습도 float32, 풍속/풍향 float64), 줄이면 기존 결과와 값이 달라짐
+    grid = None
+    cube = {}
+    n_ok = 0
+
+    # 예보 시간별 오염물질 파일 읽기는 workers 수만큼 병렬 처리, 결과는 파일 순서대로 사용
+    hour_files = [] # 처리 완료된 시간의 파일 이름
+    load_stage = metrics.begin("load_calpuff", files_in=len(todo), cached_hours=len(cached),
+                               file_bytes=sum(nc_bytes([path for _, _, path in job[0]]) for _, job in todo),
+                               loaded_bytes=0)
+    executor = None
+    if workers > 1 and todo:
+        logger.info(f"CALPUFF 시간별 처리 프로세스 {workers}개 사용")
+        executor = ProcessPoolExecutor(max_workers=workers)
+        hour_results = [executor.submit(timed_call, load_calpuff_hour, *job, compact, bbox).result for _, job in todo]
+    else:
+        hour_results = [partial(timed_call, load_calpuff_hour, *job, compact, bbox) for _, job in todo]
+
+    # 오류로 중단되어도 작업 프로세스 정리 (남은 시간 작업은 취소)
+    try:
+        for (i, (species_paths, file_name)), hour_result in zip(todo, hour_results):
+            logger.info(f"{species_paths[0][2]}")
+            hour_bytes = nc_bytes([path for _, _, path in species_paths])
+            try:
+                (nc_df, date_part, time_part, hour_shape), hour_wall, hour_cpu = hour_result()
+                hour_loaded = loaded_nbytes(nc_df)
+                load_stage["loaded_bytes"] += hour_loaded
+                metrics.add_hour(file_name, hour_wall, hour_cpu, hour_bytes, hour_loaded)
+                if grid_shape is not None and hour_shape != grid_shape:
+                    raise ValueError(f"격자 크기 {hour_shape} 가 이전 시간 {grid_shape} 와 다름")
+            except Exception as e:
+                logger.error(f"Error processing {file_name}: {e}")
+                # print(f"Error processing {file_name}: {e}")
+                metrics.add_hour(file_name, 0.0, 0.0, hour_bytes, status=f"error: {e}")
+                continue
+
+            # === CALMET 격자 정합 확인 (실행마다 한 번, 불일치하면 실행 중단)
+            if calmet and grid_shape is None:
+                try:
+                    checked = check_calmet_alignment(calmet, nc_df, hour_shape, calmet_coord_tol)
+                except ValueError as e:
+                    logger.error(f"❌ CALMET/CALPUFF 격자 불일치: {e}")
+                    raise
+                logger.info(f"CALMET/CALPUFF 격자 일치 확인 {hour_shape}, 비교 좌표: {checked or '없음(격자 크기만 확인)'}")
+
+            try:
+                # === CALMET 데이터 추출 및 병합
+                if calmet:
+                    attach_calmet_hour(nc_df, calmet, i)
+            except Exception as e:
+                logger.error(f"Error processing {file_name}: {e}")
+                # print(f"Error processing {file_name}: {e}")
+                continue
+
+            if compact:
+                if grid is None:
+                    grid = {col: nc_df[col] for col in GRID_KEYS}
+                for col, values in nc_df.items():
+                    if col in GRID_KEYS:
+                        continue
+                    if col not in cube:
+                        cube[col] = np.full((len(todo), values.size), np.nan, dtype=values.dtype)
+                    cube[col][n_ok] = values
+                n_ok += 1
+            else:
+                nc_all_data.append(nc_df)
+            hours.append((date_part, time_part))
+            hour_files.append(file_name)
+            grid_shape = hour_shape
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+    load_stage["hours_out"] = len(hours)
+    load_stage["rows_out"] = len(hours) * grid_shape[0] * grid_shape[1] if grid_shape else 0
+
+    # === nc와 지역 정보 dataframe 합치기
+    logger.info(f"[5] nc와 지역 정보 합치기")
+    metrics.begin("merge", rows_in=load_stage["rows_out"], rows_out=load_stage["rows_out"])
+    # print(f"[5] nc와 지역 정보 합치기")
+    if not hours and not cached:
+        logger.error("❌ 처리된 CALPUFF 시간 파일 없음")
+        raise RuntimeError("❌ 처리된 CALPUFF 시간 파일 없음")
+    if hours:
+        if compact:
+            df_nc = {col: values[:n_ok] for col, values in cube.items()}
+            compact_bytes = sum(v.nbytes for v in df_nc.values()) + sum(np.asarray(v).nbytes for v in grid.values())
+            # 기존 방식 DataFrame 은 만들지 않으므로 측정값이 아닌 행 크기 기반 추정치 (문자열 객체 제외 하한)
+            full_bytes = n_ok * grid_shape[0] * grid_shape[1] * full_frame_row_bytes(len(species), bool(calmet))
+            logger.info(f"compact 격자 데이터 {compact_bytes / 2**20:,.1f} MB (배열 nbytes 측정) "
+                        f"/ 기존 방식 DataFrame 추정 {full_bytes / 2**20:,.1f} MB 이상 (계산값, 미측정), "
+                        f"추정 절감 {(full_bytes - compact_bytes) / 2**20:,.1f} MB 이상")
+        else:
+            df_nc = pd.concat(nc_all_data, ignore_index=True) # nc to dataframe
+            grid = nc_all_data[0]
+            logger.info(f"격자 데이터 {df_nc.memory_usage(index=False).sum() / 2**20:,.1f} MB")
+
+    # 중간 데이터는 메모리에서 바로 사용하고, 필요할 때만 파일로 저장 (--dump-intermediate)
+    csv_name_sdate = common_files[0].split('_')[-2] # for csv file name date
+    csv_name_edate = common_files[-1].split('_')[-2]
+    data_csv_path = f"{output_root}/{date}/{target_model}"
+    # data_csv_name = f"{target_model}_{csv_name_sdate}_{csv_name_edate}_{target}_data"
+    data_csv_name = f"{target_model}_{csv_name_sdate}_{csv_name_edate}_index_data"
+
+    if dump_intermediate and hours:
+        metrics.begin("dump_intermediate", rows_out=len(hours) * grid_shape[0] * grid_shape[1])
+        try:
+            df_dump = compact_to_frame(grid, hours, df_nc) if compact else df_nc
+            data_file = dump_intermediate_data(df_dump, f"{data_csv_path}/{data_csv_name}", dump_intermediate)
+            logger.info(f"[6] 농도 데이터를 가진 nc 중간 데이터 저장 {data_file}")
+        except Exception as e:
+            logger.error(f"Error saving intermediate data ({dump_intermediate}): {e}")
+
+    # print(f"df_data  → {len(df_data):,}건 로드됨")
+    if hours:
+        logger.info(f"df_nc  → {len(hours) * grid_shape[0] * grid_shape[1]:,}건")
+    elif cached and region_index is None:
+        # 모든 시간을 캐시에서 읽은 경우 격자-리 인덱스용 격자 좌표만 첫 시간 파일에서 읽음
+        grid, _, _, grid_shape = load_calpuff_hour(*hour_jobs[0])
+
+    # === 격자-리 인덱스 로드 (지역 정보 파일 해시와 격자 크기로 캐시, 지역 필터는 bbox 기준 인덱스 사용)
+    metrics.begin("li_index")
+    if region_index is None:
+        li_index = load_li_index(region_info_file, grid, grid_shape, target, li_index_cache_dir, logger, li_polygons,
+                                 region_filter)
+    else:
+        li_index = region_index
+        grid_shape = grid_shape or li_index['grid_shape']
+    li_table = li_index['li_table']
+    metrics.end(rows_out=len(li_table))
+    logger.info(f"격자-리 인덱스 → 리 {len(li_table):,}개, 격자 매칭 {len(li_index['cell']):,}건")
+
+    # ***************************************
+    # process - calculate
+    # ***************************************
+
+    # =====   평균 계산   =====
+    # 리 지명/코드 채우기와 지역 필터(ns: 논산시)는 격자-리 인덱스에 반영되어 있음
+    # print(f"[6] 리 단위 그룹화 및 평균 산출")
+    logger.info(f"[6] 리 단위 그룹화 및 평균 산출")
+
+    metrics.begin("aggregate", rows_in=len(hours) * grid_shape[0] * grid_shape[1])
+    means = li_means(li_index, df_nc, len(hours), grid_shape, species) if hours else {}
+    if hour_cache:
+        # 새로 처리한 시간 저장 후 캐시된 시간과 파일 순서대로 합침
+        for k, (file_name, (date_part, time_part)) in enumerate(zip(hour_files, hours)):
+            row = {col: values[k] for col, values in means.items()}
+            save_hour_cache(hour_cache_dir, file_name, hour_keys[file_name], date_part, time_part, row)
+            cached[file_name] = (date_part, time_part, row)
+        rows = [cached[f] for f in common_files if f in cached]
+        hours = [(date_part, time_part) for date_part, time_part, _ in rows]
+        means = {col: np.stack([row[col] for _, _, row in rows]) for col in rows[0][2]} if rows else {}
+    df_grouped = li_frame(li_index, means, hours, species)
+    metrics.end(rows_out=len(df_grouped))
+
+    # ***************************************
+    # save
+    # ***************************************
+
+    return save_li_result(logger, metrics, df_grouped, li_table, hours, species, output_root, date, target_model,
+                          csv_name_sdate, csv_name_edate, cube_output)
+
+# ***************************************
+# 실행 인자
+# ***************************************
+
+def positive_int(value):
+    """
+    1 이상 정수 옵션 (argparse type)
+    """
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"1 이상이어야 함: {value}")
+    return number
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="CALPUFF/CALMET nc 파일로 리 단위 영향지수 산출")
+    parser.add_argument("date", help="예보 기준 시각 ex) klaps 2024091203, rdaps 2024091121")
+    parser.add_argument("target", help="'jb' or 'ns'")
+    parser.add_argument("target_model", help="'klaps' or 'rdaps'")
+    parser.add_argument("calmet_dir", help="CALMET nc 상위 폴더")
+    parser.add_argument("calpuff_dir", help="CALPUFF nc 상위 폴더")
+    parser.add_argument("info_dir", help="위경도-주소 정보 폴더")
+    parser.add_argument("output_root", help="결과 및 로그 상위 폴더")
+    parser.add_argument("--workers", type=positive_int, default=1,
+                        help="예보 시간별 CALPUFF 파일 처리 프로세스 수 (기본: 1)")
+    parser.add_argument("--dump-intermediate", choices=["parquet", "feather", "netcdf", "csv"], default=None,
+                        help="격자 단위 중간 데이터(*_index_data) 저장 형식 (기본: 저장 안 함)")
+    parser.add_argument("--species-config", default=None,
+                        help="오염물질 등록 정보 json (기본: NH3, CO)")
+    parser.add_argument("--calmet-coord-tol", type=float, default=CALMET_COORD_TOL,
+                        help=f"CALMET/CALPUFF 좌표 비교 허용 오차 (기본: {CALMET_COORD_TOL})")
+    parser.add_argument("--follow", action="store_true",
+                        help="CALPUFF 시간별 파일이 생성되는 대로 처리하여 결과 csv에 이어 씀")
+    parser.add_argument("--poll-interval", type=float, default=30,
+                        help="실시간 모드 폴더 확인 간격(초, 기본: 30)")
+    parser.add_argument("--timeout", type=float, default=3 * 3600,
+                        help="실시간 모드 최대 대기 시간(초, 기본: 10800)")
+    parser.add_argument("--compact", action="store_true",
+                        help="격자 데이터를 컬럼별 시간 x 격자 배열로 보관 (메모리 절감)")
+    parser.add_argument("--cube-output", nargs="+", choices=CUBE_FORMATS, default=[],
+                        help="csv 외 추가 출력: (time x li) netcdf/zarr cube, 모델/날짜별 분할 parquet")
+    parser.add_argument("--li-polygons", default=None,
+                        help="리 경계 파일(GeoJSON/shapefile), 지정하면 격자 셀 겹침 면적 가중 평균")
+    parser.add_argument("--li-polygon-code", default="LI_CD",
+                        help="리 경계 파일의 리 코드 컬럼 (기본: LI_CD)")
+    parser.add_argument("--hour-cache", action="store_true",
+                        help="시간별 리 평균 캐시 사용, 재실행 시 실패했거나 입력이 바뀐 시간만 처리")
+    parser.add_argument("--memory-budget", type=positive_int, default=None,
+                        help="작업 메모리 예산(MB), 지정하면 시간 묶음 x 행 범위 단위로 nc 일부만 읽어 처리 (큰 격자용)")
+    parser.add_argument("--sig", nargs="+", default=None,
+                        help="시군구 이름 또는 코드 필터, 해당 격자 범위만 읽음 (기본: ns는 논산시, jb는 전체)")
+    parser.add_argument("--emd", nargs="+", default=None,
+                        help="읍면동 이름 또는 코드 필터 (--sig와 함께 쓰면 어느 하나에 해당하는 지역)")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    run_index(args.date, args.target, args.target_model, args.calmet_dir, args.calpuff_dir,
+              args.info_dir, args.output_root, workers=args.workers,
+              dump_intermediate=args.dump_intermediate, species=load_species(args.species_config),
+              calmet_coord_tol=args.calmet_coord_tol, follow=args.follow,
+              poll_interval=args.poll_interval, timeout=args.timeout, compact=args.compact,
+              cube_output=args.cube_output, li_polygons=args.li_polygons, li_polygon_code=args.li_polygon_code,
+              hour_cache=args.hour_cache, memory_budget=args.memory_budget,
+              region_filter=region_filter_args(args.sig, args.emd))
+
+if __name__ == "__main__":
+    main()
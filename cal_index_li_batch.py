@@ -0,0 +1,183 @@
+# ***************************************
+# Batch driver for cal_index_li.py
+# 여러 날짜(date) x 지역(jb/ns) x 모델(klaps/rdaps) 실행을 한 번에 처리
+# 인터프리터/라이브러리 로드와 격자-리 인덱스 로드를 실행 간에 공유하고 실행들을 병렬 처리
+# 각 실행은 기존과 동일하게 자체 *_index_li.csv 와 로그 파일을 생성
+# ***************************************
+
+import os
+import sys
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import cal_index_li
+
+logger = logging.getLogger(__name__)
+
+def expand_dates(dates=None, start=None, end=None, step_hours=24):
+    """
+    날짜 목록 또는 시작~종료 범위(step_hours 간격)를 YYYYMMDDHH 문자열 목록으로 변환
+    """
+    result = list(dates or [])
+    if start:
+        times = pd.date_range(pd.to_datetime(start, format="%Y%m%d%H"),
+                              pd.to_datetime(end or start, format="%Y%m%d%H"),
+                              freq=f"{step_hours}h")
+        result += [t.strftime("%Y%m%d%H") for t in times]
+    # 중복 제거, 입력 순서 유지
+    return list(dict.fromkeys(result))
+
+def build_runs(dates, targets, models):
+    """
+    (날짜, 지역, 모델) 실행 목록
+    """
+    return [(date, target, model) for date in dates for model in models for target in targets]
+
+def run_output_root(output_root, target):
+    """
+    지역별 결과 상위 폴더 (output_root에 {target}이 있으면 지역명으로 치환)
+    """
+    return output_root.format(target=target)
+
+def preload_region_index(runs, calmet_dir, calpuff_dir, info_dir, output_root, species, li_polygons=None,
+                         region_filter=None):
+    """
+    지역/모델별로 첫 실행의 격자를 읽어 격자-리 인덱스를 미리 메모리(cal_index_li._li_index_memo)에 올림
+    region_filter: 실행과 같은 지역 필터 (run_index와 같은 메모리 키가 되도록 같은 값을 넘김, 없으면 지역별 기본 필터)
+    병렬 실행의 작업 프로세스에는 seed_li_index_memo로 넘김 (시작 방식 fork/spawn과 관계없음)
+    지역/모델 조합이 cal_index_li.LI_INDEX_MEMO_SIZE보다 많으면 최근 로드한 인덱스만 유지
+    """
+    loaded = set()
+    for date, target, model in runs:
+        if (target, model) in loaded:
+            continue
+        dirs = cal_index_li.species_dirs(calpuff_dir, f"{date}_{model}_{target}", species)
+        region_info_file = f"{info_dir}/addresses_code_{target}.csv"
+        if not (all(os.path.isdir(d) for d in dirs) and os.path.exists(region_info_file)):
+            continue
+        common_files = cal_index_li.list_common_files(dirs)
+        if not common_files:
+            continue
+        try:
+            species_paths = [(sp["column"], sp["var"], os.path.join(d, common_files[0])) for sp, d in zip(species, dirs)]
+            nc_df, _, _, grid_shape = cal_index_li.load_calpuff_hour(species_paths, common_files[0])
+            cache_dir = f"{run_output_root(output_root, target)}/li_index_cache"
+            cal_index_li.load_li_index(region_info_file, nc_df, grid_shape, target, cache_dir, logger, li_polygons,
+                                       region_filter)
+            loaded.add((target, model))
+        except Exception as e:
+            logger.error(f"격자-리 인덱스 미리 로드 실패 ({target}, {model}): {e}")
+
+def seed_li_index_memo(memo):
+    """
+    작업 프로세스 시작 시 부모가 미리 로드한 격자-리 인덱스를 메모리에 올림 (ProcessPoolExecutor initializer)
+    """
+    for key, li_index in memo.items():
+        cal_index_li.memo_put(cal_index_li._li_index_memo, key, li_index, cal_index_li.LI_INDEX_MEMO_SIZE)
+
+def run_one(run, calmet_dir, calpuff_dir, info_dir, output_root, workers=1, dump_intermediate=None, species=None,
+            cube_output=None, li_polygons=None, hour_cache=False, memory_budget=None, region_filter=None):
+    """
+    한 실행 처리. 오류는 배치를 멈추지 않고 결과로 반환
+    반환값: (실행, 저장 경로 또는 None, 오류 메시지 또는 None)
+    """
+    date, target, model = run
+    polygons_file, polygon_code = li_polygons or (None, "LI_CD")
+    try:
+        out_path = cal_index_li.run_index(date, target, model, calmet_dir, calpuff_dir, info_dir,
+                                          run_output_root(output_root, target), workers=workers,
+                                          dump_intermediate=dump_intermediate, species=species,
+                                          cube_output=cube_output, li_polygons=polygons_file,
+                                          li_polygon_code=polygon_code, hour_cache=hour_cache,
+                                          memory_budget=memory_budget, region_filter=region_filter)
+        return run, out_path, None
+    except Exception as e:
+        return run, None, str(e)
+
+def run_batch(runs, calmet_dir, calpuff_dir, info_dir, output_root, jobs=1, workers=1, dump_intermediate=None,
+              species=None, cube_output=None, li_polygons=None, hour_cache=False, memory_budget=None,
+              region_filter=None):
+    """
+    실행 목록을 jobs개 프로세스로 병렬 처리, 결과는 실행 목록 순서대로 반환
+    li_polygons: (리 경계 파일, 리 코드 컬럼)이면 면적 가중 평균
+    region_filter: 지역 필터 (없으면 지역별 기본 필터)
+    """
+    species = species or cal_index_li.DEFAULT_SPECIES
+    preload_region_index(runs, calmet_dir, calpuff_dir, info_dir, output_root, species, li_polygons, region_filter)
+    args = (calmet_dir, calpuff_dir, info_dir, output_root, workers, dump_intermediate, species, cube_output,
+            li_polygons, hour_cache, memory_budget, region_filter)
+    if jobs > 1:
+        # 미리 로드한 격자-리 인덱스를 작업 프로세스마다 한 번 넘김
+        with ProcessPoolExecutor(max_workers=jobs, initializer=seed_li_index_memo,
+                                 initargs=(dict(cal_index_li._li_index_memo),)) as executor:
+            futures = [executor.submit(run_one, run, *args) for run in runs]
+            return [f.result() for f in futures]
+    return [run_one(run, *args) for run in runs]
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="cal_index_li 다중 실행(날짜 x 지역 x 모델) 배치 처리")
+    parser.add_argument("calmet_dir", help="CALMET nc 상위 폴더")
+    parser.add_argument("calpuff_dir", help="CALPUFF nc 상위 폴더")
+    parser.add_argument("info_dir", help="위경도-주소 정보 폴더")
+    parser.add_argument("output_root", help="결과 및 로그 상위 폴더, 지역이 여럿이면 {target} 포함 ex) /out/{target}")
+    parser.add_argument("--dates", nargs="+", default=[], help="예보 기준 시각 목록 ex) 2024091121 2024091221")
+    parser.add_argument("--start", help="기준 시각 범위 시작 (YYYYMMDDHH)")
+    parser.add_argument("--end", help="기준 시각 범위 종료 (YYYYMMDDHH, 포함)")
+    parser.add_argument("--step-hours", type=int, default=24, help="기준 시각 범위 간격(시간, 기본: 24)")
+    parser.add_argument("--targets", nargs="+", default=["jb", "ns"], help="지역 목록 (기본: jb ns)")
+    parser.add_argument("--models", nargs="+", default=["rdaps"], help="모델 목록 (기본: rdaps)")
+    parser.add_argument("--jobs", type=cal_index_li.positive_int, default=1,
+                        help="동시에 처리할 실행 수 (기본: 1)")
+    parser.add_argument("--workers", type=cal_index_li.positive_int, default=1,
+                        help="실행별 예보 시간 처리 프로세스 수 (기본: 1)")
+    parser.add_argument("--dump-intermediate", choices=["parquet", "feather", "netcdf", "csv"], default=None,
+                        help="격자 단위 중간 데이터(*_index_data) 저장 형식 (기본: 저장 안 함)")
+    parser.add_argument("--species-config", default=None, help="오염물질 등록 정보 json (기본: NH3, CO)")
+    parser.add_argument("--cube-output", nargs="+", choices=cal_index_li.CUBE_FORMATS, default=[],
+                        help="csv 외 추가 출력 (netcdf/zarr cube, 분할 parquet)")
+    parser.add_argument("--li-polygons", default=None, help="리 경계 파일(GeoJSON/shapefile), 면적 가중 평균")
+    parser.add_argument("--li-polygon-code", default="LI_CD", help="리 경계 파일의 리 코드 컬럼 (기본: LI_CD)")
+    parser.add_argument("--hour-cache", action="store_true", help="시간별 리 평균 캐시 사용 (입력이 바뀐 시간만 처리)")
+    parser.add_argument("--memory-budget", type=cal_index_li.positive_int, default=None,
+                        help="실행별 작업 메모리 예산(MB), 지정하면 타일 단위 처리 (동시 실행 수만큼 곱해서 고려)")
+    parser.add_argument("--sig", nargs="+", default=None,
+                        help="시군구 이름 또는 코드 필터, 모든 지역에 적용 (기본: ns는 논산시, jb는 전체)")
+    parser.add_argument("--emd", nargs="+", default=None, help="읍면동 이름 또는 코드 필터")
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    dates = expand_dates(args.dates, args.start, args.end, args.step_hours)
+    if not dates:
+        parser.error("--dates 또는 --start 를 지정해야 합니다")
+    if len(args.targets) > 1 and "{target}" not in args.output_root:
+        parser.error("지역이 여럿이면 output_root에 {target}을 포함해야 합니다 (결과 파일명이 같음)")
+
+    logging.basicConfig(level=logging.INFO, format=cal_index_li.LOG_FORMAT,
+                        handlers=[logging.StreamHandler(sys.stdout)])
+
+    runs = build_runs(dates, args.targets, args.models)
+    logger.info(f"--- 배치 시작: 실행 {len(runs)}개, 동시 처리 {args.jobs}개 ---")
+    results = run_batch(runs, args.calmet_dir, args.calpuff_dir, args.info_dir, args.output_root,
+                        jobs=args.jobs, workers=args.workers, dump_intermediate=args.dump_intermediate,
+                        species=cal_index_li.load_species(args.species_config), cube_output=args.cube_output,
+                        li_polygons=(args.li_polygons, args.li_polygon_code) if args.li_polygons else None,
+                        hour_cache=args.hour_cache, memory_budget=args.memory_budget,
+                        region_filter=cal_index_li.region_filter_args(args.sig, args.emd))
+
+    fail_count = 0
+    for (date, target, model), out_path, error in results:
+        if error:
+            fail_count += 1
+            logger.error(f"[실패] {date} {target} {model}: {error}")
+        else:
+            logger.info(f"[성공] {date} {target} {model}: {out_path}")
+    logger.info(f"--- 배치 종료 --- 총 {len(results)}개, 성공: {len(results) - fail_count}개, 실패: {fail_count}개")
+    return 1 if fail_count else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
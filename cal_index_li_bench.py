@@ -0,0 +1,254 @@
+# ***************************************
+# Benchmark for cal_index_li.py
+# 실제 CALPUFF/CALMET 출력과 같은 구조의 합성 nc/주소 파일을 만들고
+# 단계별(CALPUFF 읽기, CALMET 읽기/병합, 격자-리 인덱스, 리 평균, csv 저장) 시간/최대 메모리(RSS)/처리량 측정
+# ex) python cal_index_li_bench.py --models klaps rdaps --grids 60x80 300x400 --json bench.json
+# ***************************************
+
+import os
+import sys
+import time
+import json
+import shutil
+import logging
+import argparse
+import tempfile
+import io
+import contextlib
+
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+
+import cal_index_li
+
+logger = logging.getLogger(__name__)
+
+MODEL_HOURS = {"klaps": 13, "rdaps": 49}
+
+# ===== 합성 입력 생성 =====
+def make_synthetic_inputs(root, date, model, target, grid_shape, species=None, seed=0, match_frac=0.7):
+    """
+    cal_index_li.py 입력 폴더 구조와 같은 합성 데이터 생성
+    CALPUFF: {root}/CALPUFF/{date}_{model}_{target}/{오염물질 폴더}/{model}_{date}_{yyyymmddhh}_{target}.nc
+    CALMET: {root}/CALMET/{date}_{model}_{target}/{model}_{date}_{target}.nc (가장자리 CALMET_BORDER칸 포함)
+    주소: {root}/info/addresses_code_{target}.csv (격자점 match_frac 비율 매칭, 매칭 안 되는 행 포함)
+    """
+    species = species or cal_index_li.DEFAULT_SPECIES
+    ny, nx = grid_shape
+    n_hours = MODEL_HOURS[model]
+    border = cal_index_li.CALMET_BORDER
+    rng = np.random.default_rng(seed)
+
+    x = (300.0 + np.arange(nx) * 0.1).astype(np.float32)
+    y = (4000.0 + np.arange(ny) * 0.1).astype(np.float32)
+    lat = (36.0 + np.arange(ny)[:, None] * 0.001 + np.arange(nx)[None, :] * 0.0001).astype(np.float32)
+    lon = (127.0 + np.arange(nx)[None, :] * 0.0011 + np.arange(ny)[:, None] * 0.00003).astype(np.float32)
+    folder = f"{date}_{model}_{target}"
+    base_time = pd.to_datetime(date, format="%Y%m%d%H")
+
+    # === CALPUFF 시간별 파일 (t, z, y, x), 일부 격자 masked
+    for sp in species:
+        sp_dir = os.path.join(root, "CALPUFF", folder, sp["dir"])
+        os.makedirs(sp_dir, exist_ok=True)
+        for h in range(n_hours):
+            t = base_time + pd.Timedelta(hours=h + 1)
+            with nc.Dataset(os.path.join(sp_dir, f"{model}_{date}_{t:%Y%m%d%H}_{target}.nc"), "w") as ds:
+                for dim, size in (("t", 1), ("z", 1), ("y", ny), ("x", nx)):
+                    ds.createDimension(dim, size)
+                values = rng.gamma(2.0, sp["thresholds"][0] * 0.8, (ny, nx)).astype(np.float32)
+                field = np.ma.masked_array(values, mask=np.zeros_like(values, dtype=bool))
+                field.mask[0, :3] = True
+                ds.createVariable(sp["var"], "f4", ("t", "z", "y", "x"), fill_value=-9999.0)[0, 0] = field
+                ds.createVariable("lat", "f4", ("y", "x"))[:] = lat
+                ds.createVariable("lon", "f4", ("y", "x"))[:] = lon
+                ds.createVariable("x", "f4", ("x",))[:] = x
+                ds.createVariable("y", "f4", ("y",))[:] = y
+
+    # === CALMET (time, z, Y, X), 가장자리 border칸
+    calmet_dir = os.path.join(root, "CALMET", folder)
+    os.makedirs(calmet_dir, exist_ok=True)
+    shape = (n_hours, 2, ny + 2 * border, nx + 2 * border)
+    with nc.Dataset(os.path.join(calmet_dir, f"{model}_{date}_{target}.nc"), "w") as ds:
+        for dim, size in zip(("time", "z", "Y", "X"), shape):
+            ds.createDimension(dim, size)
+        for var, offset in (("U", 0.0), ("V", 0.0), ("T", 290.0)):
+            ds.createVariable(var, "f4", ("time", "z", "Y", "X"))[:] = (rng.normal(0, 3, shape) + offset).astype(np.float32)
+        ds.createVariable("RH", "f4", ("time", "Y", "X"))[:] = \
+            rng.uniform(30, 100, (n_hours,) + shape[2:]).astype(np.float32)
+
+    # === 주소 정보: 8x8 격자 블록을 리, 4x4 리를 읍면동으로 묶음
+    grid = pd.DataFrame({"X": np.tile(x, ny), "Y": np.repeat(y, nx), "Lat": lat.ravel(), "Lon": lon.ravel()})
+    sel = grid.sample(frac=match_frac, random_state=seed).sort_index()
+    row, col = np.divmod(sel.index.to_numpy(), nx)
+    li = (row // 8) * ((nx + 7) // 8) + col // 8
+    emd = (row // 32) * ((nx + 31) // 32) + col // 32
+    sig = np.where(col < nx // 2, "논산시", "계룡시")
+    region = pd.DataFrame({
+        **{k: sel[k].to_numpy() for k in cal_index_li.GRID_KEYS},
+        "CTP_KOR_NM": "충청남도", "CTPRVN_CD": 44,
+        "SIG_KOR_NM": sig, "SIG_CD": np.where(sig == "논산시", 44230, 44250),
+        "EMD_KOR_NM": [f"읍{e}" for e in emd], "EMD_CD": 4423000000 + emd * 100,
+        # 일부 리는 이름/코드 없음 (읍면동으로 채움)
+        "LI_KOR_NM": np.where(li % 5 != 0, [f"리{l}" for l in li], None),
+        "LI_CD": np.where(li % 5 != 0, 4423000000 + emd * 100 + li % 100, np.nan),
+    })
+    unmatched = region.iloc[:5].copy()
+    unmatched["X"] += 1000
+    info_dir = os.path.join(root, "info")
+    os.makedirs(info_dir, exist_ok=True)
+    pd.concat([region, unmatched]).to_csv(os.path.join(info_dir, f"addresses_code_{target}.csv"), index=False)
+
+    return {"calmet_dir": os.path.join(root, "CALMET"), "calpuff_dir": os.path.join(root, "CALPUFF"),
+            "info_dir": info_dir, "n_hours": n_hours}
+
+# ===== 단계별 측정 =====
+class StageTimer:
+    """
+    단계별 경과 시간, 최대 RSS 증가량(MB), 처리량 기록
+    """
+    def __init__(self):
+        self.stages = []
+
+    def run(self, name, func, *args, items=None, **kwargs):
+        # RSS 확인은 cal_index_li 성능 지표와 같은 방식 (/proc 가 없으면 시간만 기록)
+        sampler = cal_index_li.RssSampler(interval=0.005)
+        if sampler.start_rss is not None:
+            sampler.start()
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            wall = time.perf_counter() - start
+            sampler.stop()
+        stage = {"stage": name, "wall_s": wall}
+        if sampler.start_rss is not None:
+            stage["peak_mb"] = sampler.peak - sampler.start_rss
+            stage["rss_mb"] = sampler.peak
+        if items:
+            stage["items"] = items
+            stage["items_per_s"] = items / wall if wall > 0 else float("inf")
+        self.stages.append(stage)
+        return result
+
+def bench_stages(date, model, target, inputs, grid_shape, species, output_root, compact=False):
+    """
+    run_index와 같은 순서로 파이프라인 함수를 호출하여 단계별 측정
+    items: 처리한 격자 x 시간 수 (리 평균 이후는 리 x 시간 수)
+    """
+    timer = StageTimer()
+    folder = f"{date}_{model}_{target}"
+    dirs = cal_index_li.species_dirs(inputs["calpuff_dir"], folder, species)
+    files = cal_index_li.list_common_files(dirs)[:inputs["n_hours"]]
+    cell_hours = len(files) * grid_shape[0] * grid_shape[1]
+
+    def load_calpuff():
+        return [cal_index_li.load_calpuff_hour([(sp["column"], sp["var"], os.path.join(d, f))
+                                                for sp, d in zip(species, dirs)], f, compact) for f in files]
+    loaded = timer.run("load_calpuff", load_calpuff, items=cell_hours)
+
+    calmet_file = os.path.join(inputs["calmet_dir"], folder, f"{model}_{date}_{target}.nc")
+    calmet = timer.run("read_calmet", cal_index_li.read_calmet, calmet_file, len(files), logger, items=cell_hours)
+
+    def merge():
+        cal_index_li.check_calmet_alignment(calmet, loaded[0][0], grid_shape)
+        for i, (nc_df, *_) in enumerate(loaded):
+            cal_index_li.attach_calmet_hour(nc_df, calmet, i)
+        if compact:
+            columns = [col for col in loaded[0][0] if col not in cal_index_li.GRID_KEYS]
+            return loaded[0][0], {col: np.stack([hour[0][col] for hour in loaded]) for col in columns}
+        return loaded[0][0], pd.concat([hour[0] for hour in loaded], ignore_index=True)
+    grid, df_nc = timer.run("attach_calmet", merge, items=cell_hours)
+    hours = [(date_part, time_part) for _, date_part, time_part, _ in loaded]
+
+    region_info_file = os.path.join(inputs["info_dir"], f"addresses_code_{target}.csv")
+    cache_dir = os.path.join(output_root, "li_index_cache")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    cal_index_li._li_index_memo.clear()
+    li_index = timer.run("li_index_build", cal_index_li.load_li_index, region_info_file, grid, grid_shape, target,
+                         cache_dir, logger)
+    cal_index_li._li_index_memo.clear()
+    timer.run("li_index_cached", cal_index_li.load_li_index, region_info_file, grid, grid_shape, target, cache_dir,
+              logger)
+
+    df_grouped = timer.run("aggregate", cal_index_li.aggregate_hours, li_index, df_nc, hours, grid_shape, species,
+                           items=cell_hours)
+
+    out_path = os.path.join(output_root, "bench_index_li.csv")
+    timer.run("save_csv", df_grouped.to_csv, out_path, index=False, encoding="utf-8-sig", items=len(df_grouped))
+    return timer.stages
+
+def bench_end_to_end(date, model, target, inputs, output_root, species, compact=False, workers=1):
+    """
+    run_index 전체 실행 시간 (로그 파일/격자-리 인덱스 생성 포함, 화면 로그는 출력하지 않음)
+    """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        cal_index_li.run_index(date, target, model, inputs["calmet_dir"], inputs["calpuff_dir"], inputs["info_dir"],
+                               output_root, workers=workers, species=species, compact=compact)
+    return time.perf_counter() - start
+
+def parse_grid(text):
+    ny, nx = text.lower().split("x")
+    return int(ny), int(nx)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="cal_index_li 합성 데이터 성능 측정")
+    parser.add_argument("--models", nargs="+", choices=list(MODEL_HOURS), default=["klaps", "rdaps"],
+                        help="모델 (시간 수: klaps 13, rdaps 49)")
+    parser.add_argument("--grids", nargs="+", type=parse_grid, default=[(60, 80)], help="격자 크기 ny x nx ex) 300x400")
+    parser.add_argument("--target", default="jb", help="지역 (기본: jb)")
+    parser.add_argument("--date", default="2024091121", help="예보 기준 시각 (기본: 2024091121)")
+    parser.add_argument("--repeat", type=int, default=1, help="조합별 반복 횟수 (기본: 1)")
+    parser.add_argument("--compact", action="store_true", help="compact 모드로 측정")
+    parser.add_argument("--workers", type=int, default=1, help="전체 실행 측정 시 CALPUFF 처리 프로세스 수")
+    parser.add_argument("--species-config", default=None, help="오염물질 등록 정보 json (기본: NH3, CO)")
+    parser.add_argument("--workdir", default=None, help="합성 데이터/결과 폴더 (기본: 임시 폴더, 종료 시 삭제)")
+    parser.add_argument("--json", default=None, help="측정 결과 json 저장 경로")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format=cal_index_li.LOG_FORMAT,
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    species = cal_index_li.load_species(args.species_config)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="cal_index_li_bench_")
+
+    results = []
+    try:
+        for grid_shape in args.grids:
+            for model in args.models:
+                root = os.path.join(workdir, f"{model}_{grid_shape[0]}x{grid_shape[1]}")
+                start = time.perf_counter()
+                inputs = make_synthetic_inputs(root, args.date, model, args.target, grid_shape, species)
+                print(f"== {model} {grid_shape[0]}x{grid_shape[1]} ({inputs['n_hours']}h), "
+                      f"합성 데이터 생성 {time.perf_counter() - start:.1f}s")
+                for r in range(args.repeat):
+                    output_root = os.path.join(root, "out")
+                    stages = bench_stages(args.date, model, args.target, inputs, grid_shape, species, output_root,
+                                          args.compact)
+                    total = bench_end_to_end(args.date, model, args.target, inputs, os.path.join(root, "out_e2e"),
+                                             species, args.compact, args.workers)
+                    stages.append({"stage": "run_index", "wall_s": total,
+                                   "items": inputs["n_hours"] * grid_shape[0] * grid_shape[1],
+                                   "items_per_s": inputs["n_hours"] * grid_shape[0] * grid_shape[1] / total})
+                    for stage in stages:
+                        results.append({"model": model, "grid": f"{grid_shape[0]}x{grid_shape[1]}",
+                                        "hours": inputs["n_hours"], "repeat": r, "compact": args.compact, **stage})
+                        peak = f"{stage['peak_mb']:9.1f} MB" if "peak_mb" in stage else " " * 12
+                        rate = f"{stage['items_per_s']:14,.0f} /s" if "items_per_s" in stage else ""
+                        print(f"  {stage['stage']:<16} {stage['wall_s']:8.3f} s {peak} {rate}")
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    max_rss_mb = cal_index_li.max_rss_mb() # resource 모듈이 없으면(windows) None
+    if max_rss_mb is not None:
+        print(f"프로세스 최대 RSS (작업 프로세스 포함): {max_rss_mb:,.1f} MB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"max_rss_mb": max_rss_mb, "results": results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
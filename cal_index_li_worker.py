@@ -0,0 +1,211 @@
+# ***************************************
+# Warm worker for cal_index_li.py
+# pandas/netCDF4 로드와 격자-리 인덱스를 메모리에 유지한 채 로컬 소켓으로 실행 요청을 받아 처리
+# 스케줄러는 매 실행마다 인터프리터를 새로 띄우지 않고 submit으로 요청만 보냄
+# ex) 서버: python cal_index_li_worker.py serve /CALMET /CALPUFF /info /out/{target}
+#     요청: python cal_index_li_worker.py submit 2024091121 jb rdaps
+# ***************************************
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import threading
+import argparse
+import socketserver
+
+# submit/ping 클라이언트는 표준 라이브러리만 사용 (pandas/netCDF4는 serve에서만 로드)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = "/tmp/cal_index_li.sock"
+
+# 요청 json에서 run_index로 넘길 수 있는 옵션
+JOB_OPTIONS = ["workers", "dump_intermediate", "calmet_coord_tol", "compact", "cube_output",
+               "li_polygons", "li_polygon_code", "hour_cache", "memory_budget", "region_filter"]
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """
+    한 연결당 json 한 줄 요청을 받아 처리하고 json 한 줄로 응답
+    요청: {"date", "target", "model", ...JOB_OPTIONS} 또는 {"command": "ping" | "shutdown"}
+    응답: {"status": "ok" | "error", "out_path", "error", "wall_s"}
+    """
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            job = json.loads(line)
+            response = self.server.handle_job(job)
+        except Exception as e:
+            logger.error(f"잘못된 요청 {line[:200]!r}: {e}")
+            response = {"status": "error", "error": str(e)}
+        self.wfile.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+
+class WorkerMixin:
+    """
+    서버 공통 설정(입력 폴더, 오염물질 목록)과 요청 처리
+    요청은 도착 순서대로 하나씩 처리 (각 실행의 --workers로 실행 내부 병렬 처리)
+    """
+    def setup_worker(self, calmet_dir, calpuff_dir, info_dir, output_root, species):
+        self.dirs = (calmet_dir, calpuff_dir, info_dir)
+        self.output_root = output_root
+        self.species = species
+        self.job_count = 0
+
+    def handle_job(self, job):
+        import cal_index_li
+        import cal_index_li_batch
+
+        command = job.get("command", "run")
+        if command == "ping":
+            return {"status": "ok", "jobs": self.job_count, "pid": os.getpid()}
+        if command == "shutdown":
+            logger.info("종료 요청 수신")
+            # serve_forever 스레드와 다른 스레드에서 호출해야 함
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {"status": "ok"}
+        if command != "run":
+            raise ValueError(f"알 수 없는 명령: {command}")
+
+        missing = {"date", "target", "model"} - set(job)
+        if missing:
+            raise ValueError(f"요청 항목 누락 {sorted(missing)}")
+        unknown = set(job) - {"command", "date", "target", "model"} - set(JOB_OPTIONS)
+        if unknown:
+            raise ValueError(f"알 수 없는 요청 항목 {sorted(unknown)}")
+
+        self.job_count += 1
+        options = {k: job[k] for k in JOB_OPTIONS if k in job}
+        logger.info(f"[요청 {self.job_count}] {job['date']} {job['target']} {job['model']} {options or ''}")
+        start = time.perf_counter()
+        try:
+            out_path = cal_index_li.run_index(
+                job["date"], job["target"], job["model"], *self.dirs,
+                cal_index_li_batch.run_output_root(self.output_root, job["target"]),
+                species=self.species, **options)
+            response = {"status": "ok", "out_path": out_path}
+        except Exception as e:
+            response = {"status": "error", "error": str(e)}
+        response["wall_s"] = round(time.perf_counter() - start, 3)
+        logger.info(f"[요청 {self.job_count}] {response['status']} ({response['wall_s']}초)")
+        return response
+
+class UnixWorkerServer(WorkerMixin, socketserver.UnixStreamServer):
+    pass
+
+class TcpWorkerServer(WorkerMixin, socketserver.TCPServer):
+    allow_reuse_address = True
+
+def make_server(socket_path=DEFAULT_SOCKET, port=None):
+    """
+    port가 있으면 127.0.0.1 TCP, 없으면 unix 소켓 서버
+    """
+    if port:
+        return TcpWorkerServer(("127.0.0.1", port), JobHandler)
+    if os.path.exists(socket_path):
+        # 이전 서버가 비정상 종료하여 남은 소켓 파일만 정리 (실행 중인 서버가 있으면 오류)
+        try:
+            send_request({"command": "ping"}, socket_path, timeout=1)
+        except OSError:
+            os.remove(socket_path)
+        else:
+            raise RuntimeError(f"이미 실행 중인 작업 서버 있음: {socket_path}")
+    return UnixWorkerServer(socket_path, JobHandler)
+
+def send_request(request, socket_path=DEFAULT_SOCKET, port=None, timeout=None):
+    """
+    작업 서버에 요청을 보내고 응답 dict 반환 (실행이 끝날 때까지 대기)
+    """
+    if port:
+        sock = socket.create_connection(("127.0.0.1", port), timeout=timeout)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+    with sock, sock.makefile("rwb") as f:
+        f.write((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+        f.flush()
+        line = f.readline()
+    if not line:
+        raise ConnectionError("작업 서버 응답 없음")
+    return json.loads(line)
+
+def serve(args):
+    import cal_index_li
+    import cal_index_li_batch
+
+    logging.basicConfig(level=logging.INFO, format=cal_index_li.LOG_FORMAT,
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    species = cal_index_li.load_species(args.species_config)
+    server = make_server(args.socket, args.port)
+    server.setup_worker(args.calmet_dir, args.calpuff_dir, args.info_dir, args.output_root, species)
+
+    # 자주 쓰는 지역/모델의 격자-리 인덱스를 미리 메모리에 로드
+    if args.preload_date:
+        runs = cal_index_li_batch.build_runs([args.preload_date], args.preload_targets, args.preload_models)
+        cal_index_li_batch.preload_region_index(runs, args.calmet_dir, args.calpuff_dir, args.info_dir,
+                                                args.output_root, species,
+                                                region_filter=cal_index_li.region_filter_args(args.preload_sig,
+                                                                                              args.preload_emd))
+
+    logger.info(f"--- 작업 서버 시작: {f'127.0.0.1:{args.port}' if args.port else args.socket} (pid {os.getpid()}) ---")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if not args.port and os.path.exists(args.socket):
+            os.remove(args.socket)
+        logger.info(f"--- 작업 서버 종료: 처리 {server.job_count}건 ---")
+    return 0
+
+def submit(args):
+    request = {"date": args.date, "target": args.target, "model": args.target_model}
+    if args.options:
+        request.update(json.loads(args.options))
+    response = send_request(request, args.socket, args.port)
+    print(json.dumps(response, ensure_ascii=False))
+    return 0 if response.get("status") == "ok" else 1
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="cal_index_li 상주 작업 서버 (로컬 소켓으로 실행 요청 처리)")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"unix 소켓 경로 (기본: {DEFAULT_SOCKET})")
+    parser.add_argument("--port", type=int, default=None, help="지정하면 unix 소켓 대신 127.0.0.1 TCP 포트 사용")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="작업 서버 실행")
+    p.add_argument("calmet_dir", help="CALMET nc 상위 폴더")
+    p.add_argument("calpuff_dir", help="CALPUFF nc 상위 폴더")
+    p.add_argument("info_dir", help="위경도-주소 정보 폴더")
+    p.add_argument("output_root", help="결과 및 로그 상위 폴더, {target} 포함 가능 ex) /out/{target}")
+    p.add_argument("--species-config", default=None, help="오염물질 등록 정보 json (기본: NH3, CO)")
+    p.add_argument("--preload-date", default=None, help="시작 시 격자-리 인덱스를 미리 로드할 기준 시각")
+    p.add_argument("--preload-targets", nargs="+", default=["jb", "ns"], help="미리 로드할 지역 (기본: jb ns)")
+    p.add_argument("--preload-models", nargs="+", default=["rdaps"], help="미리 로드할 모델 (기본: rdaps)")
+    p.add_argument("--preload-sig", nargs="+", default=None,
+                   help="미리 로드할 인덱스의 시군구 필터, 요청의 region_filter와 같아야 재사용 (기본: 지역별 기본 필터)")
+    p.add_argument("--preload-emd", nargs="+", default=None, help="미리 로드할 인덱스의 읍면동 필터")
+
+    p = sub.add_parser("submit", help="실행 요청을 보내고 완료까지 대기")
+    p.add_argument("date", help="예보 기준 시각 ex) 2024091121")
+    p.add_argument("target", help="'jb' or 'ns'")
+    p.add_argument("target_model", help="'klaps' or 'rdaps'")
+    p.add_argument("--options", default=None,
+                   help=f"run_index 옵션 json ex) '{{\"workers\": 4, \"compact\": true}}' (가능: {', '.join(JOB_OPTIONS)})")
+
+    sub.add_parser("ping", help="작업 서버 상태 확인")
+    sub.add_parser("shutdown", help="작업 서버 종료")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "serve":
+        return serve(args)
+    if args.command == "submit":
+        return submit(args)
+    response = send_request({"command": args.command}, args.socket, args.port)
+    print(json.dumps(response, ensure_ascii=False))
+    return 0 if response.get("status") == "ok" else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,861 @@
+# ***************************************
+# cal_index_li 기존 방식 동일성 시험
+# 작은 합성 CALPUFF/CALMET/지역 정보 자료로 기존 방식(격자 csv 저장 후 재로드, 병합, groupby 평균)과
+# run_index 결과 리 평균 csv가 같은지 확인 (리/등급은 그대로, 평균값은 cal_index_li.LI_MEAN_RTOL 이내)
+# ex) python -m unittest discover -s tests
+# ***************************************
+
+import io
+import os
+import json
+import sys
+import shutil
+import tempfile
+import unittest
+import contextlib
+import multiprocessing
+import threading
+import time
+from unittest import mock
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cal_index_li
+import cal_index_li_batch
+import cal_index_li_bench
+import cal_index_li_worker
+
+try:
+    import geopandas as gpd
+    import shapely
+except ImportError: # 면적 가중(--li-polygons) 선택 의존성
+    gpd = None
+
+DATE = "2024091121"
+MODEL = "klaps"
+NY, NX = 12, 15
+N_HOURS = 4
+BORDER = 10
+LI_KEYS = ['CTP_KOR_NM', 'CTPRVN_CD', 'SIG_KOR_NM', 'SIG_CD', 'EMD_KOR_NM', 'EMD_CD', 'LI_KOR_NM', 'LI_CD']
+
+def hour_files(target, first_hour=1, date=DATE):
+    # CALPUFF 시간 파일 이름 (첫 파일 시각은 실행 기준 시각 + first_hour시간)
+    return [f"{MODEL}_{date}_{pd.Timestamp(date[:8] + ' ' + date[8:] + ':00') + pd.Timedelta(hours=h + first_hour):%Y%m%d%H}_{target}.nc"
+            for h in range(N_HOURS)]
+
+def make_inputs(root, target, first_hour=1, date=DATE):
+    """
+    합성 입력 자료 생성 (CALPUFF 시간 파일, CALMET 파일, 지역 정보 csv)
+    같은 root에 여러 기준 시각(date)을 만들 수 있음 (지역 정보 csv는 같은 내용)
+    """
+    rng = np.random.default_rng(7)
+    x = np.arange(NX, dtype=np.float32) * 0.1 + 300.0
+    y = np.arange(NY, dtype=np.float32) * 0.1 + 4000.0
+    lat = (36.0 + np.arange(NY)[:, None] * 0.001 + np.arange(NX)[None, :] * 0.0001).astype(np.float32)
+    lon = (127.0 + np.arange(NX)[None, :] * 0.0011 + np.arange(NY)[:, None] * 0.00003).astype(np.float32)
+    folder = f"{date}_{MODEL}_{target}"
+    for sp_dir, var, scale in (("nc_nh3", "NH3", 40.0), ("nc_co", "OU", 7.0)):
+        d = os.path.join(root, "CALPUFF", folder, sp_dir)
+        os.makedirs(d)
+        for file_name in hour_files(target, first_hour, date):
+            ds = nc.Dataset(os.path.join(d, file_name), "w")
+            ds.createDimension("t", 1)
+            ds.createDimension("z", 1)
+            ds.createDimension("y", NY)
+            ds.createDimension("x", NX)
+            v = ds.createVariable(var, "f4", ("t", "z", "y", "x"), fill_value=-9999.0)
+            field = np.ma.masked_array(rng.gamma(2.0, scale, (NY, NX)).astype(np.float32))
+            field[0, :3] = np.ma.masked # 결측 격자
+            v[0, 0] = field
+            ds.createVariable("lat", "f4", ("y", "x"))[:] = lat
+            ds.createVariable("lon", "f4", ("y", "x"))[:] = lon
+            ds.createVariable("x", "f4", ("x",))[:] = x
+            ds.createVariable("y", "f4", ("y",))[:] = y
+            ds.close()
+
+    d = os.path.join(root, "CALMET", folder)
+    os.makedirs(d)
+    ds = nc.Dataset(os.path.join(d, f"{MODEL}_{date}_{target}.nc"), "w")
+    ds.createDimension("time", N_HOURS)
+    ds.createDimension("z", 2)
+    ds.createDimension("Y", NY + 2 * BORDER)
+    ds.createDimension("X", NX + 2 * BORDER)
+    for name in "UVT":
+        ds.createVariable(name, "f4", ("time", "z", "Y", "X"))[:] = (
+            rng.normal(0, 3, (N_HOURS, 2, NY + 2 * BORDER, NX + 2 * BORDER)) + (290 if name == "T" else 0)).astype(np.float32)
+    ds.createVariable("RH", "f4", ("time", "Y", "X"))[:] = rng.uniform(30, 100, (N_HOURS, NY + 2 * BORDER, NX + 2 * BORDER)).astype(np.float32)
+    ds.close()
+
+    # 지역 정보: 일부 격자만 포함, 리 없는 격자(읍면동으로 채움), 격자 밖 행, 여러 격자에 걸친 리 포함
+    X, Y = np.meshgrid(x, y)
+    grid = pd.DataFrame({"X": X.ravel(), "Y": Y.ravel(), "Lat": lat.ravel(), "Lon": lon.ravel()})
+    grid = pd.read_csv(io.StringIO(grid.to_csv(index=False)))
+    sel = grid.sample(frac=0.7, random_state=1).sort_index()
+    sig = np.where(sel.X.values < 300.7, "논산시", "계룡시")
+    emd = (sel.X.values * 10).astype(int) % 3 + 10 * ((sel.Y.values * 10).astype(int) % 2)
+    li = (sel.Y.values * 100).astype(int) % 7
+    region = pd.DataFrame({
+        "X": sel.X.values, "Y": sel.Y.values, "Lat": sel.Lat.values, "Lon": sel.Lon.values,
+        "CTP_KOR_NM": "충청남도", "CTPRVN_CD": 44, "SIG_KOR_NM": sig, "SIG_CD": np.where(sig == "논산시", 44230, 44250),
+        "EMD_KOR_NM": [f"읍{e}" for e in emd], "EMD_CD": 4423000000 + emd * 100,
+        "LI_KOR_NM": [f"리{l}" if l % 3 else None for l in li],
+        "LI_CD": np.where(li % 3 != 0, 4423000000 + emd * 100 + li, np.nan)})
+    outside = region.iloc[:3].copy()
+    outside["X"] += 1000
+    os.makedirs(os.path.join(root, "info"), exist_ok=True)
+    pd.concat([region, outside]).to_csv(os.path.join(root, "info", f"addresses_code_{target}.csv"), index=False)
+
+def baseline_li_csv(root, target, out_dir, default_filter=True):
+    """
+    기존 cal_index_li.py 처리 순서 그대로 만든 리 평균 csv 경로
+    default_filter: False면 ns도 논산시 필터 없이 전체 지역
+    """
+    folder = f"{DATE}_{MODEL}_{target}"
+    ds_calmet = nc.Dataset(os.path.join(root, "CALMET", folder, f"{MODEL}_{DATE}_{target}.nc"))
+    frames = []
+    for i, file_name in enumerate(hour_files(target)):
+        ds_nh3 = nc.Dataset(os.path.join(root, "CALPUFF", folder, "nc_nh3", file_name))
+        ds_co = nc.Dataset(os.path.join(root, "CALPUFF", folder, "nc_co", file_name))
+        nh3 = ds_nh3.variables['NH3'][0, 0, :, :].flatten()
+        co = ds_co.variables['OU'][0, 0, :, :].flatten()
+        x_grid, y_grid = np.meshgrid(ds_nh3.variables['x'][:], ds_nh3.variables['y'][:])
+        stamp = file_name.replace(".nc", "").split("_")[2]
+        nc_df = pd.DataFrame({
+            "Date": [stamp[:8]] * len(nh3), "Time": [stamp[8:]] * len(nh3),
+            "X": x_grid.flatten(), "Y": y_grid.flatten(),
+            "Lat": ds_nh3.variables['lat'][:].flatten(), "Lon": ds_nh3.variables['lon'][:].flatten(),
+            "NH3": nh3, "CO": co})
+        u = ds_calmet.variables['U'][i, 0, 10:-10, 10:-10]
+        v = ds_calmet.variables['V'][i, 0, 10:-10, 10:-10]
+        df_calmet = pd.DataFrame({
+            "X": x_grid.flatten(), "Y": y_grid.flatten(),
+            "Temperature": ds_calmet.variables['T'][i, 0, 10:-10, 10:-10].flatten(),
+            "Relative_Humidity": ds_calmet.variables['RH'][i, 10:-10, 10:-10].flatten(),
+            "Wind_Speed": np.sqrt(u**2 + v**2).flatten(),
+            "Wind_Direction": ((270 - np.degrees(np.arctan2(v, u))) % 360).flatten()})
+        frames.append(pd.merge(nc_df, df_calmet, on=['X', 'Y'], how='left'))
+        ds_nh3.close()
+        ds_co.close()
+    ds_calmet.close()
+
+    data_csv = os.path.join(out_dir, "baseline_data.csv")
+    pd.concat(frames, ignore_index=True).to_csv(data_csv, index=False, encoding='utf-8-sig')
+    df_data = pd.read_csv(data_csv)
+    df_merged = pd.merge(pd.read_csv(os.path.join(root, "info", f"addresses_code_{target}.csv")), df_data,
+                         how="outer", on=['X', 'Y', 'Lat', 'Lon'])
+    df_merged.loc[:, 'LI_KOR_NM'] = df_merged['LI_KOR_NM'].fillna(df_merged['EMD_KOR_NM'])
+    df_merged.loc[:, 'LI_CD'] = df_merged['LI_CD'].fillna(df_merged['EMD_CD'])
+    if target == 'ns' and default_filter:
+        df_merged = df_merged[(df_merged['SIG_KOR_NM'] == '논산시')]
+    df_grouped = df_merged.groupby(['Date', 'Time'] + LI_KEYS).agg({
+        'NH3': 'mean', 'CO': 'mean', 'Temperature': 'mean', 'Relative_Humidity': 'mean',
+        'Wind_Speed': 'mean', 'Wind_Direction': 'mean'}).reset_index()
+    df_grouped['NH3'] = df_grouped['NH3'].apply(lambda v: 1 if v < 50 else 2 if v < 100 else 3 if v < 200 else 4).astype(int)
+    df_grouped['CO'] = df_grouped['CO'].apply(lambda v: 1 if v < 10 else 2 if v < 15 else 3 if v < 20 else 4).astype(int)
+    df_grouped['Temperature'] = df_grouped['Temperature'] - 273.15
+    out_path = os.path.join(out_dir, "baseline_index_li.csv")
+    df_grouped.to_csv(out_path, index=False, encoding='utf-8-sig')
+    return out_path
+
+def assert_li_csv_close(test, out_path, expected_path):
+    """
+    리 평균 csv 비교: 리 정보, 날짜/시간, 등급은 같아야 하고 평균값은 상대 오차 LI_MEAN_RTOL 이내
+    기온은 K 단위로 되돌려 비교 (허용 오차는 nc 입력값 기준)
+    """
+    out = pd.read_csv(out_path, encoding="utf-8-sig")
+    expected = pd.read_csv(expected_path, encoding="utf-8-sig")
+    test.assertEqual(list(out.columns), list(expected.columns))
+    float_cols = [col for col in cal_index_li.MET_COLS if col in expected]
+    pd.testing.assert_frame_equal(out.drop(columns=float_cols), expected.drop(columns=float_cols))
+    for col in float_cols:
+        offset = 273.15 if col == "Temperature" else 0.0
+        np.testing.assert_allclose(out[col] + offset, expected[col] + offset, rtol=cal_index_li.LI_MEAN_RTOL,
+                                   atol=0, equal_nan=True, err_msg=col)
+
+class BaselineEquivalenceTest(unittest.TestCase):
+    """
+    run_index 리 평균 csv가 기존 방식 결과와 같은지 확인 (평균값은 LI_MEAN_RTOL 이내)
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cal_index_li_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def run_target(self, target, **options):
+        # run_index 결과 csv와 기존 방식 결과 csv 비교
+        out_path = cal_index_li.run_index(DATE, target, MODEL, os.path.join(self.root, "CALMET"),
+                                          os.path.join(self.root, "CALPUFF"), os.path.join(self.root, "info"),
+                                          os.path.join(self.root, "out"), **options)
+        assert_li_csv_close(self, out_path, self.expected)
+        return out_path
+
+    def check_target(self, target, default_filter=True, **options):
+        make_inputs(self.root, target)
+        self.expected = baseline_li_csv(self.root, target, self.root, default_filter)
+        return self.run_target(target, **options)
+
+    def test_default_jb(self):
+        self.check_target("jb")
+
+    def test_default_ns(self):
+        self.check_target("ns")
+
+    def test_compact_workers(self):
+        self.check_target("jb", compact=True, workers=2)
+
+    def test_workers_shutdown_on_error(self):
+        # 실행이 오류로 중단되어도 시간 처리 프로세스 풀을 정리
+        make_inputs(self.root, "jb")
+        pools = []
+
+        def make_pool(*args, **kwargs):
+            pools.append(ProcessPoolExecutor(*args, **kwargs))
+            return pools[-1]
+
+        with mock.patch.object(cal_index_li, "ProcessPoolExecutor", side_effect=make_pool), \
+                mock.patch.object(cal_index_li, "check_calmet_alignment", side_effect=ValueError("격자 불일치")):
+            with self.assertRaises(ValueError):
+                cal_index_li.run_index(DATE, "jb", MODEL, os.path.join(self.root, "CALMET"),
+                                       os.path.join(self.root, "CALPUFF"), os.path.join(self.root, "info"),
+                                       os.path.join(self.root, "out"), workers=2)
+        self.assertEqual(len(pools), 1)
+        with self.assertRaises(RuntimeError): # 종료된 풀
+            pools[0].submit(int)
+
+    def test_hour_cache_rerun(self):
+        # 캐시된 시간 평균으로 다시 만든 결과는 처음 결과와 바이트 단위로 같아야 함
+        out_path = self.check_target("ns", hour_cache=True)
+        with open(out_path, "rb") as f:
+            first = f.read()
+        with open(self.run_target("ns", hour_cache=True), "rb") as f:
+            self.assertEqual(f.read(), first)
+
+    def test_hour_cache_invalidated_by_source_change(self):
+        # 한 시간 파일이 바뀌면 그 시간만 다시 처리, 결과는 캐시 없이 처리한 결과와 같아야 함
+        self.check_target("jb", hour_cache=True)
+        path = os.path.join(self.root, "CALPUFF", f"{DATE}_{MODEL}_jb", "nc_nh3", hour_files("jb")[1])
+        with nc.Dataset(path, "a") as ds:
+            ds.variables["NH3"][0, 0] = ds.variables["NH3"][0, 0] * 3
+        self.expected = baseline_li_csv(self.root, "jb", self.root)
+        self.run_target("jb", hour_cache=True)
+        with open(os.path.join(self.root, "out", DATE, MODEL, f"calpuff_process_{DATE}_{MODEL}.log"),
+                  encoding="utf-8") as f:
+            self.assertIn(f"시간별 결과 캐시 사용 {N_HOURS - 1}/{N_HOURS}개, 처리 1개", f.read())
+
+    def test_empty_region_filter_ns(self):
+        # 빈 필터는 '필터 없음': ns도 논산시 기본 필터 없이 지역 정보 전체 (시간 캐시 재실행 포함)
+        out_path = self.check_target("ns", default_filter=False, region_filter={}, hour_cache=True)
+        sigs = set(pd.read_csv(out_path, encoding="utf-8-sig")["SIG_KOR_NM"])
+        self.assertEqual(sigs, {"논산시", "계룡시"})
+        self.run_target("ns", region_filter={}, hour_cache=True)
+
+class SpeciesTest(unittest.TestCase):
+    """
+    오염물질 등록 정보와 등급 산출(grade_values)이 기존 grade_nh3/grade_co와 같은지, 등록한 오염물질이 결과에 추가되는지 확인
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cal_index_li_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_grade_values_matches_legacy(self):
+        legacy = {"NH3": lambda v: 1 if v < 50 else 2 if v < 100 else 3 if v < 200 else 4,
+                  "CO": lambda v: 1 if v < 10 else 2 if v < 15 else 3 if v < 20 else 4}
+        values = np.array([0.0, 9.999, 10.0, 14.9, 15.0, 20.0, 49.9, 50.0, 99.9, 100.0, 199.9, 200.0, 1e6, np.nan])
+        for sp in cal_index_li.DEFAULT_SPECIES:
+            np.testing.assert_array_equal(cal_index_li.grade_values(values, sp["thresholds"]),
+                                          [legacy[sp["column"]](v) for v in values], err_msg=sp["column"])
+
+    def write_config(self, species):
+        path = os.path.join(self.root, "species.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(species, f)
+        return path
+
+    def test_load_species_validation(self):
+        self.assertIs(cal_index_li.load_species(), cal_index_li.DEFAULT_SPECIES)
+        with self.assertRaises(ValueError):
+            cal_index_li.load_species(self.write_config([{"column": "H2S", "dir": "nc_h2s", "var": "H2S"}]))
+        with self.assertRaises(ValueError):
+            cal_index_li.load_species(self.write_config(
+                [{"column": "H2S", "dir": "nc_h2s", "var": "H2S", "thresholds": [2, 1]}]))
+
+    def test_registered_species_in_output(self):
+        # CO 파일을 H2S 폴더로 복사하고 CO와 같은 등급 경계로 등록하면 H2S 등급은 CO 등급과 같아야 함
+        make_inputs(self.root, "jb")
+        folder = os.path.join(self.root, "CALPUFF", f"{DATE}_{MODEL}_jb")
+        shutil.copytree(os.path.join(folder, "nc_co"), os.path.join(folder, "nc_h2s"))
+        species = cal_index_li.load_species(self.write_config(
+            cal_index_li.DEFAULT_SPECIES + [{"column": "H2S", "dir": "nc_h2s", "var": "OU", "thresholds": [10, 15, 20]}]))
+        out_path = cal_index_li.run_index(DATE, "jb", MODEL, os.path.join(self.root, "CALMET"),
+                                          os.path.join(self.root, "CALPUFF"), os.path.join(self.root, "info"),
+                                          os.path.join(self.root, "out"), species=species)
+        out = pd.read_csv(out_path, encoding="utf-8-sig")
+        self.assertIn("H2S", out.columns)
+        pd.testing.assert_series_equal(out["H2S"], out["CO"], check_names=False)
+
+class CalmetAlignmentTest(unittest.TestCase):
+    """
+    CALMET/CALPUFF 격자 정합 확인: 격자 크기나 좌표(허용 오차 초과)가 다르면 실행 중단
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cal_index_li_test_")
+        make_inputs(self.root, "jb")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def add_calmet_x(self, shift):
+        # 가장자리(BORDER)를 포함한 CALMET x 좌표, CALPUFF x 좌표에서 shift만큼 이동
+        path = os.path.join(self.root, "CALMET", f"{DATE}_{MODEL}_jb", f"{MODEL}_{DATE}_jb.nc")
+        with nc.Dataset(path, "a") as ds:
+            ds.createVariable("x", "f8", ("X",))[:] = (np.arange(NX + 2 * BORDER) - BORDER) * 0.1 + 300.0 + shift
+
+    def run_index(self):
+        return cal_index_li.run_index(DATE, "jb", MODEL, os.path.join(self.root, "CALMET"),
+                                      os.path.join(self.root, "CALPUFF"), os.path.join(self.root, "info"),
+                                      os.path.join(self.root, "out"))
+
+    def test_coords_within_tolerance(self):
+        self.add_calmet_x(cal_index_li.CALMET_COORD_TOL / 2)
+        self.run_index()
+        with open(os.path.join(self.root, "out", DATE, MODEL, f"calpuff_process_{DATE}_{MODEL}.log"),
+                  encoding="utf-8") as f:
+            self.assertIn("비교 좌표: ['x']", f.read())
+
+    def test_shifted_coords_raise(self):
+        self.add_calmet_x(cal_index_li.CALMET_COORD_TOL * 5)
+        with self.assertRaisesRegex(ValueError, "CALMET 좌표 x 불일치"):
+            self.run_index()
+
+    def test_shape_mismatch_raises(self):
+        nc_df = pd.DataFrame({col: np.zeros(NY * NX) for col in cal_index_li.GRID_KEYS})
+        calmet = {"shape": (NY, NX - 1), "coords": {}, "fields": {}}
+        with self.assertRaisesRegex(ValueError, "격자 크기"):
+            cal_index_li.check_calmet_alignment(calmet, nc_df, (NY, NX))
+        calmet["shape"] = (NY, NX)
+        self.assertEqual(cal_index_li.check_calmet_alignment(calmet, nc_df, (NY, NX)), [])
+
+class CubeOutputTest(unittest.TestCase):
+    """
+    추가 출력(netcdf/zarr cube, 분할 parquet) 값이 리 평균 csv와 같은지 확인
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cal_index_li_test_")
+        make_inputs(self.root, "jb")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def run_index(self, formats):
+        out_path = cal_index_li.run_index(DATE, "jb", MODEL, os.path.join(self.root, "CALMET"),
+                                          os.path.join(self.root, "CALPUFF"), os.path.join(self.root, "info"),
+                                          os.path.join(self.root, "out"), cube_output=formats)
+        # csv 실수는 그대로 되읽어 비교 (round_trip)
+        return out_path, pd.read_csv(out_path, encoding="utf-8-sig", float_precision="round_trip")
+
+    def test_cube_matches_csv(self):
+        import xarray as xr
+
+        out_path, csv = self.run_index(["netcdf", "zarr"])
+        hours = csv[["Date", "Time"]].drop_duplicates()
+        n_li = len(csv) // len(hours)
+        for cube in (xr.open_dataset(out_path[:-len(".csv")] + ".nc"), xr.open_zarr(out_path[:-len(".csv")] + ".zarr")):
+            with cube:
+                self.assertEqual(dict(cube.sizes), {"time": len(hours), "li": n_li})
+                np.testing.assert_array_equal(cube["LI_CD"].values, csv["LI_CD"].to_numpy()[:n_li])
+                self.assertEqual(list(cube["LI_KOR_NM"].values), list(csv["LI_KOR_NM"].astype(str)[:n_li]))
+                for col in [sp["column"] for sp in cal_index_li.DEFAULT_SPECIES] + cal_index_li.MET_COLS:
+                    np.testing.assert_array_equal(cube[col].values.ravel(), csv[col].to_numpy(), err_msg=col)
+                self.assertEqual(cube["time"].dt.strftime("%Y%m%d%H").values.tolist(),
+                                 [f"{int(d)}{int(t):02d}" for d, t in hours.itertuples(index=False)])
+
+    def test_parquet_matches_csv(self):
+        _, csv = self.run_index(["parquet"])
+        # 같은 실행을 다시 저장해도 해당 모델/날짜 분할만 교체 (행이 늘지 않음)
+        self.run_index(["parquet"])
+        parquet_root = os.path.join(self.root, "out", "index_li_parquet")
+        rows = pd.read_parquet(parquet_root)
+        self.assertEqual(len(rows), len(csv))
+        self.assertEqual(set(rows["model"].astype(str)), {MODEL})
+        self.assertEqual(set(rows["date"].astype(str)), {DATE})
+        np.testing.assert_array_equal(rows["LI_CD"].to_numpy(), csv["LI_CD"].to_numpy(dtype=np.int64))
+        for col in [sp["column"] for sp in cal_index_li.DEFAULT_SPECIES] + cal_index_li.MET_COLS:
+            np.testing.assert_array_equal(rows[col].to_numpy(), csv[col].to_numpy(), err_msg=col)
+        meta = pd.read_parquet(f"{parquet_root}_li_meta")
+        self.assertEqual(str(meta["LI_CD"].dtype), "Int64")
+        self.assertEqual(set(meta["LI_CD"]), set(csv["LI_CD"].astype(np.int64)))
+
+class ArgsTest(unittest.TestCase):
+    """
+    프로세스/실행 수 옵션은 1 이상 정수만 허용
+    """
+
+    def parse_error(self, parser, argv):
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            parser.parse_args(argv)
+
+    def test_workers_and_jobs(self):
+        args = [DATE, "jb", MODEL, "calmet", "calpuff", "info", "out"]
+        self.assertEqual(cal_index_li.build_parser().parse_args(args + ["--workers", "2"]).workers, 2)
+        for value in ("0", "-1", "x"):
+            self.parse_error(cal_index_li.build_parser(), args + ["--workers", value])
+        batch_args = ["calmet", "calpuff", "info", "out", "--dates", DATE]
+        for option in ("--jobs", "--workers"):
+            self.parse_error(cal_index_li_batch.build_parser(), batch_args + [option, "0"])
+
+class BatchTest(unittest.TestCase):
+    """
+    배치 처리(cal_index_li_batch) 날짜별 결과가 날짜마다 따로 run_index를 실행한 결과와 같은지 확인
+    작업 프로세스를 spawn으로 시작해도 미리 로드한 격자-리 인덱스를 넘겨받아 다시 만들지 않아야 함
+    """
+    DATES = (DATE, "2024091221")
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cal_index_li_test_")
+        for date in self.DATES:
+            make_inputs(self.root, "jb", date=date)
+        self.dirs = [os.path.join(self.root, name) for name in ("CALMET", "CALPUFF", "info")]
+
+    def tearDown(self):
+        cal_index_li._li_index_memo.clear()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_two_dates_match_single_runs(self):
+        expected = {date: self.read(cal_index_li.run_index(date, "jb", MODEL, *self.dirs,
+                                                           os.path.join(self.root, "single")))
+                    for date in self.DATES}
+        cal_index_li._li_index_memo.clear()
+
+        def spawn_pool(*args, **kwargs):
+            # fork로 부모 메모리를 물려받지 않는 시작 방식
+            return ProcessPoolExecutor(*args, **{**kwargs, "mp_context": multiprocessing.get_context("spawn")})
+
+        runs = cal_index_li_batch.build_runs(self.DATES, ["jb"], [MODEL])
+        out_root = os.path.join(self.root, "batch")
+        with mock.patch.object(cal_index_li_batch, "ProcessPoolExecutor", spawn_pool):
+            results = cal_index_li_batch.run_batch(runs, *self.dirs, out_root, jobs=2)
+        self.assertEqual([run for run, _, _ in results], runs)
+        for (date, _, _), out_path, error in results:
+            self.assertIsNone(error)
+            self.assertEqual(self.read(out_path), expected[date])
+            with open(os.path.join(out_root, date, MODEL, f"calpuff_process_{date}_{MODEL}.log"), encoding="utf-8") as f:
+                log = f.read()
+            self.assertIn("격자-리 인덱스 메모리 재사용", log)
+            self.assertNotIn("격자-리 인덱스 생성", log)
+
+class LiIndexCacheTest(unittest.TestCase):
+    """
+    격자-리 인덱스 캐시(li_index_*.pkl): 지역 정보 파일, 격자, 지역 필터가 바뀌면 새 캐시를 만들고
+    같은 입력으로 다시 실행하면 캐시를 읽어 인덱스를 다시 만들지 않는지 확인
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cal_index_li_test_")
+        self.cache_dir = os.path.join(self.root, "out", "li_index_cache")
+        make_inputs(self.root, "jb")
+        cal_index_li._li_index_memo.clear()
+
+    def tearDown(self):
+        cal_index_li._li_index_memo.clear()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def run_index(self, **options):
+        # 새 프로세스처럼 메모리 재사용 없이 실행, 반환값: 결과 csv 내용
+        cal_index_li._li_index_memo.clear()
+        out_path = cal_index_li.run_index(DATE, "jb", MODEL, os.path.join(self.root, "CALMET"),
+                                          os.path.join(self.root, "CALPUFF"), os.path.join(self.root, "info"),
+                                          os.path.join(self.root, "out"), **options)
+        with open(out_path, "rb") as f:
+            return f.read()
+
+    def cache_files(self):
+        return sorted(f for f in os.listdir(self.cache_dir) if f.startswith("li_index_"))
+
+    def test_second_run_reads_cache(self):
+        first = self.run_index()
+        self.assertEqual(len(self.cache_files()), 1)
+        with mock.patch.object(cal_index_li, "build_li_index", side_effect=AssertionError("캐시를 읽지 않음")):
+            self.assertEqual(self.run_index(), first)
+        self.assertEqual(len(self.cache_files()), 1)
+
+    def test_changed_address_file(self):
+        self.run_index()
+        region_info_file = os.path.join(self.root, "info", "addresses_code_jb.csv")
+        region = pd.read_csv(region_info_file)
+        region.loc[region.index[0], "LI_KOR_NM"] = "새리"
+        region.to_csv(region_info_file, index=False)
+        self.run_index()
+        self.assertEqual(len(self.cache_files()), 2)
+
+    def test_changed_region_filter(self):
+        self.run_index()
+        self.run_index(region_filter={"SIG": ["계룡시"]})
+        self.assertEqual(len(self.cache_files()), 2)
+
+    def test_changed_grid(self):
+        region_info_file = os.path.join(self.root, "info", "addresses_code_jb.csv")
+        grid = pd.read_csv(region_info_file)[cal_index_li.GRID_KEYS].iloc[:NY * NX // 2].reset_index(drop=True)
+        cal_index_li.load_li_index(region_info_file, grid, (NY, NX), "jb", self.cache_dir)
+        moved = grid.assign(X=grid["X"] + 0.05)
+        cal_index_li.load_li_index(region_info_file, moved, (NY, NX), "jb", self.cache_dir)
+        self.assertEqual(len(self.cache_files()), 2)
+        # 같은 격자는 메모리/캐시 재사용
+        with mock.patch.object(cal_index_li, "build_li_index", side_effect=AssertionError("캐시를 읽지 않음")):
+            cal_index_li._li_index_memo.clear()
+            cal_index_li.load_li_index(region_info_file, moved, (NY, NX), "jb", self.cache_dir)
+        self.assertEqual(len(self.cache_files()), 2)
+
+class WorkerServerTest(unittest.TestCase):
+    """
+    상주 작업 서버(cal_index_li_worker): 임시 unix 소켓으로 요청한 결과가 run_index 결과와 같은지,
+    JOB_OPTIONS에 없는 요청 항목은 거부하는지, 메모리에 유지하는 격자-리 인덱스 수가 제한되는지 확인
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cal_index_li_test_")
+        make_inputs(self.root, "jb")
+        self.dirs = [os.path.join(self.root, name) for name in ("CALMET", "CALPUFF", "info")]
+        self.socket_path = os.path.join(self.root, "worker.sock")
+        self.server = cal_index_li_worker.make_server(self.socket_path)
+        self.server.setup_worker(*self.dirs, os.path.join(self.root, "worker"), cal_index_li.DEFAULT_SPECIES)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join(timeout=10)
+        cal_index_li._li_index_memo.clear()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def submit(self, **request):
+        return cal_index_li_worker.send_request(request, self.socket_path, timeout=60)
+
+    def test_job_matches_run_index(self):
+        with open(cal_index_li.run_index(DATE, "jb", MODEL, *self.dirs, os.path.join(self.root, "direct")), "rb") as f:
+            expected = f.read()
+        response = self.submit(date=DATE, target="jb", model=MODEL, compact=True)
+        self.assertEqual(response["status"], "ok", response)
+        with open(response["out_path"], "rb") as f:
+            self.assertEqual(f.read(), expected)
+        self.assertEqual(self.submit(command="ping")["jobs"], 1)
+
+    def test_unknown_option_rejected(self):
+        response = self.submit(date=DATE, target="jb", model=MODEL, output_root="/tmp/elsewhere")
+        self.assertEqual(response["status"], "error")
+        self.assertIn("output_root", response["error"])
+        self.assertEqual(self.submit(command="ping")["jobs"], 0)
+        self.assertFalse(os.path.exists(os.path.join(self.root, "worker")))
+
+    def test_li_index_memo_is_bounded(self):
+        # 지역 필터마다 다른 인덱스, 메모리에는 최근 LI_INDEX_MEMO_SIZE개만 유지
+        cal_index_li._li_index_memo.clear()
+        filters = [{"EMD": [f"읍{e}"]} for e in (0, 1, 2, 10, 11, 12)]
+        with mock.patch.object(cal_index_li, "LI_INDEX_MEMO_SIZE", 4):
+            for region_filter in filters:
+                response = self.submit(date=DATE, target="jb", model=MODEL, region_filter=region_filter)
+                self.assertEqual(response["status"], "ok", response)
+            self.assertEqual(len(cal_index_li._li_index_memo), 4)
+
+class TiledTest(unittest.TestCase):
+    """
+    메모리 예산(--memory-budget) 타일 처리 결과가 타일 처리를 하지 않은 실행과 바이트 단위로 같은지 확인
+    작은 합성 격자는 예산 1 MB 안에 들어가므로 TILE_BYTES_PER_VALUE를 키워 여러 타일로 나눔
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cal_index_li_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def run_index(self, target, out_name, **options):
+        return cal_index_li.run_index(DATE, target, MODEL, os.path.join(self.root, "CALMET"),
+                                      os.path.join(self.root, "CALPUFF"), os.path.join(self.root, "info"),
+                                      os.path.join(self.root, out_name), **options)
+
+    def check_tiled(self, target, memory_budget, tile_bytes=cal_index_li.TILE_BYTES_PER_VALUE, **options):
+        # 타일 처리 결과 csv가 타일 처리를 하지 않은 결과와 같은지 확인, 반환값: (시간 묶음, 타일 행 수)
+        if not os.path.exists(os.path.join(self.root, "info")):
+            make_inputs(self.root, target)
+        with open(self.run_index(target, "untiled", **options), "rb") as f:
+            expected = f.read()
+        out_name = f"tiled_{memory_budget}_{tile_bytes}"
+        with mock.patch.object(cal_index_li, "TILE_BYTES_PER_VALUE", tile_bytes):
+            out_path = self.run_index(target, out_name, memory_budget=memory_budget, **options)
+        with open(out_path, "rb") as f:
+            self.assertEqual(f.read(), expected)
+        metrics_file = os.path.join(self.root, out_name, DATE, MODEL, f"calpuff_process_{DATE}_{MODEL}_metrics.json")
+        with open(metrics_file, encoding="utf-8") as f:
+            stage = next(st for st in json.load(f)["stages"] if st["stage"] == "tiled_aggregate")
+        return stage["chunk_hours"], stage["tile_rows"]
+
+    def n_vars(self):
+        return len(cal_index_li.DEFAULT_SPECIES) + len(cal_index_li.MET_COLS)
+
+    def test_budget_1_and_1000(self):
+        # 합성 격자는 전체 시간이 한 타일
+        self.assertEqual(self.check_tiled("jb", 1), (N_HOURS, NY))
+        self.assertEqual(self.check_tiled("jb", 1000), (N_HOURS, NY))
+
+    def test_row_tiles(self):
+        # 한 시간 격자가 예산보다 커서 시간마다 5행씩 3개 타일
+        self.assertEqual(self.check_tiled("jb", 1, 2**20 // (NX * self.n_vars() * 5)), (1, 5))
+
+    def test_hour_chunks(self):
+        # 예산에 2시간씩 들어가도록 시간 묶음 처리
+        self.assertEqual(self.check_tiled("jb", 1, 2**20 // (NY * NX * self.n_vars() * 2)), (2, NY))
+
+    def test_region_filter_row_tiles(self):
+        # ns(논산시) 격자 범위 안에서 행 범위 타일 (범위의 열 수가 적어 전체 격자 기준 2행보다 많은 행씩)
+        chunk_hours, tile_rows = self.check_tiled("ns", 1, 2**20 // (NX * self.n_vars() * 2))
+        self.assertEqual(chunk_hours, 1)
+        self.assertLess(tile_rows, NY)
+
+    def test_empty_region_filter_row_tiles(self):
+        # ns에 빈 필터를 주면 타일 처리도 전체 격자, 전체 지역 (시간마다 5행씩)
+        self.assertEqual(self.check_tiled("ns", 1, 2**20 // (NX * self.n_vars() * 5), region_filter={}), (1, 5))
+        out_path = os.path.join(self.root, "untiled", DATE, MODEL)
+        csv_path = next(os.path.join(out_path, f) for f in os.listdir(out_path) if f.endswith("li.csv"))
+        self.assertEqual(set(pd.read_csv(csv_path, encoding="utf-8-sig")["SIG_KOR_NM"]), {"논산시", "계룡시"})
+
+class MetricsTest(unittest.TestCase):
+    """
+    성능 지표: 단계 중 최대 RSS(RssSampler), 파일 크기(file_bytes)와 실제로 읽은 배열 크기(loaded_bytes)
+    """
+    # 격자 x 시간당 읽는 바이트: CALPUFF 좌표 4개 + 오염물질 2개 (float32), CALMET 기온/습도 (float32)와 풍속/풍향 (float64)
+    CALPUFF_CELL_BYTES = 6 * 4
+    CALMET_CELL_BYTES = 2 * 4 + 2 * 8
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cal_index_li_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def run_metrics(self, target, out_name, **options):
+        if not os.path.exists(os.path.join(self.root, "CALPUFF", f"{DATE}_{MODEL}_{target}")):
+            make_inputs(self.root, target)
+        cal_index_li.run_index(DATE, target, MODEL, os.path.join(self.root, "CALMET"),
+                               os.path.join(self.root, "CALPUFF"), os.path.join(self.root, "info"),
+                               os.path.join(self.root, out_name), **options)
+        with open(os.path.join(self.root, out_name, DATE, MODEL, f"calpuff_process_{DATE}_{MODEL}_metrics.json"),
+                  encoding="utf-8") as f:
+            summary = json.load(f)
+        return summary, {st["stage"]: st for st in summary["stages"]}
+
+    def calpuff_file_bytes(self, target):
+        folder = os.path.join(self.root, "CALPUFF", f"{DATE}_{MODEL}_{target}")
+        return sum(os.path.getsize(os.path.join(folder, d, f)) for d in ("nc_nh3", "nc_co") for f in hour_files(target))
+
+    @unittest.skipIf(cal_index_li.current_rss_mb() is None, "/proc 필요")
+    def test_stage_peak_rss_sampled(self):
+        # 단계 중 잠깐 쓰고 해제한 메모리도 단계 최대 RSS에 기록 (종료 시 RSS에는 남지 않음)
+        metrics = cal_index_li.RunMetrics()
+        metrics.begin("transient")
+        block = np.ones(64 * 2**20 // 8)
+        time.sleep(10 * cal_index_li.RSS_SAMPLE_INTERVAL)
+        del block
+        summary = metrics.summary()
+        stage = summary["stages"][0]
+        self.assertGreater(stage["peak_delta_mb"], 48)
+        self.assertLess(stage["rss_delta_mb"], 16)
+        self.assertEqual(summary["peak_rss_mb"], stage["peak_rss_mb"])
+        self.assertFalse(metrics._sampler)
+
+    def test_loaded_bytes(self):
+        summary, stages = self.run_metrics("jb", "out")
+        cells = N_HOURS * NY * NX
+        self.assertEqual(stages["load_calpuff"]["file_bytes"], self.calpuff_file_bytes("jb"))
+        self.assertEqual(stages["load_calpuff"]["loaded_bytes"], cells * self.CALPUFF_CELL_BYTES)
+        self.assertEqual(stages["read_calmet"]["loaded_bytes"], cells * self.CALMET_CELL_BYTES)
+        self.assertEqual([h["loaded_bytes"] for h in summary["hours"]], [NY * NX * self.CALPUFF_CELL_BYTES] * N_HOURS)
+        self.assertEqual(summary["loaded_bytes"], sum(st.get("loaded_bytes", 0) for st in summary["stages"]))
+        self.assertEqual(summary["file_bytes"], sum(st.get("file_bytes", 0) for st in summary["stages"]))
+
+        # 타일 처리: 오염물질 값과 CALMET 블록만 읽음
+        _, stages = self.run_metrics("jb", "tiled", memory_budget=1)
+        self.assertEqual(stages["tiled_aggregate"]["file_bytes"], self.calpuff_file_bytes("jb"))
+        self.assertEqual(stages["tiled_aggregate"]["loaded_bytes"], cells * (2 * 4 + self.CALMET_CELL_BYTES))
+
+    def test_region_filter_loads_less(self):
+        # 지역 필터(ns: 논산시)는 격자 범위만 읽으므로 파일 크기는 같고 읽은 양은 적음
+        _, stages = self.run_metrics("ns", "out")
+        self.assertEqual(stages["load_calpuff"]["file_bytes"], self.calpuff_file_bytes("ns"))
+        self.assertLess(stages["load_calpuff"]["loaded_bytes"], N_HOURS * NY * NX * self.CALPUFF_CELL_BYTES)
+        self.assertEqual(stages["load_calpuff"]["loaded_bytes"] % (N_HOURS * self.CALPUFF_CELL_BYTES), 0)
+
+    def test_bench_without_rss(self):
+        # resource 모듈과 /proc 가 없어도(windows) 성능 측정은 시간만 기록하고 끝까지 실행
+        json_path = os.path.join(self.root, "bench.json")
+        with mock.patch.object(cal_index_li, "resource", None), \
+                mock.patch.object(cal_index_li, "current_rss_mb", lambda: None), \
+                contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(cal_index_li_bench.main(["--models", "klaps", "--grids", "16x24", "--workdir", self.root,
+                                                      "--json", json_path]), 0)
+        with open(json_path, encoding="utf-8") as f:
+            result = json.load(f)
+        self.assertIsNone(result["max_rss_mb"])
+        self.assertIn("li_index_build", [r["stage"] for r in result["results"]])
+        self.assertFalse([r for r in result["results"] if "peak_mb" in r])
+
+class FollowTest(unittest.TestCase):
+    """
+    실시간 모드(--follow): 시간 파일을 하나씩 넣으면서 실행한 결과가 모든 파일이 있을 때의 일괄 처리 결과와 같은지 확인
+    CALMET 시간 위치는 두 모드 모두 첫 시간 파일 기준 파일 시각으로 정함
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cal_index_li_test_")
+        self.staging = os.path.join(self.root, "staging")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def run_index(self, calpuff_root, out_name, **options):
+        return cal_index_li.run_index(DATE, "jb", MODEL, os.path.join(self.staging, "CALMET"), calpuff_root,
+                                      os.path.join(self.staging, "info"), os.path.join(self.root, out_name),
+                                      **options)
+
+    def drop_files(self, calpuff_root, file_names, delay=0.15):
+        # CALPUFF가 시간 파일을 쓰는 것처럼 오염물질 폴더에 하나씩 넣음 (임시 이름으로 쓰고 이름 변경)
+        folder = f"{DATE}_{MODEL}_jb"
+        for file_name in file_names:
+            time.sleep(delay)
+            for sp in cal_index_li.DEFAULT_SPECIES:
+                src = os.path.join(self.staging, "CALPUFF", folder, sp["dir"], file_name)
+                dst_dir = os.path.join(calpuff_root, folder, sp["dir"])
+                os.makedirs(dst_dir, exist_ok=True)
+                shutil.copy(src, os.path.join(dst_dir, file_name + ".tmp"))
+                os.replace(os.path.join(dst_dir, file_name + ".tmp"), os.path.join(dst_dir, file_name))
+
+    def follow(self, file_names, out_name="follow"):
+        # 실시간 모드 실행 중 다른 스레드에서 파일을 넣음, klaps는 13시간을 기다리므로 제한 시간으로 종료
+        calpuff_root = os.path.join(self.root, f"{out_name}_calpuff")
+        dropper = threading.Thread(target=self.drop_files, args=(calpuff_root, file_names))
+        dropper.start()
+        try:
+            out_path = self.run_index(calpuff_root, out_name, follow=True, poll_interval=0.03,
+                                      timeout=0.15 * len(file_names) + 1.0)
+        finally:
+            dropper.join()
+        return out_path
+
+    def batch(self, file_names, out_name="batch"):
+        calpuff_root = os.path.join(self.root, f"{out_name}_calpuff")
+        self.drop_files(calpuff_root, file_names, delay=0)
+        return self.run_index(calpuff_root, out_name)
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_follow_matches_batch(self):
+        make_inputs(self.staging, "jb")
+        files = hour_files("jb")
+        self.assertEqual(self.read(self.follow(files)), self.read(self.batch(files)))
+
+    def test_late_earlier_hour(self):
+        # 앞 시간 파일이 늦게 도착해도 시간 순서대로, 같은 CALMET 시간으로 처리
+        make_inputs(self.staging, "jb")
+        files = hour_files("jb")
+        order = [files[0], files[2], files[1], files[3]]
+        self.assertEqual(self.read(self.follow(order)), self.read(self.batch(files)))
+
+    def test_first_file_at_run_time(self):
+        # 첫 시간 파일 시각이 실행 기준 시각이어도 건너뛰지 않음
+        make_inputs(self.staging, "jb", first_hour=0)
+        files = hour_files("jb", first_hour=0)
+        out_path = self.follow(files)
+        self.assertEqual(self.read(out_path), self.read(self.batch(files)))
+        self.assertEqual(len(pd.read_csv(out_path).groupby(["Date", "Time"])), N_HOURS)
+
+    def test_missing_hour(self):
+        # 중간 시간 파일이 없으면 두 모드 모두 뒤 시간에 파일 시각에 맞는 CALMET 시간 사용
+        # (결과는 모든 파일로 처리한 결과에서 빠진 시간 행만 뺀 것과 같음)
+        make_inputs(self.staging, "jb")
+        files = hour_files("jb")
+        partial = files[:1] + files[2:]
+        batch = self.batch(partial, "batch_missing")
+        self.assertEqual(self.read(self.follow(partial)), self.read(batch))
+        full = pd.read_csv(self.batch(files))
+        date_part, time_part = cal_index_li.hour_of_file(files[1])
+        missing = full[(full["Date"] == int(date_part)) & (full["Time"] == int(time_part))]
+        self.assertEqual(len(missing), len(full) // N_HOURS)
+        pd.testing.assert_frame_equal(pd.read_csv(batch), full.drop(missing.index).reset_index(drop=True))
+
+@unittest.skipUnless(gpd, "geopandas 필요")
+class AreaWeightTest(unittest.TestCase):
+    """
+    면적 가중 리 목록: 격자점 매칭 리, 격자 밖 지역 정보 리, 경계 파일에만 있는 리의 합집합
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cal_index_li_test_")
+        make_inputs(self.root, "jb")
+        self.info = os.path.join(self.root, "info", "addresses_code_jb.csv")
+        region = pd.read_csv(self.info)
+        # 모든 행이 격자 밖인 리
+        outside = region.iloc[[0, 0]].copy()
+        outside["X"] += 5000
+        outside["LI_KOR_NM"] = "격자밖리"
+        outside["LI_CD"] = 4423011111
+        pd.concat([region, outside]).to_csv(self.info, index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def run_polygons(self, codes, out_name="out", **options):
+        box = lambda a, b, c, d: shapely.box(127.0 + a, 36.0 + b, 127.0 + c, 36.0 + d)
+        gpd.GeoDataFrame({"LI_CD": codes, "LI_KOR_NM": ["격자밖리", "경계만리"],
+                          "geometry": [box(0.002, 0.002, 0.004, 0.004), box(0.001, 0.005, 0.003, 0.008)]},
+                         crs=4326).to_file(os.path.join(self.root, "li.geojson"), driver="GeoJSON")
+        return cal_index_li.run_index(DATE, "jb", MODEL, os.path.join(self.root, "CALMET"),
+                                      os.path.join(self.root, "CALPUFF"), os.path.join(self.root, "info"),
+                                      os.path.join(self.root, out_name), li_polygons=os.path.join(self.root, "li.geojson"),
+                                      **options)
+
+    def test_tiled_matches_untiled(self):
+        # 면적 가중 합계도 격자 번호 순서로 누적하므로 행 범위 타일 결과가 같음
+        with open(self.run_polygons([4423011111, 4423022222]), "rb") as f:
+            expected = f.read()
+        n_vars = len(cal_index_li.DEFAULT_SPECIES) + len(cal_index_li.MET_COLS)
+        with mock.patch.object(cal_index_li, "TILE_BYTES_PER_VALUE", 2**20 // (NX * n_vars * 3)):
+            out_path = self.run_polygons([4423011111, 4423022222], "tiled", memory_budget=1)
+        with open(out_path, "rb") as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_union_of_polygon_and_address_li(self):
+        df = pd.read_csv(self.run_polygons([4423011111, 4423022222]))
+        counts = df.groupby("LI_KOR_NM").size()
+        self.assertEqual(counts["격자밖리"], N_HOURS)
+        self.assertEqual(counts["경계만리"], N_HOURS)
+        self.assertFalse(df[df["LI_KOR_NM"].isin(["격자밖리", "경계만리"])]["Temperature"].isna().any())
+
+    def test_duplicate_code_rejected(self):
+        region = pd.read_csv(self.info)
+        code = region["LI_CD"].dropna().iloc[0]
+        # 같은 리 코드를 이름이 다른 리에 사용
+        duplicate = region[region["LI_CD"] == code].copy()
+        duplicate["LI_KOR_NM"] = "다른리"
+        pd.concat([region, duplicate]).to_csv(self.info, index=False)
+        with self.assertRaisesRegex(ValueError, "LI_CD"):
+            self.run_polygons([code, 4423022222])
+
+if __name__ == "__main__":
+    unittest.main()
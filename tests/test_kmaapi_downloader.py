@@ -0,0 +1,380 @@
+# ***************************************
+# KMAAPI_Downloader 이어 받기/재시도 시험
+# KMAAPI_mock_server 를 백그라운드로 띄워 중간 끊김, 416, Range 미지원, 서버 파일 변경 시
+# 최종 파일이 서버 내용과 같은지 확인
+# (리 평균 기존 방식 동일성 시험은 test_cal_index_li.py)
+# ex) python -m unittest discover -s tests
+# ***************************************
+
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import KMAAPI_Downloader
+import KMAAPI_mock_server
+
+try:
+    import numpy as np
+    import xarray as xr
+    import eccodes
+except ImportError: # 부분 저장(--subset) 시험에만 필요
+    eccodes = None
+
+FILE_NAME = "r030_v040_ne36_pres_h003.2024061012.gb2"
+FILE_SIZE_MB = 0.25 # 전송 단위(64KB) 4개
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.server, url_format = KMAAPI_mock_server.start_mock_server(file_size_mb=FILE_SIZE_MB)
+        self.url = url_format.format(filename=FILE_NAME, authKey="test")
+        self.save_path = os.path.join(self.save_dir, FILE_NAME)
+        self.part_path = f"{self.save_path}.part"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.save_dir, ignore_errors=True)
+
+    def download(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return KMAAPI_Downloader.download_file(self.url, FILE_NAME, save_dir=self.save_dir)
+
+    def server_bytes(self, start=0, end=None):
+        size = self.server.options["file_size"]
+        return KMAAPI_mock_server.file_bytes(FILE_NAME, start, size if end is None else end, size)
+
+    def write_part(self, data, size=None, validator=None):
+        with open(self.part_path, "wb") as f:
+            f.write(data)
+        with open(f"{self.part_path}.json", "w", encoding="utf-8") as f:
+            json.dump({"validator": validator, "size": size}, f)
+
+    def assertDownloaded(self):
+        with open(self.save_path, "rb") as f:
+            self.assertEqual(f.read(), self.server_bytes())
+        self.assertFalse(os.path.exists(self.part_path))
+        self.assertFalse(os.path.exists(f"{self.part_path}.json"))
+
+    def test_truncated_download_resumes_with_range(self):
+        self.server.options.update(error_rate=1.0, truncate_share=1.0)
+        self.assertFalse(self.download())
+        self.assertFalse(os.path.exists(self.save_path))
+        received = os.path.getsize(self.part_path)
+        self.assertGreater(received, 0)
+
+        self.server.options["error_rate"] = 0.0
+        self.assertTrue(self.download())
+        self.assertDownloaded()
+        stats = self.server.snapshot()
+        self.assertEqual(stats["range_requests"], 1)
+        # 끊긴 요청은 절반, 이어 받기에서는 받지 못한 부분만 전송
+        size = self.server.options["file_size"]
+        self.assertEqual(stats["bytes_sent"], size // 2 + size - received)
+
+    def test_range_not_satisfiable_restarts(self):
+        size = self.server.options["file_size"]
+        # .part 가 서버 파일보다 큼 → 416 → 처음부터 다시 받기
+        self.write_part(self.server_bytes() + b"extra", size=size)
+        self.assertTrue(self.download())
+        self.assertDownloaded()
+        self.assertEqual(self.server.snapshot()["requests"], 2)
+
+    def test_server_without_range_restarts(self):
+        self.server.options["range"] = False
+        size = self.server.options["file_size"]
+        self.write_part(self.server_bytes(0, size // 2), size=size)
+        self.assertTrue(self.download())
+        self.assertDownloaded()
+        self.assertEqual(self.server.snapshot()["range_requests"], 0)
+
+    def test_changed_file_fails_if_range(self):
+        old_size = self.server.options["file_size"]
+        old_etag = KMAAPI_mock_server.file_etag(FILE_NAME, old_size)
+        self.write_part(KMAAPI_mock_server.file_bytes(FILE_NAME, 0, old_size // 2, old_size),
+                        size=old_size, validator=old_etag)
+        self.server.options["file_size"] = old_size + 1000
+        self.assertTrue(self.download())
+        self.assertDownloaded()
+        self.assertEqual(self.server.snapshot()["range_requests"], 0)
+
+    def test_changed_size_without_validators_restarts(self):
+        self.server.options["validators"] = False
+        old_size = self.server.options["file_size"]
+        self.write_part(KMAAPI_mock_server.file_bytes(FILE_NAME, 0, old_size // 2, old_size), size=old_size)
+        self.server.options["file_size"] = old_size + 1000
+        # Content-Range 전체 크기가 처음과 다름 → .part 버리고 전체 받기
+        self.assertTrue(self.download())
+        self.assertDownloaded()
+        self.assertEqual(self.server.snapshot()["requests"], 2)
+
+    def test_disposition_name_is_ignored(self):
+        # 헤더 파일명(경로 문자 포함)과 관계없이 요청 파일명으로 저장, 저장 폴더 밖에 쓰지 않음
+        self.server.options["disposition"] = "../other_name.gb2"
+        self.assertTrue(self.download())
+        self.assertDownloaded()
+        self.assertEqual(os.listdir(self.save_dir), [FILE_NAME])
+        self.assertFalse(os.path.exists(os.path.join(os.path.dirname(self.save_dir), "other_name.gb2")))
+        self.assertTrue(self.download())
+        self.assertEqual(self.server.snapshot()["requests"], 1)
+
+    def test_finished_file_is_skipped(self):
+        self.assertTrue(self.download())
+        self.assertTrue(self.download())
+        self.assertDownloaded()
+        self.assertEqual(self.server.snapshot()["requests"], 1)
+
+class TokenBucketTest(unittest.TestCase):
+    def test_rate(self):
+        # 처음 burst개는 바로, 이후는 초당 rate개
+        bucket = KMAAPI_Downloader.TokenBucket(rate=50, burst=2)
+        start = time.perf_counter()
+        for _ in range(2):
+            bucket.acquire()
+        self.assertLess(time.perf_counter() - start, 0.01)
+        for _ in range(10):
+            bucket.acquire()
+        elapsed = time.perf_counter() - start
+        self.assertGreaterEqual(elapsed, 10 / 50 * 0.95)
+        self.assertLess(elapsed, 10 / 50 + 0.15)
+
+    def test_shared_between_threads(self):
+        bucket = KMAAPI_Downloader.TokenBucket(rate=100, burst=1)
+        start = time.perf_counter()
+        threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(5)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.perf_counter() - start, 19 / 100 * 0.95)
+
+class ConcurrentDownloadTest(unittest.TestCase):
+    """
+    동시 다운로드(workers 2 이상): 파일 내용, 목록 순서대로의 결과 기록, 순차 대비 소요 시간 확인
+    """
+    LATENCY = 0.2
+    HOURS = 8
+
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp()
+        self.server, url_format = KMAAPI_mock_server.start_mock_server(file_size_mb=FILE_SIZE_MB, latency=self.LATENCY,
+                                                                       missing_hours=[3])
+        self.jobs = KMAAPI_Downloader.build_jobs(["2024061012"], hf_start=0, hf_end=self.HOURS - 1,
+                                                 base_url_format=url_format, save_dir=self.save_dir)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.save_dir, ignore_errors=True)
+
+    def test_concurrent_download(self):
+        results = []
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ok, fail = KMAAPI_Downloader.download_all(self.jobs, workers=4, rate=100, burst=4, results=results)
+        elapsed = time.perf_counter() - start
+        self.assertEqual((ok, fail), (self.HOURS - 1, 1))
+        # 응답 지연이 겹치므로 순차 처리(파일 수 x 지연)보다 빠름
+        self.assertLess(elapsed, self.HOURS * self.LATENCY * 0.6)
+        self.assertEqual([r["hf"] for r in results], list(range(self.HOURS)))
+        self.assertEqual([r["status"] for r in results], ["ok"] * 3 + ["fail"] + ["ok"] * (self.HOURS - 4))
+        size = self.server.options["file_size"]
+        for job in self.jobs:
+            path = os.path.join(self.save_dir, job["filename"])
+            if job["hf"] == 3:
+                self.assertFalse(os.path.exists(path))
+                continue
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), KMAAPI_mock_server.file_bytes(job["filename"], 0, size, size))
+
+class ScheduleTest(unittest.TestCase):
+    """
+    다운로드 목록 우선순위(build_jobs)와 외부 명령 처리 함수(command_hook)
+    """
+
+    def test_build_jobs_priority(self):
+        # 최신 기준 시각 먼저, 같은 기준 시각 안에서는 이른 예측 시간 먼저, 같은 예측 시간은 자료 목록 순서
+        dates = KMAAPI_Downloader.expand_dates(start="2024061000", end="2024061012", step_hours=12)
+        jobs = KMAAPI_Downloader.build_jobs(dates, prefixes=["pres", "unis"], hf_start=0, hf_end=2,
+                                            base_url_format="{filename}", save_dir="/nas/{month}/{prefix}")
+        self.assertEqual([(j["date"], j["hf"], j["prefix"]) for j in jobs],
+                         [(d, hf, p) for d in ("2024061012", "2024061000") for hf in range(3) for p in ("pres", "unis")])
+        self.assertEqual(jobs[0]["filename"], "pres_h000.2024061012.gb2")
+        self.assertEqual(jobs[0]["label"], "2024061012 pres_h000")
+        self.assertEqual(jobs[1]["save_dir"], "/nas/202406/unis")
+
+    def test_command_hook_without_shell(self):
+        # 경로의 공백/셸 특수문자는 인자 하나로 전달되고 셸 명령으로 실행되지 않음
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir, True)
+        script = os.path.join(work_dir, "dump args.py")
+        with open(script, "w", encoding="utf-8") as f:
+            f.write("import sys, json\njson.dump(sys.argv[1:], open(sys.argv[1] + '.json', 'w'))\n")
+        path = os.path.join(work_dir, "a b; touch pwned $(touch pwned2).gb2")
+        template = f'"{sys.executable}" "{script}" {{path}} {{date}} --hf={{hf}}'
+        hook = KMAAPI_Downloader.command_hook(template)
+        hook({"date": "2024061012", "prefix": "pres", "hf": 3}, path)
+        with open(f"{path}.json", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), [path, "2024061012", "--hf=3"])
+        self.assertEqual(sorted(os.listdir(work_dir)), sorted(["dump args.py", os.path.basename(path) + ".json"]))
+
+class PipelineTest(unittest.TestCase):
+    """
+    예측 시간별 처리 파이프라인(HourPipeline): 대기열이 가득 차면 put이 기다림, 처리 함수 실행 순서, 오류 기록
+    """
+
+    def jobs(self, hours):
+        return KMAAPI_Downloader.build_jobs(["2024061012"], hf_start=0, hf_end=hours - 1, base_url_format="{filename}")
+
+    def test_put_blocks_when_full(self):
+        # 처리 스레드가 첫 파일에서 멈춰 있으면 대기열(1개)이 찬 뒤의 put은 처리가 진행될 때까지 기다림
+        release = threading.Event()
+        started = threading.Event()
+        def hold(job, path):
+            started.set()
+            release.wait(5)
+        pipeline = KMAAPI_Downloader.HourPipeline([("hold", hold)], depth=1)
+        jobs = self.jobs(3)
+        pipeline.put(jobs[0], "h000")
+        self.assertTrue(started.wait(5))
+        pipeline.put(jobs[1], "h001")
+        producer = threading.Thread(target=pipeline.put, args=(jobs[2], "h002"))
+        producer.start()
+        producer.join(0.3)
+        self.assertTrue(producer.is_alive())
+        release.set()
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+        records = pipeline.close()
+        self.assertEqual([r["hf"] for r in records], [0, 1, 2])
+        self.assertEqual([r["status"] for r in records], ["ok"] * 3)
+        self.assertGreaterEqual(records[0]["process_s"], 0.3 * 0.95)
+
+    def test_hooks_in_order_and_errors(self):
+        # 처리 함수는 등록 순서대로 실행, 오류가 나면 그 예측 시간의 나머지 처리 함수는 건너뛰고 실패로 기록
+        calls = []
+        def first(job, path):
+            calls.append(("first", job["hf"], path))
+            if job["hf"] == 1:
+                raise ValueError("bad file")
+        def second(job, path):
+            calls.append(("second", job["hf"], path))
+        pipeline = KMAAPI_Downloader.HourPipeline([("first", first), ("second", second)], depth=2)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for job in self.jobs(3):
+                pipeline.put(job, f"h{job['hf']:03d}")
+            records = pipeline.close()
+        self.assertEqual(calls, [("first", 0, "h000"), ("second", 0, "h000"), ("first", 1, "h001"),
+                                 ("first", 2, "h002"), ("second", 2, "h002")])
+        self.assertEqual([r["status"] for r in records], ["ok", "error(first): bad file", "ok"])
+        self.assertEqual({(r["date"], r["prefix"]) for r in records}, {("2024061012", KMAAPI_Downloader.FILE_PREFIX)})
+
+    def test_main_runs_hooks_on_downloaded_files(self):
+        # main: 받은 파일마다 처리 함수 실행 (이미 저장된 파일 경로), 처리 실패가 있으면 종료 코드 1
+        save_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, save_dir, True)
+        server, url_format = KMAAPI_mock_server.start_mock_server(file_size_mb=FILE_SIZE_MB)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        seen = []
+        def check(job, path):
+            seen.append((job["hf"], os.path.getsize(path)))
+        argv = ["--dates", "2024061012", "--hf-start", "0", "--hf-end", "3", "--workers", "2",
+                "--base-url", url_format, "--save-dir", save_dir, "--queue-depth", "1"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(KMAAPI_Downloader.main(argv, hooks=[("check", check)]), 0)
+            self.assertEqual(KMAAPI_Downloader.main(argv, hooks=[("fail", lambda job, path: 1 / 0)]), 1)
+        self.assertEqual(sorted(seen), [(hf, server.options["file_size"]) for hf in range(4)])
+
+def write_grib(path, hf, short_names=("t", "u", "v", "r", "gh", "q"), levels=(1000, 850, 500, 300)):
+    """
+    합성 GRIB2 파일 (위도 42~30, 경도 120~140 정규 격자, 변수/등압면별 메시지), 값 = 격자 번호 + 등압면 + 예측 시간
+    """
+    with open(path, "wb") as f:
+        for short_name in short_names:
+            for level in levels:
+                h = eccodes.codes_grib_new_from_samples("regular_ll_pl_grib2")
+                eccodes.codes_set_key_vals(h, {
+                    "Ni": 21, "Nj": 13, "latitudeOfFirstGridPointInDegrees": 42.0,
+                    "latitudeOfLastGridPointInDegrees": 30.0, "longitudeOfFirstGridPointInDegrees": 120.0,
+                    "longitudeOfLastGridPointInDegrees": 140.0, "iDirectionIncrementInDegrees": 1.0,
+                    "jDirectionIncrementInDegrees": 1.0})
+                eccodes.codes_set(h, "shortName", short_name)
+                eccodes.codes_set(h, "typeOfLevel", "isobaricInhPa")
+                eccodes.codes_set(h, "level", level)
+                eccodes.codes_set(h, "dataDate", 20240610)
+                eccodes.codes_set(h, "dataTime", 1200)
+                eccodes.codes_set(h, "forecastTime", hf)
+                eccodes.codes_set_values(h, np.arange(21 * 13, dtype=float) + level + hf)
+                eccodes.codes_write(h, f)
+                eccodes.codes_release(h)
+
+@unittest.skipUnless(eccodes, "xarray, cfgrib, eccodes 필요")
+class SubsetTest(unittest.TestCase):
+    """
+    GRIB2 부분 저장: 위경도 범위 자르기, 변수/등압면 선택, 예측 시간 합치기
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_crop_latlon_1d(self):
+        ds = xr.Dataset({"t": (("latitude", "longitude"), np.zeros((13, 21)))},
+                        coords={"latitude": np.arange(42.0, 29.5, -1.0), "longitude": np.arange(120.0, 140.5)})
+        out = KMAAPI_Downloader.crop_latlon(ds, (32.5, 40.0, 123.0, 131.5))
+        self.assertEqual(out["latitude"].values.tolist(), [40.0, 39.0, 38.0, 37.0, 36.0, 35.0, 34.0, 33.0])
+        self.assertEqual(out["longitude"].values.tolist(), list(np.arange(123.0, 132.0)))
+        with self.assertRaises(ValueError):
+            KMAAPI_Downloader.crop_latlon(ds, (0.0, 10.0, 123.0, 131.0))
+
+    def test_crop_latlon_2d(self):
+        # 곡선 격자(2차원 위경도): 범위 안 격자가 하나라도 있는 행/열을 모두 포함하는 최소 범위
+        y, x = np.meshgrid(np.arange(10), np.arange(12), indexing="ij")
+        ds = xr.Dataset({"t": (("y", "x"), np.zeros((10, 12)))},
+                        coords={"latitude": (("y", "x"), 30.0 + y + 0.1 * x), "longitude": (("y", "x"), 120.0 + x)})
+        out = KMAAPI_Downloader.crop_latlon(ds, (33.0, 35.0, 122.0, 125.0))
+        inside = ((ds["latitude"] >= 33) & (ds["latitude"] <= 35)
+                  & (ds["longitude"] >= 122) & (ds["longitude"] <= 125))
+        rows, cols = np.nonzero(inside.values)
+        self.assertEqual(dict(out.sizes), {"y": rows.max() - rows.min() + 1, "x": cols.max() - cols.min() + 1})
+        self.assertEqual(out["longitude"].values[0, 0], 122.0)
+
+    def test_subset_and_combine(self):
+        subsetter = KMAAPI_Downloader.GribSubsetter(out_dir=os.path.join(self.root, "subset"),
+                                                    bbox=(33.0, 38.0, 124.0, 130.0), workers=1, delete_raw=True)
+        raw = []
+        for hf in (0, 1, 2):
+            raw.append(os.path.join(self.root, f"pres_h{hf:03d}.2024061012.gb2"))
+            write_grib(raw[-1], hf)
+            subsetter.submit({"date": "2024061012", "prefix": "pres", "hf": hf}, raw[-1])
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = subsetter.finish()
+        self.assertEqual(len(summary), 1)
+        self.assertEqual((summary[0]["hours"], summary[0]["failed_hours"]), (3, []))
+        self.assertEqual(summary[0]["path"], os.path.join(self.root, "subset", "pres.2024061012.subset.nc"))
+        self.assertFalse(any(os.path.exists(path) for path in raw))
+        self.assertEqual(os.listdir(os.path.join(self.root, "subset")), ["pres.2024061012.subset.nc"])
+        with xr.open_dataset(summary[0]["path"]) as ds:
+            self.assertEqual(sorted(ds.data_vars), sorted(KMAAPI_Downloader.SUBSET_VARS))
+            self.assertEqual(ds["isobaricInhPa"].values.tolist(), [1000, 850, 500]) # 목록에 없는 300 hPa 제외
+            self.assertEqual(ds["latitude"].values.tolist(), [38.0, 37.0, 36.0, 35.0, 34.0, 33.0])
+            self.assertEqual(ds["longitude"].values.tolist(), list(np.arange(124.0, 131.0)))
+            self.assertEqual(ds.sizes["step"], 3)
+            # 값 = 격자 번호 + 등압면 + 예측 시간 (위도 42에서 4행, 경도 120에서 4열 이동)
+            t = ds["t"].sel(isobaricInhPa=850).values
+            for k, hf in enumerate((0, 1, 2)):
+                self.assertEqual(t[k, 0, 0], 4 * 21 + 4 + 850 + hf)
+
+if __name__ == "__main__":
+    unittest.main()
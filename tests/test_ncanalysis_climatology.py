@@ -0,0 +1,96 @@
+# ***************************************
+# ERA5/ncanalysis_climatology 월별 평균 시험
+# 작은 합성 일자료 파일로 만든 {output}_{MM}_mean.nc 가 기존 ncanalysis_tp.py 방식(월별 파일 묶음 평균)과 같은지 확인
+# ex) python -m unittest discover -s tests
+# ***************************************
+
+import os
+import io
+import sys
+import glob
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ERA5"))
+import ncanalysis_climatology
+
+YEARS = (1990, 1991, 2021) # 1991-2020 밖의 연도 포함 (기존 스크립트는 연도를 거르지 않음)
+LAT = [38.0, 37.75, 37.5]
+LON = [126.0, 126.25, 126.5, 126.75]
+
+def make_archive(data_dir):
+    """
+    tp_YYYYMM.nc 일자료 파일 (time x latitude x longitude)
+    """
+    rng = np.random.default_rng(11)
+    for year in YEARS:
+        for month in range(1, 13):
+            times = pd.date_range(f"{year}-{month:02d}-01", periods=pd.Period(f"{year}-{month:02d}").days_in_month)
+            ds = xr.Dataset({"tp": (("time", "latitude", "longitude"),
+                                    rng.gamma(0.5, 0.004, (len(times), len(LAT), len(LON))).astype(np.float32),
+                                    {"units": "m"})},
+                            coords={"time": times, "latitude": LAT, "longitude": LON})
+            ds.to_netcdf(os.path.join(data_dir, f"tp_{year}{month:02d}.nc"))
+
+def legacy_monthly_mean(data_dir, month):
+    """
+    기존 ncanalysis_tp.py 처리 그대로: 'tp_*{MM}.nc' 파일 묶음을 열어 시간 평균
+    """
+    ds = xr.open_mfdataset(os.path.join(data_dir, f"tp_*{month:02d}.nc"), combine="by_coords", chunks={"time": 1})
+    mean = ds.mean(dim="time").compute()
+    ds.close()
+    return mean
+
+class ClimatologyTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="ncanalysis_climatology_test_")
+        self.data_dir = os.path.join(self.root, "daily")
+        self.out_dir = os.path.join(self.root, "mean")
+        os.makedirs(self.data_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def run_main(self, *args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return ncanalysis_climatology.main(["tp", "--data-dir", self.data_dir, "--output-dir", self.out_dir, *args])
+
+    def test_matches_legacy_monthly_means(self):
+        make_archive(self.data_dir)
+        self.assertEqual(self.run_main(), 0)
+        self.assertEqual(len(glob.glob(os.path.join(self.out_dir, "tp_*_mean.nc"))), 12)
+        for month in range(1, 13):
+            expected = legacy_monthly_mean(self.data_dir, month)
+            with xr.open_dataset(os.path.join(self.out_dir, f"tp_{month:02d}_mean.nc")) as out:
+                self.assertEqual(set(out.data_vars), set(expected.data_vars))
+                self.assertEqual(out["tp"].dims, expected["tp"].dims)
+                np.testing.assert_allclose(out["tp"].values, expected["tp"].values, rtol=1e-6)
+                np.testing.assert_array_equal(out["longitude"].values, expected["longitude"].values)
+
+    def test_year_range_flag(self):
+        make_archive(self.data_dir)
+        self.assertEqual(self.run_main("--start-year", "1991", "--end-year", "2020"), 0)
+        files = ncanalysis_climatology.list_archive_files("tp_*.nc", self.data_dir, 1991, 2020)
+        self.assertEqual({os.path.basename(f)[3:7] for f in files}, {"1991"})
+        with xr.open_dataset(os.path.join(self.out_dir, "tp_01_mean.nc")) as out, \
+                xr.open_dataset(os.path.join(self.data_dir, "tp_199101.nc")) as src:
+            np.testing.assert_allclose(out["tp"].values, src["tp"].mean("time").values, rtol=1e-6)
+
+    def test_mismatched_grid_rejected(self):
+        # 파일마다 격자 좌표가 다르면 첫 파일 좌표로 덮어쓰지 않고 오류
+        make_archive(self.data_dir)
+        shifted = xr.open_dataset(os.path.join(self.data_dir, "tp_199102.nc")).load()
+        shifted = shifted.assign_coords(longitude=shifted["longitude"] + 0.1)
+        shifted.to_netcdf(os.path.join(self.data_dir, "tp_199102.nc"))
+        with self.assertRaises(ValueError):
+            ncanalysis_climatology.open_archive(ncanalysis_climatology.list_archive_files("tp_*.nc", self.data_dir))
+        self.assertEqual(self.run_main(), 1)
+
+if __name__ == "__main__":
+    unittest.main()
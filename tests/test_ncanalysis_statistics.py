@@ -0,0 +1,145 @@
+# ***************************************
+# ERA5/ncanalysis_statistics 월별 누적 통계 시험
+# 무작위 자료를 여러 블록으로 나누어 누적한 평균/분산/최솟값/최댓값이 numpy 전체 계산과 같은지,
+# P² 근사 백분위수가 np.quantile 허용 오차 안인지, Chan 방식 결합이 한 번에 누적한 결과와 같은지 확인
+# ex) python -m unittest discover -s tests
+# ***************************************
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ERA5"))
+import ncanalysis_statistics
+
+PERCENTILES = [5, 50, 95]
+# P² 근사 백분위수 허용 오차 (격자 표준편차 대비): 관측 1000개 정규/균등 분포에서 격자별 최대, 격자 중앙값
+P2_MAX_ERROR = 0.3
+P2_MEDIAN_ERROR = 0.03
+MOMENT_RTOL = 1e-10
+
+def random_data(seed, n_time=1000, shape=(6, 10), nan_share=0.05):
+    """
+    정규/균등 분포 격자가 섞인 (시간, 격자...) 자료, 일부 결측(NaN)
+    """
+    rng = np.random.default_rng(seed)
+    cells = int(np.prod(shape))
+    data = np.concatenate([rng.normal(280.0, 5.0, (n_time, cells // 2)),
+                           rng.uniform(0.0, 30.0, (n_time, cells - cells // 2))], axis=1)
+    data[rng.random(data.shape) < nan_share] = np.nan
+    return data.reshape((n_time,) + shape)
+
+def random_blocks(data, seed, n_blocks=7):
+    """
+    시간 축을 무작위 크기 블록으로 나눔 (파일 단위 블록 흉내)
+    """
+    cuts = np.sort(np.random.default_rng(seed).choice(np.arange(1, len(data)), n_blocks - 1, replace=False))
+    return np.split(data, cuts)
+
+def assert_moments(stats, data):
+    """
+    누적 통계가 전체 자료 numpy 계산과 같은지 확인 (결측 제외, 분산은 ddof=1)
+    """
+    np.testing.assert_array_equal(stats["count"], (~np.isnan(data)).sum(axis=0))
+    np.testing.assert_allclose(stats["mean"], np.nanmean(data, axis=0), rtol=MOMENT_RTOL)
+    np.testing.assert_allclose(stats["sum"], np.nansum(data, axis=0), rtol=MOMENT_RTOL)
+    np.testing.assert_allclose(stats["var"], np.nanvar(data, axis=0, ddof=1), rtol=1e-8)
+    np.testing.assert_allclose(stats["std"], np.nanstd(data, axis=0, ddof=1), rtol=1e-8)
+    np.testing.assert_array_equal(stats["min"], np.nanmin(data, axis=0))
+    np.testing.assert_array_equal(stats["max"], np.nanmax(data, axis=0))
+
+class AccumulatorTest(unittest.TestCase):
+    """
+    MonthlyAccumulator/P2Quantiles 결과를 전체 자료 numpy 계산과 비교
+    """
+
+    def test_blocks_match_numpy(self):
+        data = random_data(1)
+        acc = ncanalysis_statistics.MonthlyAccumulator(data.shape[1:], PERCENTILES)
+        for block in random_blocks(data, 2):
+            acc.update(block)
+        stats = acc.result()
+        assert_moments(stats, data)
+
+        expected = np.nanquantile(data, np.array(PERCENTILES) / 100, axis=0)
+        error = np.abs(stats["percentile"] - expected) / np.nanstd(data, axis=0)
+        self.assertLess(error.max(), P2_MAX_ERROR)
+        self.assertLess(np.median(error), P2_MEDIAN_ERROR)
+
+    def test_few_observations_exact(self):
+        # 관측 4개 이하 격자는 정확한 백분위수, 관측이 없는 격자는 NaN
+        data = np.array([[1.0, np.nan], [4.0, np.nan], [2.0, np.nan], [3.0, np.nan]])
+        acc = ncanalysis_statistics.MonthlyAccumulator((2,), PERCENTILES)
+        acc.update(data)
+        stats = acc.result()
+        np.testing.assert_allclose(stats["percentile"][:, 0], np.percentile(data[:, 0], PERCENTILES))
+        self.assertTrue(np.isnan(stats["percentile"][:, 1]).all())
+        self.assertEqual(stats["count"][1], 0)
+        self.assertTrue(np.isnan(stats["mean"][1]))
+
+    def test_merge_matches_single_accumulator(self):
+        # 자료를 둘로 나누어 따로 누적한 뒤 결합 = 전체를 한 누적값에 누적
+        data = random_data(3)
+        whole = ncanalysis_statistics.MonthlyAccumulator(data.shape[1:], [])
+        parts = [ncanalysis_statistics.MonthlyAccumulator(data.shape[1:], []) for _ in range(2)]
+        for k, block in enumerate(random_blocks(data, 4)):
+            whole.update(block, years=[2000 + k])
+            parts[k % 2].update(block, years=[2000 + k])
+        parts[0].merge(parts[1])
+        merged, expected = parts[0].result(), whole.result()
+        for stat in ncanalysis_statistics.STATS:
+            np.testing.assert_allclose(merged[stat], expected[stat], rtol=MOMENT_RTOL, err_msg=stat)
+        self.assertEqual(parts[0].years, whole.years)
+        assert_moments(merged, data)
+
+    def test_merge_rejects_percentiles(self):
+        acc = ncanalysis_statistics.MonthlyAccumulator((3,), PERCENTILES)
+        with self.assertRaises(ValueError):
+            acc.merge(ncanalysis_statistics.MonthlyAccumulator((3,), PERCENTILES))
+
+class AccumulateFileTest(unittest.TestCase):
+    """
+    accumulate_file 월별 누적 결과를 파일 전체 자료의 월별 numpy 계산과 비교
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="ncanalysis_statistics_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_monthly_files(self):
+        times = pd.date_range("2001-01-01", "2001-03-31", freq="6h")
+        data = random_data(5, n_time=len(times), shape=(3, 4)).astype(np.float32)
+        paths = []
+        for month in (1, 2, 3):
+            rows = times.month == month
+            ds = xr.Dataset({"t2m": (("valid_time", "latitude", "longitude"), data[rows], {"units": "K"})},
+                            coords={"valid_time": times[rows], "latitude": [38.0, 37.75, 37.5],
+                                    "longitude": [126.0, 126.25, 126.5, 126.75]})
+            paths.append(os.path.join(self.root, f"t2m_2001{month:02d}.nc"))
+            ds.to_netcdf(paths[-1])
+
+        accumulators, templates = {}, {}
+        steps = sum(ncanalysis_statistics.accumulate_file(path, accumulators, templates, PERCENTILES)
+                    for path in paths)
+        self.assertEqual(steps, len(times))
+        self.assertEqual(sorted(accumulators), [("t2m", 1), ("t2m", 2), ("t2m", 3)])
+        for month in (1, 2, 3):
+            month_data = data[times.month == month].astype(float)
+            stats = accumulators[("t2m", month)].result()
+            assert_moments(stats, month_data)
+
+        ds = ncanalysis_statistics.build_statistics_dataset(accumulators, templates, PERCENTILES)
+        self.assertEqual(ds["t2m_mean"].dims, ("month", "latitude", "longitude"))
+        self.assertEqual(ds["t2m_percentile"].dims, ("month", "percentile", "latitude", "longitude"))
+        np.testing.assert_array_equal(ds["t2m_year_count"], [1, 1, 1])
+
+if __name__ == "__main__":
+    unittest.main()